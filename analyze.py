@@ -1,79 +1,58 @@
 import os
 import sys
 import time
-import json
-from pyoxdna.analysis import analyze_bonds
-from utils import JobLauncher, SIM_HOME, EMAIL_ADDRESS, OXDNA_HOME
+from pyoxdna.analysis import analyze_bonds, open_trajectory, BondEventStore, load_topology
+from pyoxdna.analysis.compressed import open_output
+from utils import JobLauncher, SIM_HOME, EMAIL_ADDRESS, OXDNA_HOME, ANALYSIS_CACHE_DIR
 from pyoxdna.utils import current_time
 
 """ this analyzes a simulation after it has completed """
 
-def trim_strands(input_file, trajectory_file, top_file, output_top='output.top', output_traj='output_trajectory.dat'):
+def trim_strands(input_file, trajectory_file, top_file, output_top='output.top', output_traj='output_trajectory.dat', processes=None, tile_threshold=None, window=None):
     """ given an input file, trajectory file, and top file, this function creates two new files,
         output_top and output_traj that contain only strands that bind during the simulation.
         This makes it easier to see tile interaction in large simulations
+
+        processes -- worker processes for the bond analysis (None uses all the cores)
+
+        tile_threshold -- if set, print the number of tile bindings (strand pairs reaching
+            tile_threshold base pairs) of the simulation
+
+        window -- only analyze and copy some of the frames, e.g. {'stride': 100} or
+            {'t_start': 1e6, 't_stop': 2e6} (see analyze_bonds)
+
+        the trajectory can be gzip/xz compressed, output_traj is compressed in blocks if
+        its name ends with .gz or .xz (see pyoxdna/analysis/compressed.py)
     """    
-    bond_data = analyze_bonds(input_file, trajectory_file, top_file, oxDNA_dir=OXDNA_HOME)
-    bond_events = bond_data['bond_events'] # list of (time, base1, strand1, action, base2, strand2)
+    bond_data = analyze_bonds(input_file, trajectory_file, top_file, oxDNA_dir=OXDNA_HOME, processes=processes, cache_dir=ANALYSIS_CACHE_DIR, tile_threshold=tile_threshold, window=window)
+
+    if tile_threshold is not None:
+        summary = bond_data['tile_summary']
+        print(f"{summary['bindings']} tile bindings and {summary['breaks']} unbindings, {summary['bound_at_end']} strand pairs bound at the end")
 
-    with open('bond_data.json','w') as f:
-        json.dump(bond_events, f)
+    # columns (time, base1, strand1, action, base2, strand2), reload with BondEventStore.load
+    bond_events = BondEventStore.from_bond_data(bond_data)
+    bond_events.save('bond_data.npz')
 
     if len(bond_events) == 0:
         print('no bonds found in simulation')
         sys.exit()
 
-    strand_nums_to_keep = []
-    [strand_nums_to_keep.extend([x[2], x[-1]]) for x in bond_events]
-    strand_nums_to_keep = set(strand_nums_to_keep)
+    strand_nums_to_keep = set(bond_events.get_strands().tolist())
     print(strand_nums_to_keep)
 
 
-    # transfer important strands to new top file
-    strands = [] # list of strand lists of (index, base) tuples
-
-    with open(top_file, 'r') as f:
-        last_strand = 0
-        for i, line in enumerate(f):
-            if i == 0: # skip header
-                continue
-
-            parts = line.split()
-            strand_num = int(parts[0])
-            if strand_num in strand_nums_to_keep:
-                if strand_num != last_strand:
-                    strands.append([])
-                    last_strand = strand_num
-                
-                strands[-1].append([i-1, parts[1]]) # tuple of index, base
-
-    with open(output_top, 'w') as f:
-        f.write(f'{len(strands)*len(strands[0])} {len(strands)}\n')
-        index = 0
-        for i, strand in enumerate(strands):
-            for j, (_, base) in enumerate(strand):
-                first = index-1 if j != 0 else -1 # attach to previous unless first in strand
-                second = index+1 if j != len(strand)-1 else -1 # attach to next unless last in strand
-                    
-                f.write(f'{i+1} {base} {first} {second}\n')
-
-                index += 1
-
-
-    # transfer important strands to new traj file
-    indices_to_keep = [x[0] for strand in strands for x in strand]
-    traj_header = ''
-    with open(trajectory_file, 'r') as f:
-        with open(output_traj, 'w') as out:
-            index = 0
-            for line in f:
-                if 't = ' in line or 'b = ' in line or 'E = ' in line or line == '\n':
-                    out.write(line)
-                    index = 0
-                else:
-                    if index in indices_to_keep:
-                        out.write(line)
-                    index += 1
+    # transfer important strands to new top file (renumbered, see Topology.select)
+    topology = load_topology(top_file)
+    indices_to_keep = topology.get_strand_rows(sorted(strand_nums_to_keep))
+    topology.select(indices_to_keep).write(output_top)
+
+    # transfer important strands to new traj file (as text, so it can be opened in oxdna-viewer, or compressed)
+    # text frames are slices of the memory mapped trajectory, only the kept lines are copied
+    with open_trajectory(trajectory_file) as trajectory:
+        with open_output(output_traj) as out:
+            for frame in trajectory.iter_frames(**(window or {})):
+                frame.select(indices_to_keep).write(out)
 
 def launch_self(args, sim_name=None):
     """ args is a list of arguments:
@@ -114,5 +93,7 @@ def launch_self(args, sim_name=None):
 if __name__ == '__main__':
     if len(sys.argv) == 4:
         trim_strands(input_file=sys.argv[1], trajectory_file=sys.argv[2], top_file=sys.argv[3])
+    elif len(sys.argv) == 5 and sys.argv[4].isdigit(): # python analyze input trajectory top tile_threshold
+        trim_strands(input_file=sys.argv[1], trajectory_file=sys.argv[2], top_file=sys.argv[3], tile_threshold=int(sys.argv[4]))
     else:
         launch_self(sys.argv[1:])
@@ -0,0 +1,270 @@
+"""
+    benchmarks of the analysis package (pyoxdna/analysis) on the example system
+    usage: python benchmark.py <benchmark> [conf_file] [top_file]
+
+    benchmarks:
+        nucleotides -- reading hydrogen bonds into a System with the cached nucleotide list
+            (System.get_nucleotide_list) against the list rebuilt on every access
+        arrays -- memory and geometry (translate, rotate, bring in box) of a System against
+            an ArraySystem (arrays.py)
+        objects -- memory and number of allocations (tracemalloc) of the System of a frame
+            read by LorenzoReader
+        overlaps -- random insertion of copies of the staple strands into an empty box with
+            overlap checks (overlaps.py), and System.contains_overlaps
+        compression -- size, writing and reading (whole trajectory and random frames) of a
+            trajectory as text and block compressed with gzip and xz (compressed.py). A
+            configuration with a single frame is made into a trajectory of 40 jittered frames
+"""
+
+import os
+import sys
+import tempfile
+import tracemalloc
+import numpy as np
+from time import perf_counter
+from pyoxdna.analysis import LorenzoReader, HBondDetector, find_pairs, open_trajectory, Frame
+from pyoxdna.analysis.base import System, H_CUTOFF
+from pyoxdna.analysis.topology import load_topology
+from pyoxdna.analysis.overlaps import OverlapChecker
+from pyoxdna.analysis.compressed import CompressedTrajectoryWriter
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example files')
+CONF_FILE = os.path.join(EXAMPLE_DIR, 'rect.dat')
+TOP_FILE = os.path.join(EXAMPLE_DIR, 'rect.top')
+
+
+class UncachedSystem(System):
+    """ System building its nucleotide list on every access, with the H bond methods as they used to be """
+
+    def get_nucleotide_list(self):
+        ret = []
+        for s in self._strands:
+            ret += s._nucleotides
+        return ret
+
+    _nucleotides = property(get_nucleotide_list)
+
+    def add_H_interaction(self, nuclA, nuclB, interaction):
+        strandA = self._nucleotide_to_strand[nuclA]
+        strandB = self._nucleotide_to_strand[nuclB]
+        if interaction < H_CUTOFF:
+            if strandA <= strandB:
+                self._strands[strandA].add_H_interaction(strandB)
+            else:
+                self._strands[strandB].add_H_interaction(strandA)
+            self._nucleotides[nuclA].add_H_interaction(nuclB)
+            self._nucleotides[nuclB].add_H_interaction(nuclA)
+
+    def get_H_interactions_nucleotides(self):
+        retset = []
+        for i in range(len(self._nucleotides)):
+            interactions = self._nucleotides[i].get_H_interactions()
+            for j in interactions:
+                if i < j and (j-i != 1 or self._nucleotide_to_strand[i] != self._nucleotide_to_strand[j]):
+                    retset.append([i, j])
+        return retset
+
+
+def get_pair_energy_lines(conf_file, top_file, cutoff=2.):
+    """ returns lines in the format of the pair_energy output of DNAnalysis for the pairs of
+        nucleotides closer than cutoff, with the HB energy computed by HBondDetector
+    """
+    frame = LorenzoReader(conf_file, top_file, mapped=True).get_frame()
+    bonds, energies = HBondDetector(load_topology(top_file)).get_H_bond_energies(frame)
+    hb = dict(zip(map(tuple, bonds.tolist()), energies.tolist()))
+
+    i, j, _ = find_pairs(frame.cm_pos, frame.box, cutoff)
+    lines = ['# t = %d' % frame.time]
+    for pair in zip(i.tolist(), j.tolist()):
+        e = hb.get(pair, 0.)
+        lines.append('%d %d 0 0 0 0 %f 0 0 %f' % (pair[0], pair[1], e, e))
+    return lines
+
+
+def time_H_bonds(system, lines):
+    start = perf_counter()
+    system.read_H_bonds(lines)
+    bonds = system.get_H_interactions_nucleotides()
+    return perf_counter() - start, bonds
+
+
+def benchmark_nucleotides(conf_file, top_file):
+    lines = get_pair_energy_lines(conf_file, top_file)
+
+    system = LorenzoReader(conf_file, top_file).get_system()
+    cached, bonds = time_H_bonds(system, lines)
+
+    system = LorenzoReader(conf_file, top_file).get_system()
+    system.map_nucleotides_to_strands()
+    system.__class__ = UncachedSystem
+    uncached, old_bonds = time_H_bonds(system, lines)
+
+    assert bonds == old_bonds
+    print(f'{system.N} nucleotides, {system.N_strands} strands, {len(lines)-1} pairs, {len(bonds)} H bonds')
+    print(f'read_H_bonds + get_H_interactions_nucleotides: {uncached:.3f} s rebuilding the nucleotide list, {cached:.3f} s cached ({uncached/cached:.2f}x)')
+
+
+def time_geometry(system):
+    R = np.array([[0., -1., 0.], [1., 0., 0.], [0., 0., 1.]])
+    start = perf_counter()
+    system.translate(np.array([1., 2., 3.]))
+    system.rotate(R)
+    system._prepare(None)
+    return perf_counter() - start
+
+
+def benchmark_arrays(conf_file, top_file):
+    frame = LorenzoReader(conf_file, top_file, mapped=True).get_frame()
+    frame.data # parsed before measuring
+
+    results = {}
+    for name, build in (('System', frame.get_system), ('ArraySystem', frame.get_array_system)):
+        tracemalloc.start()
+        start = perf_counter()
+        system = build()
+        build_time = perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[name] = (memory, build_time, time_geometry(system))
+
+    print(f'{frame.N} nucleotides')
+    for name, (memory, build_time, geometry_time) in results.items():
+        print(f'{name:12s} {memory/2**20:8.2f} MB  built in {build_time:.3f} s  translate + rotate + bring in box {geometry_time:.4f} s')
+
+
+def benchmark_objects(conf_file, top_file):
+    reader = LorenzoReader(conf_file, top_file)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    system = reader.get_system()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    memory = sum(stat.size_diff for stat in stats)
+    blocks = sum(stat.count_diff for stat in stats)
+
+    print(f'{system.N} nucleotides, {system.N_strands} strands')
+    print(f'System read by LorenzoReader: {memory/2**20:.2f} MB in {blocks} allocations ({memory/system.N:.0f} bytes, {blocks/system.N:.1f} allocations per nucleotide)')
+
+
+def benchmark_overlaps(conf_file, top_file, tries=5000):
+    system = LorenzoReader(conf_file, top_file, mapped=True).get_frame().get_array_system()
+    rng = np.random.default_rng(0)
+
+    start = perf_counter()
+    overlapping = len(system.get_overlaps()[0])
+    contains_time = perf_counter() - start
+
+    # staples (every strand but the longest), centred
+    back, base, _ = system.get_overlap_sites()
+    offsets = system.get_strand_offsets()
+    staples = []
+    for first, last in zip(offsets[:-1], offsets[1:]):
+        cm = system.cm_pos[first:last].mean(axis=0)
+        staples.append((back[first:last] - cm, base[first:last] - cm))
+    staples.sort(key=lambda staple: len(staple[0]))
+    staples = staples[:-1]
+
+    checker = OverlapChecker(system._box)
+    added = 0
+    start = perf_counter()
+    for k in range(tries):
+        staple_back, staple_base = staples[k % len(staples)]
+        shift = rng.uniform(0, system._box)
+        added += checker.add_if_free(staple_back + shift, staple_base + shift)
+    checker_time = perf_counter() - start
+
+    legacy = system.to_system()
+    strands = sorted(legacy._strands, key=lambda s: s.N)[:-1]
+    box_system = System(system._box)
+    start = perf_counter()
+    for k in range(tries // 10):
+        s = strands[k % len(strands)].copy()
+        s.translate(rng.uniform(0, system._box) - s.cm_pos)
+        box_system.add_strand(s, check_overlap=True)
+    system_time = perf_counter() - start
+
+    print(f'{system.N} nucleotides, {overlapping} overlapping pairs of nucleotides found by contains_overlaps in {contains_time:.3f} s')
+    print(f'OverlapChecker: {tries} staples tried ({added} added, {checker.N} nucleotides) in {checker_time:.2f} s, {tries/checker_time:.0f} strands/s')
+    print(f'System.add_strand(check_overlap=True) with Strand.copy and translate: {tries//10/system_time:.0f} strands/s')
+
+
+def write_jittered_trajectory(conf_file, top_file, output, n_frames=40, sigma=0.05):
+    """ writes n_frames copies of a configuration with the positions and orientations moving a bit in every frame """
+    frame = LorenzoReader(conf_file, top_file, mapped=True).get_frame()
+    rng = np.random.default_rng(0)
+    data = frame.data.copy()
+    with open(output, 'wb') as f:
+        for k in range(n_frames):
+            data[:, 0:9] += rng.normal(0, sigma, (len(data), 9))
+            data[:, 9:15] = rng.normal(0, 0.1, (len(data), 6))
+            Frame(k * 1000, frame.box, [0., 0., 0.], data=data).write(f)
+
+
+def time_reads(path, top_file, frames):
+    """ returns the time to parse every frame of a trajectory and to parse the given frames """
+    start = perf_counter()
+    with open_trajectory(path, top_file) as trajectory:
+        for frame in trajectory:
+            frame.data
+    sequential = perf_counter() - start
+
+    start = perf_counter()
+    with open_trajectory(path, top_file) as trajectory:
+        for k in frames:
+            trajectory[k].data
+    return sequential, perf_counter() - start
+
+
+def benchmark_compression(conf_file, top_file):
+    with tempfile.TemporaryDirectory() as directory:
+        text = os.path.join(directory, 'trajectory.dat')
+        with open_trajectory(conf_file) as trajectory:
+            n_frames = len(trajectory)
+        if n_frames > 1:
+            text = conf_file
+        else:
+            write_jittered_trajectory(conf_file, top_file, text)
+        text_size = os.path.getsize(text)
+
+        with open_trajectory(text, top_file) as trajectory:
+            n_frames = len(trajectory)
+            random_frames = np.random.default_rng(0).integers(0, n_frames, 20).tolist()
+            sequential, random_access = time_reads(text, top_file, random_frames)
+        print(f'{n_frames} frames, {text_size/2**20:.1f} MB of text')
+        print(f'{"text":5s} {text_size/2**20:7.2f} MB (ratio 1.00)  read all frames {sequential:.2f} s, {len(random_frames)} random frames {random_access:.3f} s')
+
+        for codec in ('gzip', 'xz'):
+            path = os.path.join(directory, 'trajectory.dat.' + ('gz' if codec == 'gzip' else 'xz'))
+            start = perf_counter()
+            with open_trajectory(text) as trajectory:
+                with CompressedTrajectoryWriter(path, codec) as writer:
+                    for frame in trajectory:
+                        frame.write(writer)
+            write_time = perf_counter() - start
+            size = os.path.getsize(path)
+
+            sequential, random_access = time_reads(path, top_file, random_frames)
+            print(f'{codec:5s} {size/2**20:7.2f} MB (ratio {text_size/size:.2f})  written at {text_size/2**20/write_time:.1f} MB/s, '
+                  f'read all frames {sequential:.2f} s, {len(random_frames)} random frames {random_access:.3f} s')
+
+
+BENCHMARKS = {
+    'nucleotides': benchmark_nucleotides,
+    'arrays': benchmark_arrays,
+    'objects': benchmark_objects,
+    'overlaps': benchmark_overlaps,
+    'compression': benchmark_compression
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit()
+
+    conf_file = sys.argv[2] if len(sys.argv) > 2 else CONF_FILE
+    top_file = sys.argv[3] if len(sys.argv) > 3 else TOP_FILE
+    BENCHMARKS[sys.argv[1]](conf_file, top_file)
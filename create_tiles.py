@@ -1,16 +1,16 @@
 import os
 import sys
+from pyoxdna.analysis import load_topology
 
 """ creates .top and .conf files for a tile binding simulation """
 def get_top_file(top_file, num_tiles):
     """ lengths of all tile properties must be uniform """
     
-    with open(top_file, 'r') as f:
-        lines = f.readlines()[1:]
+    topology = load_topology(top_file)
 
-        # bases
-        strand_1 = [x.split()[1] for x in lines if x[0] == '1']
-        strand_2 = [x.split()[1] for x in lines if x[0] == '2']
+    # bases
+    strand_1 = topology.names[topology.strand_ids == 1].tolist()
+    strand_2 = topology.names[topology.strand_ids == 2].tolist()
 
     assert len(strand_1) == len(strand_2)
     strands = [strand_1, strand_2]
@@ -1 +1,14 @@
-from .detect_bonds import analyze_bonds
+from .detect_bonds import analyze_bonds, iter_bond_events
+from .readers import LorenzoReader, MappedTrajectory, Frame, open_trajectory
+from .trajectory import TrajectoryIndex, select_frames
+from .binary import BinaryTrajectory, BinaryTrajectoryWriter, convert_to_binary, convert_to_text
+from .hbonds import HBondDetector
+from .neighbors import CellList, find_pairs, find_pairs_between
+from .events import BondEventStore
+from .cache import ResultCache
+from .tiles import StrandPairCounts
+from .arrays import ArraySystem
+from .overlaps import OverlapChecker, find_overlaps
+from .topology import Topology, load_topology
+from .follow import TrajectoryFollower, follow_trajectory
+from .compressed import CompressedTrajectory, CompressedTrajectoryWriter, compress_trajectory, decompress_trajectory
@@ -0,0 +1,360 @@
+"""
+Array backed System
+
+ArraySystem keeps the whole configuration as contiguous arrays: the (N, 15)
+rows of the configuration (cm_pos, a1, a3, v, L are column views of it), the
+base types, strand indices and n3/n5 links of the topology. Geometry
+(translate, rotate, bring_in_box_nucleotides, pos_base...) is vectorized over
+all the nucleotides, and it is written to .conf/.top files without building
+any object.
+
+It is a System, so the legacy code using _strands/_nucleotides still works:
+the Strands and Nucleotides are views (StrandView, NucleotideView) of the rows
+of the arrays, only built the first time they are accessed.
+"""
+import os
+import numpy as np
+from .base import System, Strand, Nucleotide, Printable
+from .base import POS_BASE, POS_STACK, POS_BACK, POS_MM_BACK1, POS_MM_BACK2, GROOVE_ENV_VAR, RNA
+from .base import number_to_base
+from .topology import Topology, as_topology
+
+
+def _row(name):
+    # property reading/writing row i of one of the arrays of the system
+    def get(self):
+        return getattr(self._system, name)[self._i]
+
+    def set(self, value):
+        getattr(self._system, name)[self._i] = value
+
+    return property(get, set)
+
+
+class NucleotideView(Nucleotide):
+    """
+    Nucleotide i of an ArraySystem, its positions and orientations are rows of
+    the arrays of the system (the interactions are kept in the view)
+    """
+
+    def __init__(self, system, i):
+        Printable.__init__(self)
+        self._system = system
+        self._i = i
+        self.index = i
+        self.next = -1
+        self.interactions = []
+        self.init_interactions()
+
+    cm_pos = _row("cm_pos")
+    cm_pos_box = _row("cm_pos_box")
+    _a1 = _row("a1")
+    _a3 = _row("a3")
+    _v = _row("v")
+    _L = _row("L")
+    _base = _row("base")
+    _btype = _row("btype")
+    n3 = _row("n3")
+    strand = _row("strand")
+
+    def get_base(self):
+        b = int(self._base)
+        if b in [0, 1, 2, 3]:
+            return number_to_base[b]
+        return str(b)
+
+
+class StrandView(Strand):
+    """
+    Strand s of an ArraySystem, a view of the nucleotides offsets[s] to
+    offsets[s+1]-1 of the system. Its length is fixed
+    """
+
+    def __init__(self, system, s):
+        Printable.__init__(self)
+        self._system = system
+        self.index = s
+        self.H_interactions = {}
+        self._views = None
+
+    def get_nucleotides(self):
+        if self._views is None:
+            self._views = self._system._nucleotides[self._first:self._last + 1]
+        return self._views
+
+    _nucleotides = property(get_nucleotides)
+
+    _first = property(lambda self: int(self._system.get_strand_offsets()[self.index]))
+    _last = property(lambda self: int(self._system.get_strand_offsets()[self.index + 1]) - 1)
+
+    def get_cm_pos(self):
+        return self._system.get_strand_cm_pos()[self.index]
+
+    def set_cm_pos(self, new_pos):
+        self._system.cm_pos[self._first:self._last + 1] += new_pos - self.get_cm_pos()
+
+    cm_pos = property(get_cm_pos, set_cm_pos)
+    # the centre of mass is computed from the nucleotides, Strand methods setting it have nothing to do
+    _cm_pos = property(get_cm_pos, lambda self, value: None)
+
+    _sequence = property(lambda self: self._system.base[self._first:self._last + 1].tolist(),
+                         lambda self, value: None)
+
+    def get_visible(self):
+        return bool(self._system.visible[self.index])
+
+    def set_visible(self, value):
+        self._system.visible[self.index] = value
+
+    visible = property(get_visible, set_visible)
+
+    def get_circular(self):
+        # linear strands have an end without 3' neighbour, whatever the direction of the indices
+        return bool(np.all(self._system.n3[self._first:self._last + 1] != -1))
+
+    def set_circular(self, value):
+        first, last = self._first, self._last
+        self._system.n3[first] = last if value else -1
+        self._system.n5[last] = first if value else -1
+
+    _circular = property(get_circular, set_circular)
+
+    def translate(self, amount):
+        self._system.cm_pos[self._first:self._last + 1] += amount
+        self._system._overlaps = None
+
+    def rotate(self, R, origin=None):
+        self._system.rotate(R, origin, strands=[self.index])
+
+    def add_nucleotide(self, n):
+        raise ValueError("the strands of an ArraySystem can't be changed, use ArraySystem.to_system() first")
+
+
+class ArraySystem(System):
+    """
+    System stored as arrays
+
+    box --- box size of the system
+
+    data --- (N, 15) array of the configuration, rows cm_pos a1 a3 v L
+
+    base --- (N,) base of every nucleotide, as Nucleotide._base (0-3)
+
+    btype --- (N,) base type, as Nucleotide._btype (the base, or the number of specific pairing types)
+
+    strand --- (N,) index of the strand of every nucleotide, strands are contiguous
+
+    n3, n5 --- (N,) 3' and 5' neighbours of every nucleotide (-1 if none)
+    """
+
+    def __init__(self, box, data, base, btype, strand, n3, n5, time=0, E_pot=0, E_kin=0):
+        self._time = time
+        self._ready = False
+        self._box = np.array(box, np.float64)
+        self.E_pot = E_pot
+        self.E_kin = E_kin
+        self.E_tot = E_pot + E_kin
+        self._overlaps = None
+
+        self.data = np.array(data, np.float64).reshape(-1, 15)
+        self.base = np.asarray(base, np.int64)
+        self.btype = np.asarray(btype, np.int64)
+        self.strand = np.asarray(strand, np.int64)
+        self.n3 = np.asarray(n3, np.int64)
+        self.n5 = np.asarray(n5, np.int64)
+
+        self._N = len(self.data)
+        lengths = np.bincount(self.strand) if self._N else np.zeros(0, np.int64)
+        self._N_strands = len(lengths)
+        self._strand_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self.visible = np.ones(self._N_strands, bool)
+        self.cm_pos_box = None
+
+        self._nucleotide_to_strand = []
+        self._nucleotide_views = None
+        self._strand_views = None
+
+    cm_pos = property(lambda self: self.data[:, 0:3])
+    a1 = property(lambda self: self.data[:, 3:6])
+    a3 = property(lambda self: self.data[:, 6:9])
+    v = property(lambda self: self.data[:, 9:12])
+    L = property(lambda self: self.data[:, 12:15])
+
+    @classmethod
+    def from_frame(cls, frame, topology=None):
+        """ builds the ArraySystem of a Frame (see readers.py) and its Topology (see topology.py) """
+        topology = as_topology(topology) if topology is not None else frame.topology
+        if topology is None:
+            raise ValueError("a topology is needed to build a System from a Frame")
+
+        return cls(frame.box, frame.data, topology.base, topology.btype, topology.strand, topology.n3, topology.n5,
+                   frame.time, frame.E_pot, frame.E_kin)
+
+    @classmethod
+    def from_system(cls, system):
+        """ builds the ArraySystem of a (legacy) System """
+        nucleotides = system._nucleotides
+        data = np.array([np.concatenate((n.cm_pos, n._a1, n._a3, n._v, n._L)) for n in nucleotides]).reshape(-1, 15)
+        lengths = [len(s._nucleotides) for s in system._strands]
+        strand = np.repeat(np.arange(len(lengths)), lengths)
+
+        # neighbours along the strands, as written by Strand._get_lorenzo_output
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        index = np.arange(len(nucleotides))
+        n3 = index - 1
+        n5 = index + 1
+        for s, st in enumerate(system._strands):
+            first, last = offsets[s], offsets[s + 1] - 1
+            n3[first] = last if st._circular else -1
+            n5[last] = first if st._circular else -1
+
+        ret = cls(system._box, data, [n._base for n in nucleotides], [n._btype for n in nucleotides],
+                  strand, n3, n5, system._time, system.E_pot, system.E_kin)
+        ret.visible[:] = [s.visible for s in system._strands]
+        return ret
+
+    def to_system(self):
+        """ returns the same configuration as a (legacy) System of Strands and Nucleotides """
+        from .readers import _build_system
+        return _build_system(self.get_frame(), self.get_topology())
+
+    def copy(self):
+        ret = ArraySystem(self._box, self.data.copy(), self.base.copy(), self.btype.copy(), self.strand.copy(),
+                          self.n3.copy(), self.n5.copy(), self._time, self.E_pot, self.E_kin)
+        ret.visible[:] = self.visible
+        return ret
+
+    def add_strand(self, s, check_overlap=True):
+        raise ValueError("strands can't be added to an ArraySystem, use ArraySystem.to_system() first")
+
+    def get_nucleotide_list(self):
+        """ returns the list of NucleotideViews of the nucleotides (built on first use) """
+        if self._nucleotide_views is None:
+            self._nucleotide_views = [NucleotideView(self, i) for i in range(self._N)]
+        return self._nucleotide_views
+
+    _nucleotides = property(get_nucleotide_list)
+
+    def get_strand_list(self):
+        """ returns the list of StrandViews of the strands (built on first use) """
+        if self._strand_views is None:
+            self._strand_views = [StrandView(self, s) for s in range(self._N_strands)]
+        return self._strand_views
+
+    _strands = property(get_strand_list)
+
+    def get_strand_offsets(self):
+        return self._strand_offsets
+
+    def get_nucleotide_strands(self):
+        return self.strand
+
+    def get_sequences(self):
+        return [self.base[self._strand_offsets[s]:self._strand_offsets[s + 1]].tolist() for s in range(self._N_strands)]
+
+    _sequences = property(get_sequences)
+
+    def get_a2(self):
+        return np.cross(self.a3, self.a1)
+
+    def get_pos_base(self):
+        return self.cm_pos + self.a1 * POS_BASE
+
+    def get_pos_stack(self):
+        return self.cm_pos + self.a1 * POS_STACK
+
+    def get_pos_back(self):
+        """ positions of the backbone sites of all the nucleotides, as Nucleotide.get_pos_back """
+        if os.environ.get(GROOVE_ENV_VAR) == '1':
+            return self.cm_pos + self.a1 * POS_MM_BACK1 + self.get_a2() * POS_MM_BACK2
+        elif RNA:
+            from .base import RNA_POS_BACK_a1, RNA_POS_BACK_a2, RNA_POS_BACK_a3
+            return self.cm_pos + self.a1 * RNA_POS_BACK_a1 + self.get_a2() * RNA_POS_BACK_a2 + self.a3 * RNA_POS_BACK_a3
+        else:
+            return self.cm_pos + self.a1 * POS_BACK
+
+    def get_strand_cm_pos(self):
+        """ returns the (N_strands, 3) centres of mass of the strands """
+        lengths = np.diff(self._strand_offsets)
+        return np.add.reduceat(self.cm_pos, self._strand_offsets[:-1], axis=0) / lengths[:, None]
+
+    def translate(self, amount):
+        self.cm_pos[:] += amount
+        if self.cm_pos_box is not None:
+            self.cm_pos_box += amount
+        self._overlaps = None
+
+    def rotate(self, amount, origin=None, strands=None):
+        """ rotates the nucleotides by the matrix amount around origin, by default
+            every strand around its centre of mass (as System.rotate)
+
+            strands --- only rotate these strands (indices)
+        """
+        R = np.asarray(amount, np.float64)
+        if strands is None:
+            rows = slice(None)
+            strand = self.strand
+        else:
+            rows = np.isin(self.strand, strands)
+            strand = self.strand[rows]
+        if origin is None:
+            origin = self.get_strand_cm_pos()[strand]
+
+        self.cm_pos[rows] = (self.cm_pos[rows] - origin) @ R.T + origin
+        self.a1[rows] = self.a1[rows] @ R.T
+        self.a3[rows] = self.a3[rows] @ R.T
+        self._overlaps = None
+
+    def get_overlap_sites(self):
+        return self.get_pos_back(), self.get_pos_base(), self.strand
+
+    def bring_in_box_nucleotides(self):
+        """ sets cm_pos_box, the positions with each strand moved to have its centre of mass in the box """
+        shift = np.rint(self.get_strand_cm_pos() / self._box) * self._box
+        self.cm_pos_box = self.cm_pos - shift[self.strand]
+        return self.cm_pos_box
+
+    def _prepare(self, visibility):
+        if visibility is not None:
+            self.set_visibility(visibility)
+        self.bring_in_box_nucleotides()
+
+    def set_visibility(self, arg=None):
+        self.visible[:] = self.get_visibility(arg)
+
+    def get_neighbour_pairs(self, cutoff, positions=None):
+        return System.get_neighbour_pairs(self, cutoff, self.cm_pos if positions is None else positions)
+
+    def get_frame(self, rows=None):
+        """ returns the configuration (or the nucleotides in rows) as a Frame, see readers.py """
+        from .readers import Frame
+        data = self.data if rows is None else self.data[rows]
+        return Frame(self._time, self._box, [self.E_tot, self.E_pot, self.E_kin], data=data)
+
+    def get_topology(self, rows=None):
+        """ returns the Topology of the nucleotides (or of the nucleotides in rows, renumbered,
+            with the strands renumbered from 1), with the n3/n5 links as they were read
+        """
+        names = [number_to_base[b] if b in number_to_base else str(b) for b in self.btype.tolist()]
+        topology = Topology(self.strand + 1, names, self.n3, self.n5)
+        return topology if rows is None else topology.select(rows)
+
+    def get_top_lines(self, rows=None):
+        """ returns the lines of get_topology(rows) """
+        return self.get_topology(rows).get_lines()
+
+    def print_lorenzo_output(self, conf_name, top_name, visibility=None, binary=False, append=False):
+        """ same as System.print_lorenzo_output, without going through the nucleotides """
+        self._prepare(visibility)
+        rows = np.nonzero(self.visible[self.strand])[0]
+        frame = self.get_frame(rows)
+
+        if binary:
+            from .binary import BinaryTrajectoryWriter
+            with BinaryTrajectoryWriter(conf_name, len(rows), append=append) as writer:
+                writer.write(frame)
+        else:
+            with open(conf_name, "ab" if append else "wb") as f:
+                frame.write(f)
+
+        self.get_topology(rows).write(top_name)
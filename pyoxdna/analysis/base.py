@@ -131,11 +131,11 @@ else:
 
 # static class
 class Logger(object):
-	debug_level = None
 	DEBUG = 0
 	INFO = 1
 	WARNING = 2
 	CRITICAL = 3
+	debug_level = INFO
 
 	messages = ("DEBUG", "INFO", "WARNING", "CRITICAL")
 
@@ -156,17 +156,22 @@ class Logger(object):
 
 
 class Printable(object):
+	__slots__ = ()
+
+	# looked up when printing instead of a dict of bound methods in every object
+	_output_methods = {OUT_TOM : '_get_tom_output',
+					   OUT_LORENZO : '_get_lorenzo_output',
+					   OUT_VMD : '_get_vmd_output',
+					   OUT_CREPY : '_get_crepy_output',
+					   OUT_VMD_XYZ : '_get_vmd_xyz_output',
+					   OUT_TEP_VMD_XYZ : '_get_TEP_vmd_xyz_output'
+					   }
+
 	def __init__(self):
-		self._output_callables = {OUT_TOM : self._get_tom_output,
-								  OUT_LORENZO : self._get_lorenzo_output,
-								  OUT_VMD : self._get_vmd_output,
-								  OUT_CREPY : self._get_crepy_output,
-								  OUT_VMD_XYZ : self._get_vmd_xyz_output,
-								  OUT_TEP_VMD_XYZ : self._get_TEP_vmd_xyz_output
-								  }
+		pass
 
 	def get_output(self, type):
-		return self._output_callables[type]()
+		return getattr(self, self._output_methods[type])()
 
 	def _get_tom_output(self):
 		raise NotImplementedError
@@ -187,7 +192,21 @@ class Printable(object):
 		raise NotImplementedError
 
 
-class Nucleotide(Printable):
+class Counted(type):
+	"""
+	metaclass of Nucleotide and Strand, their class attribute index (the index of the
+	next object created) is kept apart from the index slot of the objects
+	"""
+	def _get_index(cls):
+		return cls._counter
+
+	def _set_index(cls, value):
+		cls._counter = value
+
+	index = property(_get_index, _set_index)
+
+
+class Nucleotide(Printable, metaclass=Counted):
 	"""
 	Nucleotides compose Strands
 
@@ -216,7 +235,10 @@ class Nucleotide(Printable):
 	btype--- Identity of base. Unused at the moment.
 
 	"""
-	index = 0
+	_counter = 0
+	# no __dict__ is created unless other attributes are set (e.g. printed_cylinder)
+	__slots__ = ('index', 'cm_pos', '_a1', '_a3', '_base', '_btype', '_L', '_v', 'n3', 'next', 'strand',
+				 'cm_pos_box', '_interactions', '_all_interactions', '__dict__')
 
 	def __init__(self, cm_pos, a1, a3, base, btype=None, L=np.array([0., 0., 0.]), v=np.array([0., 0., 0.]), n3=-1):
 		Printable.__init__(self)
@@ -243,8 +265,8 @@ class Nucleotide(Printable):
 		self._v = v
 		self.n3 = n3
 		self.next = -1
-		self.interactions = []	#what other nucleotide this nucleotide actually interacts with
-		self.init_interactions()
+		self._interactions = None
+		self._all_interactions = None
 
 	def get_pos_base (self):
 		"""
@@ -304,7 +326,7 @@ class Nucleotide(Printable):
 		except: pass
 
 	def rotate(self, R, origin=None):
-		if origin == None: origin = self.cm_pos
+		if origin is None: origin = self.cm_pos
 
 		self.cm_pos = np.dot(R, self.cm_pos - origin) + origin
 		self._a1 = np.dot(R, self._a1)
@@ -454,6 +476,28 @@ class Nucleotide(Printable):
 
 		return res
 
+	def get_interactions(self):
+		""" what other nucleotide this nucleotide actually interacts with (created on first use) """
+		if self._interactions is None:
+			self._interactions = []
+		return self._interactions
+
+	def set_interactions(self, interactions):
+		self._interactions = interactions
+
+	interactions = property(get_interactions, set_interactions)
+
+	def get_all_interactions(self):
+		""" interaction_type -> {nucleotide: value} (created on first use) """
+		if self._all_interactions is None:
+			self.init_interactions()
+		return self._all_interactions
+
+	def set_all_interactions(self, all_interactions):
+		self._all_interactions = all_interactions
+
+	all_interactions = property(get_all_interactions, set_all_interactions)
+
 	def add_H_interaction (self,nucleotide):
 		#if abs(self.index-nucleotide) != 1:
 			#print("adding bond between " + str(self.index) + " and " + str(nucleotide))
@@ -461,13 +505,13 @@ class Nucleotide(Printable):
 
 	def check_H_interaction(self, nucleotide):
 		#print(self.index, self.interactions)
-		if (nucleotide in self.interactions):
+		if (self._interactions is not None and nucleotide in self._interactions):
 			return True
 		else:
 			return False
 
 	def check_interaction(self,interaction_type,nucleotide):
-		if(nucleotide in self.all_interactions[interaction_type].keys()):
+		if(self._all_interactions is not None and nucleotide in self._all_interactions[interaction_type].keys()):
 			return True
 		else:
 			return False
@@ -476,8 +520,8 @@ class Nucleotide(Printable):
 		return self.interactions
 
 	def get_interaction(self,nucleotide,interaction_type):
-		if(nucleotide in self.all_interactions[interaction_type].keys()):
-			return self.all_interactions[interaction_type][nucleotide]
+		if(self.check_interaction(interaction_type, nucleotide)):
+			return self._all_interactions[interaction_type][nucleotide]
 		else:
 			return False
 
@@ -485,9 +529,9 @@ class Nucleotide(Printable):
 		self.all_interactions[interaction_type][nucleotide] = interaction_value
 
 	def init_interactions(self):
-		self.all_interactions = {}
+		self._all_interactions = {}
 		for i in range(8):
-			self.all_interactions[i] = {}
+			self._all_interactions[i] = {}
 
 	def _get_cylinder_output(self):
 		# assume up to 1 interaction (h bond) per nucleotide
@@ -498,12 +542,15 @@ class Nucleotide(Printable):
 			r2 = self.interactions[0]
 
 
-class Strand(Printable):
+class Strand(Printable, metaclass=Counted):
 	"""
 	Strand composed of Nucleotides
 	Strands can be contained in System
 	"""
-	index = 0
+	_counter = 0
+	__slots__ = ('index', '_first', '_last', '_nucleotides', '_cm_pos', '_cm_pos_tot', '_sequence', 'visible',
+				 'H_interactions', '_circular', '__dict__')
+	changes = 0 # counts the changes of the nucleotides of any strand, see System.get_nucleotide_list
 
 	def __init__(self):
 		Printable.__init__(self)
@@ -555,7 +602,7 @@ class Strand(Printable):
 		self.set_cm_pos(new_pos)
 
 	def rotate(self, R, origin=None):
-		if origin == None: origin = self.cm_pos
+		if origin is None: origin = self.cm_pos
 
 		for n in self._nucleotides: n.rotate(R, origin)
 
@@ -608,23 +655,23 @@ class Strand(Printable):
 			self._first = n.index
 		n.strand = self.index
 		self._nucleotides.append(n)
+		Strand.changes += 1
 		self._last = n.index
 		self._cm_pos_tot += n.cm_pos
 		self._cm_pos = self._cm_pos_tot / self.N
 		self.sequence.append(n._base)
 
-	def overlaps_with (self, other, box):
-		import energies as en
-
-		EXC_VOL_CUTOFF = 2.0
+	def get_overlap_sites(self):
+		""" returns the arrays of the backbone and base sites of the nucleotides """
+		back = np.array([n.pos_back for n in self._nucleotides]).reshape(-1, 3)
+		base = np.array([n.pos_base for n in self._nucleotides]).reshape(-1, 3)
+		return back, base
 
-		for n1 in self._nucleotides:
-			for n2 in other._nucleotides:
-				if en.excluded_volume (n1, n2, box, nearest=False) > EXC_VOL_CUTOFF:
-					#print(en.excluded_volume (n1, n2, box, nearest=False)
-					return True
-
-		return False
+	def overlaps_with (self, other, box):
+		from .overlaps import OverlapChecker
+		checker = OverlapChecker(box)
+		checker.add(*other.get_overlap_sites())
+		return checker.is_overlapping(*self.get_overlap_sites())
 
 	def _get_lorenzo_output(self):
 		if not self.visible:
@@ -882,16 +929,11 @@ class System(object):
 		self._N_strands = 0
 		self._strands = []
 		self._nucleotide_to_strand = []
-		self._N_cells = np.array(np.floor (self._box / 3.), np.int)
-		for kk in [0, 1, 2]:
-			if self._N_cells[kk] > 100:
-				self._N_cells[kk] = 100
-		self._cellsides = box / self._N_cells
-		self._head = [False,] * int(self._N_cells[0] * self._N_cells[1] * self._N_cells[2])
+		self._invalidate_nucleotides()
 		self.E_pot = E_pot
 		self.E_kin = E_kin
 		self.E_tot = E_pot + E_kin
-		self.cells_done = False
+		self._overlaps = None
 
 	def get_sequences (self):
 		return [x._sequence for x in self._strands]
@@ -1011,103 +1053,40 @@ class System(object):
 
 		return
 
+	def get_overlap_sites(self):
+		""" returns the backbone and base sites of all the nucleotides and the index of their strands """
+		nucleotides = self._nucleotides
+		back = np.array([n.pos_back for n in nucleotides]).reshape(-1, 3)
+		base = np.array([n.pos_base for n in nucleotides]).reshape(-1, 3)
+		return back, base, self.get_nucleotide_strands()
+
 	def do_cells (self):
-		self._N_cells = np.array(np.floor (self._box / 3.), np.int)
-		for kk in [0,1,2]:
-			if self._N_cells[kk] > 100:
-				self._N_cells[kk] = 100
-		self._cellsides = self._box / self._N_cells
-		for n in self._nucleotides:
-			n.next = -1
-		self._head = [False,] * int(self._N_cells[0] * self._N_cells[1] * self._N_cells[2])
-		for n in self._nucleotides:
-			cs = np.array((np.floor((n.cm_pos/self._box - np.rint(n.cm_pos / self._box ) + 0.5) * (1. - FLT_EPSILON) * self._box / self._cellsides)), np.int)
-			cella = cs[0] + self._N_cells[0] * cs[1] + self._N_cells[0] * self._N_cells[1] * cs[2]
-		n.next = self._head[cella]
-		self._head[cella] = n
-		self.cells_done = True
-		return
+		""" puts the sites of all the nucleotides in the cells of the overlap checker (see overlaps.py) """
+		from .overlaps import OverlapChecker
+		self._overlaps = OverlapChecker(self._box)
+		back, base, _ = self.get_overlap_sites()
+		self._overlaps.add(back, base)
 
-	def is_overlapping_better(self, s):
-		import energies as en
-		# facciamolo con le celle
-		# primo ciclo sulle particelle
-		if not self.cells_done:
-			self.do_cells()
+	def is_overlapping(self, s):
+		"""
+		Returns True if the Strand s overlaps with the nucleotides of the System
 
-		for n1 in s._nucleotides:
-			# trovo la cella
-			cs = np.array(np.floor((n1.cm_pos/self._box - np.rint(n1.cm_pos / self._box ) + 0.5) * (1.-FLT_EPSILON) * self._box / self._cellsides), np.int)
-			cella = cs[0] + self._N_cells[0] * cs[1] + self._N_cells[0] * self._N_cells[1] * cs[2]
-			px = cella % self._N_cells[0]
-			py = (cella / self._N_cells[0]) % self._N_cells[1]
-			pz = cella / self._N_cells[0] / self._N_cells[1]
-			for k1 in (-1, 0, 1):
-				for k2 in (-1, 0, 1):
-					for k3 in (-1, 0, 1):
-						nx = (px + k1 + self._N_cells[0]) % self._N_cells[0]
-						ny = (py + k2 + self._N_cells[1]) % self._N_cells[1]
-						nz = (pz + k3 + self._N_cells[2]) % self._N_cells[2]
-						cella2 = nx + ny * self._N_cells[0] + nz * self._N_cells[0]* self._N_cells[1]
-						# ora scorro le particelle della seconda cella
-						n2 = self._head[cella2]
-						while n2:
-							if en.excluded_volume (n1, n2, self._box, nearest=False) > 10.: return True
-							n2 = n2.next
-
-		return False
+		The cells are kept up to date by add_strand, rotate and translate; call do_cells()
+		after moving strands of the System by hand
+		"""
+		if self._overlaps is None:
+			self.do_cells()
+		back, base = s.get_overlap_sites()
+		return self._overlaps.is_overlapping(back, base)
 
-	def is_overlapping(self, s):
-		if not self.cells_done:
-			self.do_cells();
-		# facciamolo con le celle
-		# primo ciclo sulle particelle
-		res = False
-		for n1 in s._nucleotides:
-			# trovo la cella
-			cs = np.array(np.floor((n1.cm_pos/self._box - np.rint(n1.cm_pos / self._box ) + 0.5) * (1.-FLT_EPSILON) * self._box / self._cellsides), np.int)
-			cella = cs[0] + self._N_cells[0] * cs[1] + self._N_cells[0] * self._N_cells[1] * cs[2]
-			px = cella % self._N_cells[0]
-			py = (cella / self._N_cells[0]) % self._N_cells[1]
-			pz = cella / self._N_cells[0] / self._N_cells[1]
-			for k1 in (-1, 0, 1):
-				for k2 in (-1, 0, 1):
-					for k3 in (-1, 0, 1):
-						nx = (px + k1 + self._N_cells[0]) % self._N_cells[0]
-						ny = (py + k2 + self._N_cells[1]) % self._N_cells[1]
-						nz = (pz + k3 + self._N_cells[2]) % self._N_cells[2]
-						cella2 = nx + ny * self._N_cells[0] + nz * self._N_cells[0]* self._N_cells[1]
-						# ora scorro le particelle della seconda cella
-						n2 = self._head[cella2]
-						while n2:
-							dr = n1.pos_back - n2.pos_back
-							dr -= self._box * np.rint (dr / self._box)
-							if np.dot(dr, dr) < RC2_BACK: res = True
-
-							dr = n1.pos_base - n2.pos_base
-							dr -= self._box * np.rint (dr / self._box)
-							if np.dot(dr, dr) < RC2_BASE: res = True
-
-							dr = n1.pos_back - n2.pos_base
-							dr -= self._box * np.rint (dr / self._box)
-							if np.dot(dr, dr) < RC2_BACK_BASE: res = True
-
-							dr = n1.pos_base - n2.pos_back
-							dr -= self._box * np.rint (dr / self._box)
-							if np.dot(dr, dr) < RC2_BACK_BASE: res = True
-
-							n2 = n2.next
-		return res
+	def get_overlaps(self):
+		""" returns the arrays (i, j), i < j, of the overlapping nucleotides of different strands """
+		from .overlaps import find_overlaps
+		back, base, strands = self.get_overlap_sites()
+		return find_overlaps(back, base, self._box, strands)
 
 	def contains_overlaps (self):
-		res = False
-		N = self._N_strands
-		for i in range(0, N):
-			for j in range(0, i):
-				if self._strands[i].overlaps_with (self._strands[j], self._box):
-					return True
-
-		return False
+		return len(self.get_overlaps()[0]) > 0
 
 	def add_strand(self, s, check_overlap=True):
 		"""
@@ -1116,24 +1095,21 @@ class System(object):
 		Returns True if non-overlapping
 		Returns False if there is overlap
 		"""
-		if check_overlap and self.is_overlapping(s):
-			Nucleotide.index -= s.N
-			Strand.index -= 1
-			return False
-		'''
-		# we now make cells off-line to save time when loading
-		# configurations; interactions are computed with h_bonds.py
-		# most of the time anyways
-		for n in s._nucleotides:
-			cs = np.array((np.floor((n.cm_pos/self._box - np.rint(n.cm_pos / self._box ) + 0.5) * (1. - FLT_EPSILON) * self._box / self._cellsides)), np.int)
-			cella = cs[0] + self._N_cells[0] * cs[1] + self._N_cells[0] * self._N_cells[1] * cs[2]
-			n.next = self._head[cella]
-			self._head[cella] = n
-		'''
+		if check_overlap:
+			if self._overlaps is None:
+				self.do_cells()
+			back, base = s.get_overlap_sites()
+			if not self._overlaps.add_if_free(back, base):
+				Nucleotide.index -= s.N
+				Strand.index -= 1
+				return False
+		elif self._overlaps is not None:
+			# cells are made only once overlaps are checked, to save time when loading configurations
+			self._overlaps.add(*s.get_overlap_sites())
 		self._strands.append(s)
 		self._N += s.N
 		self._N_strands += 1
-		self.cells_done = False
+		self._invalidate_nucleotides()
 		return True
 
 	def add_strands(self, ss, check_overlap=True):
@@ -1149,9 +1125,10 @@ class System(object):
 					Nucleotide.index -= s.N
 					Strand.index -= 1
 					self._strands.pop()
+					self._invalidate_nucleotides()
+					self._overlaps = None
 					self._N -= s.N
 					self._N_strands -= 1
-					self._sequences.pop()
 				return False
 
 		elif not self.add_strand(ss, check_overlap): return False
@@ -1167,10 +1144,12 @@ class System(object):
 	def rotate (self, amount, origin=None):
 		for s in self._strands:
 			s.rotate (amount, origin)
+		self._overlaps = None
 
 	def translate (self, amount):
 		for s in self._strands:
 			s.translate (amount)
+		self._overlaps = None
 
 	def print_tcl_detailed_output (self, outname="out.tcl", visibility=None):
 		self._prepare(visibility)
@@ -1361,7 +1340,11 @@ class System(object):
 			 f.write(out)
 		f.close()
 
-	def print_lorenzo_output(self, conf_name, top_name, visibility=None):
+	def print_lorenzo_output(self, conf_name, top_name, visibility=None, binary=False, append=False):
+		"""
+		binary --- write conf_name as a (float32) binary trajectory, see binary.py
+		append --- add the configuration at the end of conf_name, e.g. to build a trajectory
+		"""
 		self._prepare(visibility)
 		#print(self._time, self._box[0], self._box[1], self._box[2], self.E_tot, self.E_pot, self.E_kin
 		conf = "t = %lu\nb = %f %f %f\nE = %lf %lf %lf\n" % (int(self._time), self._box[0], self._box[1], self._box[2], self.E_tot, self.E_pot, self.E_kin)
@@ -1377,11 +1360,21 @@ class System(object):
 		for s in self._strands:
 			sc, st = s.get_output(OUT_LORENZO)
 			topology += st
-			conf += sc
+			if not binary:
+				conf += sc
 
-		f = open(conf_name, "w")
-		f.write(conf)
-		f.close()
+		if binary:
+			from .readers import Frame
+			from .binary import BinaryTrajectoryWriter
+
+			data = np.array([np.concatenate((n.cm_pos, n._a1, n._a3, n._v, n._L)) for s in self._strands if s.visible for n in s._nucleotides])
+			frame = Frame(self._time, self._box, [self.E_tot, self.E_pot, self.E_kin], data=data)
+			with BinaryTrajectoryWriter(conf_name, visible_nucleotides, append=append) as writer:
+				writer.write(frame)
+		else:
+			f = open(conf_name, "a" if append else "w")
+			f.write(conf)
+			f.close()
 
 		f = open(top_name, "w")
 		f.write(topology)
@@ -1511,19 +1504,57 @@ class System(object):
 	N_strands = property (get_N_strands)
 
 	def get_nucleotide_list (self):
+		""" returns the flat list of the nucleotides of all the strands, built once and
+			kept until strands are added or removed or the nucleotides of a strand change
+		"""
+		if self._nucleotide_list is None or self._nucleotides_changes != Strand.changes:
+			self._build_nucleotides()
+		return self._nucleotide_list
+
+	_nucleotides = property (get_nucleotide_list)
+
+	def get_strand_offsets(self):
+		""" returns the array of the index of the first nucleotide of every strand (and N at the end),
+			the nucleotides of strand s are _nucleotides[offsets[s]:offsets[s+1]]
+		"""
+		self.get_nucleotide_list()
+		return self._strand_offsets
+
+	def get_nucleotide_strands(self):
+		""" returns the array of the strand (index in _strands) of every nucleotide """
+		self.get_nucleotide_list()
+		return self._nucleotide_strands
+
+	def _build_nucleotides(self):
 		ret = []
 		for s in self._strands:
 			ret += s._nucleotides
-		return ret
-
-	_nucleotides = property (get_nucleotide_list)
+		lengths = [len(s._nucleotides) for s in self._strands]
+		self._nucleotide_list = ret
+		self._strand_offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+		self._nucleotide_strands = np.repeat(np.arange(len(lengths)), lengths)
+		self._nucleotides_changes = Strand.changes
+
+	def _invalidate_nucleotides(self):
+		self._nucleotide_list = None
+		self._strand_offsets = None
+		self._nucleotide_strands = None
+
+	def get_neighbour_pairs(self, cutoff, positions=None):
+		""" returns the arrays (i, j), i < j, of the nucleotides closer than cutoff (minimum
+			image in the box of the system) and their distance vectors, see neighbors.py
+
+			positions -- (N, 3) array of the sites to compare (default the centres of mass),
+				e.g. the base sites for base pairing
+		"""
+		from .neighbors import find_pairs
+		if positions is None:
+			positions = np.array([n.cm_pos for n in self._nucleotides]).reshape(-1, 3)
+		return find_pairs(positions, self._box, cutoff)
 
 	def map_nucleotides_to_strands(self):
 		#this function creates nucl_id -> strand_id array
-		index = 0
-		for i in range(len(self._strands)):
-			for j in range(self._strands[i].get_length()):
-				self._nucleotide_to_strand.append(i)
+		self._nucleotide_to_strand = self.get_nucleotide_strands().tolist()
 
 	def read_H_bonds(self, inputpipe):
 		for line in inputpipe:
@@ -1562,24 +1593,28 @@ class System(object):
 		return self._nucleotides[nuclA].get_interaction(nuclB,interaction_type)
 
 	def add_H_interaction(self,nuclA,nuclB,interaction):
-		strandA = self._nucleotide_to_strand[nuclA]
-		strandB = self._nucleotide_to_strand[nuclB]
 		if(interaction < H_CUTOFF):
+			nucleotide_strands = self.get_nucleotide_strands()
+			strandA = int(nucleotide_strands[nuclA])
+			strandB = int(nucleotide_strands[nuclB])
 			#print("Adding ",nuclA, " ", nuclB, " ",float(interaction)
 			if strandA <= strandB:	#each interaction added just once
 				self._strands[strandA].add_H_interaction(strandB)
 			else:
-				self._strands[strandB].add_H_interaction(standA)
+				self._strands[strandB].add_H_interaction(strandA)
 			# [MRS] : shifted these into the "if" statement so that nucleotide objects and strand objects agree
-			self._nucleotides[nuclA].add_H_interaction(nuclB)
-			self._nucleotides[nuclB].add_H_interaction(nuclA)
+			nucleotides = self._nucleotides
+			nucleotides[nuclA].add_H_interaction(nuclB)
+			nucleotides[nuclB].add_H_interaction(nuclA)
 
 	def get_H_interactions_nucleotides(self):
 		retset = []
-		for i in range(len(self._nucleotides)):
-			interactions = self._nucleotides[i].get_H_interactions()
+		nucleotides = self._nucleotides
+		nucleotide_strands = self.get_nucleotide_strands().tolist()
+		for i in range(len(nucleotides)):
+			interactions = nucleotides[i].get_H_interactions()
 			for j in interactions:
-				if i < j and ( j-i != 1 or self._nucleotide_to_strand[i] != self._nucleotide_to_strand[j] ):
+				if i < j and ( j-i != 1 or nucleotide_strands[i] != nucleotide_strands[j] ):
 					retset.append( [i,j] )
 		return retset
 
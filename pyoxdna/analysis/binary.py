@@ -0,0 +1,279 @@
+"""
+Compact chunked binary format for oxDNA trajectories
+
+layout (little endian):
+    file header: magic b'OXDNABIN', N (uint32), number of columns (uint8, 15 or
+        9 when v and L are dropped), float size (uint8, 4 or 8), 2 padding bytes
+    chunks, each one with:
+        b'CHNK', number of frames n (uint32)
+        times (n float64), boxes (n x 3 float64), energies (n x 3 float64)
+        nucleotide data (n x N x columns, float32 or float64)
+
+chunks are only appended, so a trajectory can be written frame by frame and a
+file cut in the middle of a chunk is still readable up to the last whole chunk.
+
+usage:
+    python -m pyoxdna.analysis.binary to_binary <trajectory> <topology> <output> [float64] [no_velocities]
+    python -m pyoxdna.analysis.binary to_text <binary_trajectory> <output>
+"""
+import os
+import sys
+import mmap
+import struct
+import numpy as np
+from .readers import Frame, MappedTrajectory
+from .topology import load_topology
+from .trajectory import select_frames
+
+MAGIC = b"OXDNABIN"
+HEADER = struct.Struct("<8sIBB2x")
+CHUNK_HEADER = struct.Struct("<4sI")
+CHUNK_MAGIC = b"CHNK"
+
+ALL_COLUMNS = 15
+POSITION_COLUMNS = 9 # cm_pos, a1 and a3 only
+
+DEFAULT_CHUNK_SIZE = 100
+
+
+def is_binary_trajectory(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class BinaryTrajectoryWriter:
+    """
+    Writes frames to a binary trajectory, one chunk every chunk_size frames
+
+    path --- output file
+
+    N --- number of nucleotides
+
+    dtype --- np.float32 (default) or np.float64 for the nucleotide data
+
+    keep_velocities --- store v and L, otherwise only cm_pos, a1 and a3 are kept
+
+    append --- add chunks to an existing binary trajectory (its N, dtype and
+        columns are used)
+    """
+
+    def __init__(self, path, N, dtype=np.float32, keep_velocities=True, chunk_size=DEFAULT_CHUNK_SIZE, append=False):
+        self.N = N
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.columns = ALL_COLUMNS if keep_velocities else POSITION_COLUMNS
+        self.chunk_size = chunk_size
+        self._pending = []
+
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                magic, N_file, columns, size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or N_file != N:
+                raise ValueError("'%s' is not a binary trajectory of %d nucleotides" % (path, N))
+            self.columns = columns
+            self.dtype = np.dtype("<f%d" % size)
+            self._file = open(path, "ab")
+        else:
+            if self.dtype.kind != "f" or self.dtype.itemsize not in (4, 8):
+                raise ValueError("binary trajectories store float32 or float64 data, not %s" % dtype)
+            self._file = open(path, "wb")
+            self._file.write(HEADER.pack(MAGIC, N, self.columns, self.dtype.itemsize))
+
+    def write(self, frame):
+        """ adds a Frame (anything with time, box, energy and an (N, 15) data array) """
+        if len(frame.data) != self.N:
+            raise ValueError("frame has %d nucleotides, the trajectory %d" % (len(frame.data), self.N))
+        self._pending.append(frame)
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._pending) == 0:
+            return
+        n = len(self._pending)
+        times = np.array([f.time for f in self._pending], "<f8")
+        boxes = np.array([f.box for f in self._pending], "<f8").reshape(n, 3)
+        energies = np.array([f.energy for f in self._pending], "<f8").reshape(n, 3)
+        data = np.empty((n, self.N, self.columns), self.dtype)
+        for i, f in enumerate(self._pending):
+            data[i] = f.data[:, :self.columns]
+
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, n))
+        for array in (times, boxes, energies, data):
+            self._file.write(array.tobytes())
+        self._file.flush()
+        self._pending = []
+
+    def close(self):
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, "_file", None): self.close()
+
+
+class BinaryTrajectory:
+    """
+    Reader for binary trajectories with the same interface as MappedTrajectory
+
+    frames are read from a memory map; their data is a zero-copy view of the file
+    when all 15 columns are stored (columns that were dropped are read as zeros)
+
+    trajectory --- path to the binary trajectory
+
+    topology --- path to the topology file, needed to build Systems from the frames
+    """
+
+    def __init__(self, trajectory, topology=None):
+        self._open(trajectory, topology)
+
+    def _open(self, trajectory, topology):
+        self.path = trajectory
+        self.topology = topology
+        self._topology = load_topology(topology) if topology is not None else None
+
+        self._file = open(trajectory, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.N, self.columns, size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("'%s' is not a binary trajectory" % trajectory)
+        self.dtype = np.dtype("<f%d" % size)
+
+        self._scan()
+
+    def _scan(self):
+        """ finds the position of the times, boxes, energies and data of every frame """
+        positions = [] # offset of the nucleotide data of every frame
+        times, boxes, energies = [], [], []
+
+        frame_size = self.N * self.columns * self.dtype.itemsize
+        offset = HEADER.size
+        size = len(self._map)
+        while offset + CHUNK_HEADER.size <= size:
+            magic, n = CHUNK_HEADER.unpack_from(self._map, offset)
+            start = offset + CHUNK_HEADER.size
+            end = start + n * 7 * 8 + n * frame_size
+            if magic != CHUNK_MAGIC or end > size:
+                # truncated chunk, e.g. the writer is still running
+                break
+
+            times.append(np.frombuffer(self._map, "<f8", n, start))
+            boxes.append(np.frombuffer(self._map, "<f8", 3 * n, start + 8 * n).reshape(n, 3))
+            energies.append(np.frombuffer(self._map, "<f8", 3 * n, start + 32 * n).reshape(n, 3))
+            data_start = start + 56 * n
+            positions.extend(data_start + i * frame_size for i in range(n))
+            offset = end
+
+        self._positions = positions
+        self.times = np.concatenate(times) if times else np.zeros(0)
+        self.boxes = np.concatenate(boxes) if boxes else np.zeros((0, 3))
+        self.energies = np.concatenate(energies) if energies else np.zeros((0, 3))
+
+    def __getstate__(self):
+        return {"trajectory": self.path, "topology": self.topology}
+
+    def __setstate__(self, state):
+        self._open(state["trajectory"], state["topology"])
+
+    def close(self):
+        if self._file:
+            self.times = self.boxes = self.energies = None
+            try:
+                self._map.close()
+            except BufferError:
+                # frames still hold views of the map, it is unmapped once they are released
+                pass
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def get_frame(self, k):
+        data = np.frombuffer(self._map, self.dtype, self.N * self.columns, self._positions[k]).reshape(self.N, self.columns)
+        if self.columns < ALL_COLUMNS:
+            full = np.zeros((self.N, ALL_COLUMNS), self.dtype)
+            full[:, :self.columns] = data
+            data = full
+
+        return Frame(self.times[k], self.boxes[k], self.energies[k].tolist(), data=data, topology=self._topology)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self.get_frame(i) for i in range(*k.indices(len(self)))]
+        if k < 0:
+            k += len(self)
+        if k < 0 or k >= len(self):
+            raise IndexError("frame %d out of range" % k)
+        return self.get_frame(k)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.get_frame(k)
+
+    def get_frame_numbers(self, **window):
+        """ returns the numbers of the frames in a window (arguments of select_frames) """
+        return select_frames(self.times, **window)
+
+    def iter_frames(self, **window):
+        for k in self.get_frame_numbers(**window).tolist():
+            yield self.get_frame(k)
+
+
+def convert_to_binary(trajectory, topology, output, dtype=np.float32, keep_velocities=True, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ converts a Lorenzo (text) trajectory to the binary format, returns the number of frames """
+    N = load_topology(topology).N
+    with MappedTrajectory(trajectory, topology) as frames:
+        with BinaryTrajectoryWriter(output, N, dtype, keep_velocities, chunk_size) as writer:
+            for frame in frames:
+                writer.write(frame)
+        return len(frames)
+
+
+def convert_to_text(trajectory, output):
+    """ converts a binary trajectory back to the Lorenzo (text) format, e.g. for oxdna-viewer """
+    with BinaryTrajectory(trajectory) as frames:
+        with open(output, "wb") as out:
+            for frame in frames:
+                frame.write(out)
+        return len(frames)
+
+
+def extract_conf(trajectory, output, frame=-1):
+    """ writes one frame (default the last one) of a binary (or compressed) trajectory as a text configuration for oxDNA """
+    from .readers import open_trajectory
+
+    with open_trajectory(trajectory) as frames:
+        with open(output, "wb") as out:
+            frames[frame].write(out)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 5 and sys.argv[1] == 'to_binary':
+        output = sys.argv[4]
+        dtype = np.float64 if 'float64' in sys.argv[5:] else np.float32
+        n = convert_to_binary(sys.argv[2], sys.argv[3], output, dtype=dtype, keep_velocities='no_velocities' not in sys.argv[5:])
+    elif len(sys.argv) == 4 and sys.argv[1] == 'to_text':
+        output = sys.argv[3]
+        n = convert_to_text(sys.argv[2], output)
+    else:
+        print(__doc__)
+        sys.exit()
+
+    print(f'{n} frames written to {output}')
@@ -0,0 +1,165 @@
+"""
+Content addressed cache of analysis results
+
+results are pickled in a cache directory under a key computed from the sha256
+of the contents of the files they were computed from (trajectory, topology,
+input file) and of the options of the analysis, so a result is reused as long
+as none of them change, whatever the path or the modification time of the
+files. The least recently used results are deleted when the cache grows
+beyond its maximum size.
+
+The cache directory is set with the cache_dir argument of analyze_bonds, the
+ANALYSIS_CACHE_DIR key of config.yml (for the scripts) or the
+OXDNA_ANALYSIS_CACHE_DIR environment variable.
+"""
+import os
+import json
+import pickle
+import hashlib
+
+CACHE_DIR_ENV = "OXDNA_ANALYSIS_CACHE_DIR"
+CACHE_SIZE_ENV = "OXDNA_ANALYSIS_CACHE_SIZE" # in MB
+
+DEFAULT_MAX_SIZE = 1 << 30 # bytes
+
+# bump to invalidate the results computed by older versions of the analysis
+CACHE_VERSION = 2
+
+RESULT_EXTENSION = ".pkl"
+DIGESTS_FILE = "digests.json"
+HASH_BLOCK_SIZE = 1 << 24
+
+
+class ResultCache:
+    """
+    Directory of pickled results with least recently used eviction
+
+    directory --- cache directory (created if needed)
+
+    max_size --- maximum total size of the results in bytes
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+        # digests of the files already hashed, with the size and mtime they had,
+        # so unchanged files are not read again
+        self._digests_path = os.path.join(directory, DIGESTS_FILE)
+        try:
+            with open(self._digests_path, "r") as f:
+                self._digests = json.load(f)
+        except (OSError, ValueError):
+            self._digests = {}
+
+    def file_digest(self, path):
+        """ same as file_digest, only computed again when the size or mtime of the file change """
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        known = self._digests.get(path)
+        if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        digest = file_digest(path)
+
+        self._digests[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._write(self._digests_path, json.dumps(self._digests).encode())
+        return digest
+
+    def get_key(self, files, **options):
+        """ returns the key of the result computed from files with options (anything with a repr) """
+        key = hashlib.sha256()
+        key.update(repr(CACHE_VERSION).encode())
+        for path in files:
+            key.update(self.file_digest(path).encode())
+        for name in sorted(options):
+            key.update(("%s=%r;" % (name, options[name])).encode())
+        return key.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + RESULT_EXTENSION)
+
+    def get(self, key):
+        """ returns the result stored under key, or None """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+        # the modification time records the last use
+        try: os.utime(path)
+        except OSError: pass
+        return result
+
+    def put(self, key, result):
+        self._write(self._path(key), pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+    def evict(self):
+        """ deletes the least recently used results until the cache fits in max_size """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(RESULT_EXTENSION):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(RESULT_EXTENSION) or name == DIGESTS_FILE:
+                os.remove(os.path.join(self.directory, name))
+        self._digests = {}
+
+    def _write(self, path, data):
+        # written to a temporary file and renamed, so readers never see half written files
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+
+def file_digest(path):
+    """ returns the sha256 of the contents of a file """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        block = f.read(HASH_BLOCK_SIZE)
+        while block:
+            digest.update(block)
+            block = f.read(HASH_BLOCK_SIZE)
+    return digest.hexdigest()
+
+
+def get_cache(cache_dir=None):
+    """ returns the ResultCache of cache_dir (default $OXDNA_ANALYSIS_CACHE_DIR), or None
+        when no cache directory is set (or cache_dir is False)
+    """
+    if cache_dir is False:
+        return None
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+
+    max_size = DEFAULT_MAX_SIZE
+    if os.environ.get(CACHE_SIZE_ENV):
+        max_size = int(float(os.environ[CACHE_SIZE_ENV]) * (1 << 20))
+
+    return ResultCache(os.path.expanduser(cache_dir), max_size)
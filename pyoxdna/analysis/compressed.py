@@ -0,0 +1,491 @@
+"""
+Block compressed (gzip or xz) text trajectories
+
+a compressed trajectory is a series of independent gzip members (or xz streams),
+each holding a block of about block_size bytes of whole frames, so gzip -d, xz -d
+or zcat still give back the text trajectory. The compressed offset of every block
+and the offset (in the text), time and box of every frame are kept in an index
+next to the file (<trajectory>.idx, as for text trajectories), written by
+CompressedTrajectoryWriter or built with one pass over the file. A frame is then
+read by decompressing only the block(s) holding it.
+
+any gzip or xz file of a trajectory is read the same way (e.g. gzip trajectory.dat,
+a single block), but then every frame needs the whole file to be decompressed:
+use compress to rewrite it in blocks.
+
+usage:
+    python -m pyoxdna.analysis.compressed compress <trajectory> <output.gz|output.xz> [block_size]
+    python -m pyoxdna.analysis.compressed decompress <compressed_trajectory> <output>
+"""
+import os
+import sys
+import zlib
+import lzma
+import gzip
+import numpy as np
+
+from .readers import Frame
+from .topology import load_topology
+from .trajectory import select_frames, INDEX_EXTENSION
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+EXTENSIONS = {".gz": "gzip", ".xz": "xz"}
+DEFAULT_LEVELS = {"gzip": 6, "xz": 6}
+
+INDEX_VERSION = 1
+# bytes of text in a block by default
+DEFAULT_BLOCK_SIZE = 1 << 22
+# bytes of compressed data read at once while scanning a file
+READ_SIZE = 1 << 22
+# decompressed blocks kept for the next reads
+CACHED_BLOCKS = 2
+
+
+def get_codec(path):
+    """ returns 'gzip' or 'xz' for the compressed files, None for the others """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(len(XZ_MAGIC))
+    except OSError:
+        return None
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == XZ_MAGIC:
+        return "xz"
+    return None
+
+
+def is_compressed_trajectory(path):
+    return get_codec(path) is not None
+
+
+def open_text(path):
+    """ opens a (maybe compressed) text file for reading, as bytes """
+    codec = get_codec(path)
+    if codec == "gzip":
+        return gzip.open(path, "rb")
+    if codec == "xz":
+        return lzma.open(path, "rb")
+    return open(path, "rb")
+
+
+def compress_block(codec, data, level=None):
+    """ returns data compressed as one gzip member or xz stream """
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == "gzip":
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    return lzma.compress(data, lzma.FORMAT_XZ, preset=level)
+
+
+def get_decompressor(codec):
+    if codec == "gzip":
+        return zlib.decompressobj(31)
+    return lzma.LZMADecompressor(lzma.FORMAT_XZ)
+
+
+def iter_blocks(f, codec):
+    """ yields the compressed start and end offsets and the decompressed data of every gzip
+        member (xz stream) of a file, a last block that is cut (still being written) is left out
+    """
+    magic = GZIP_MAGIC if codec == "gzip" else XZ_MAGIC
+    block_start = 0
+    data_start = 0
+    decompressor = get_decompressor(codec)
+    pieces = []
+    data = f.read(READ_SIZE)
+    while data:
+        pieces.append(decompressor.decompress(data))
+        if not decompressor.eof:
+            data_start += len(data)
+            data = f.read(READ_SIZE)
+            continue
+
+        rest = decompressor.unused_data
+        block_end = data_start + len(data) - len(rest)
+        yield block_start, block_end, b"".join(pieces)
+        block_start = data_start = block_end
+        pieces = []
+        if not rest:
+            rest = f.read(READ_SIZE)
+        if not rest.startswith(magic[:len(rest)]) or not rest:
+            # end of the file, or padding after the last block
+            return
+        decompressor = get_decompressor(codec)
+        data = rest
+
+
+class HeaderScanner:
+    """ finds the offset, time and box of the frames of a text trajectory given in pieces """
+
+    def __init__(self):
+        self.offsets, self.times, self.boxes = [], [], []
+        self.size = 0 # bytes of text seen
+        self.end = 0 # end of the last whole frame header seen (a cut header is not a frame)
+        self._carry = b"" # end of the text, with the header not parsed yet if there is one
+
+    def feed(self, data):
+        buf = self._carry + data
+        buf_start = self.size - len(self._carry)
+        self.size += len(data)
+
+        # frame headers are the lines starting with 't = '
+        starts = [0] if buf_start == 0 and buf.startswith(b"t = ") else []
+        i = buf.find(b"\nt = ")
+        while i != -1:
+            starts.append(i + 1)
+            i = buf.find(b"\nt = ", i + 1)
+
+        # shorter than the pattern, so no header is found twice
+        self._carry = buf[-4:]
+        self.end = self.size
+        for start in starts:
+            box_end = buf.find(b"\n", buf.find(b"\n", start) + 1)
+            if box_end == -1:
+                # the header goes on in the next piece, it is found again there
+                self._carry = buf[max(start - 1, 0):]
+                self.end = buf_start + start
+                break
+            lines = buf[start:box_end].split(b"\n")
+            self.offsets.append(buf_start + start)
+            self.times.append(float(lines[0].split()[2]))
+            self.boxes.append([float(x) for x in lines[1].split()[2:5]])
+
+
+class BlockIndex:
+    """
+    Blocks and frames of a compressed trajectory
+
+    block_offsets --- compressed offset of every block, and the size of the file
+
+    block_starts --- offset in the text of the first byte of every block, and the size of the text
+
+    offsets, times, boxes --- offset in the text, time and box of every frame
+
+    end --- end of the text of the last frame
+
+    trajectory --- path to the compressed trajectory
+
+    cache --- read/write the .idx file next to the trajectory
+    """
+
+    def __init__(self, trajectory, cache=True):
+        self.path = trajectory
+        self.index_path = trajectory + INDEX_EXTENSION
+        self.codec = get_codec(trajectory)
+        if self.codec is None:
+            raise ValueError("'%s' is not a gzip or xz file" % trajectory)
+
+        stat = os.stat(trajectory)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+
+        if not (cache and self._load()):
+            self._build()
+            if cache:
+                self._save()
+
+    def _load(self):
+        try:
+            with np.load(self.index_path) as cached:
+                version, size, mtime, end = cached["compressed"].tolist()
+                if version != INDEX_VERSION or size != self.size or mtime != self.mtime:
+                    return False
+                self._set(cached["block_offsets"], cached["block_starts"], cached["offsets"], cached["times"], cached["boxes"], end)
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def _save(self):
+        tmp_path = "%s.%d.tmp" % (self.index_path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, compressed=np.array([INDEX_VERSION, self.size, self.mtime, self.end], np.int64),
+                         block_offsets=self.block_offsets, block_starts=self.block_starts,
+                         offsets=self.offsets, times=self.times, boxes=self.boxes)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+    def _set(self, block_offsets, block_starts, offsets, times, boxes, end):
+        self.block_offsets = np.asarray(block_offsets, np.int64)
+        self.block_starts = np.asarray(block_starts, np.int64)
+        self.offsets = np.asarray(offsets, np.int64)
+        self.times = np.asarray(times, np.float64)
+        self.boxes = np.asarray(boxes, np.float64).reshape(-1, 3)
+        self.end = int(end)
+
+    def _build(self):
+        scanner = HeaderScanner()
+        block_offsets, block_starts = [0], []
+        with open(self.path, "rb") as f:
+            for start, end, data in iter_blocks(f, self.codec):
+                block_offsets[-1] = start
+                block_offsets.append(end)
+                block_starts.append(scanner.size)
+                scanner.feed(data)
+        self._set_scanned(block_offsets, block_starts, scanner)
+
+    def _set_scanned(self, block_offsets, block_starts, scanner):
+        """ sets the index from the blocks (with the end of the last one) and the frames found in their text """
+        self._set(block_offsets, block_starts + [scanner.size], scanner.offsets, scanner.times, scanner.boxes, scanner.end)
+
+    @classmethod
+    def from_scan(cls, trajectory, block_offsets, block_starts, scanner, cache=True):
+        """ index of a trajectory just written (see CompressedTrajectoryWriter) """
+        index = cls.__new__(cls)
+        index.path = trajectory
+        index.index_path = trajectory + INDEX_EXTENSION
+        index.codec = get_codec(trajectory)
+        stat = os.stat(trajectory)
+        index.size = stat.st_size
+        index.mtime = stat.st_mtime_ns
+        index._set_scanned(block_offsets + [stat.st_size], block_starts, scanner)
+        if cache:
+            index._save()
+        return index
+
+    def __len__(self):
+        return len(self.offsets)
+
+    n_frames = property(__len__)
+
+    def get_bounds(self, k):
+        """ returns the (start, end) offsets in the text of frame k """
+        start = int(self.offsets[k])
+        end = int(self.offsets[k + 1]) if k + 1 < len(self.offsets) else self.end
+        return start, end
+
+    def get_blocks(self, start, end):
+        """ returns the first and last blocks holding the text from start to end-1 """
+        first = int(np.searchsorted(self.block_starts, start, "right")) - 1
+        last = int(np.searchsorted(self.block_starts, end - 1, "right")) - 1
+        return first, last
+
+    def get_frame_numbers(self, **window):
+        """ returns the numbers of the frames in a window (arguments of select_frames) """
+        return select_frames(self.times, **window)
+
+
+class CompressedTrajectory:
+    """
+    Reader for block compressed trajectories with the same interface as MappedTrajectory
+
+    get_raw and the frames hold the decompressed text of the frames, which is only
+    parsed when their arrays are used
+
+    trajectory --- path to the compressed trajectory
+
+    topology --- path to the topology file, needed to build Systems from the frames
+    """
+
+    def __init__(self, trajectory, topology=None):
+        self._open(trajectory, topology)
+
+    def _open(self, trajectory, topology):
+        self.path = trajectory
+        self.topology = topology
+        self._topology = load_topology(topology) if topology is not None else None
+        self.index = BlockIndex(trajectory)
+        self.codec = self.index.codec
+        self._file = open(trajectory, "rb")
+        self._blocks = {} # block number -> decompressed text
+
+    def __getstate__(self):
+        return {"trajectory": self.path, "topology": self.topology}
+
+    def __setstate__(self, state):
+        self._open(state["trajectory"], state["topology"])
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_block(self, b):
+        """ returns the decompressed text of block b """
+        if b not in self._blocks:
+            start, end = self.index.block_offsets[b:b + 2].tolist()
+            self._file.seek(start)
+            data = self._file.read(end - start)
+            if self.codec == "gzip":
+                text = zlib.decompress(data, 31)
+            else:
+                text = lzma.decompress(data, lzma.FORMAT_XZ)
+            if len(self._blocks) >= CACHED_BLOCKS:
+                del self._blocks[next(iter(self._blocks))]
+            self._blocks[b] = text
+        return self._blocks[b]
+
+    def get_text(self, start, end):
+        """ returns the decompressed text from start to end-1 """
+        if end <= start:
+            return b""
+        first, last = self.index.get_blocks(start, end)
+        text = b"".join(self.get_block(b) for b in range(first, last + 1))
+        offset = int(self.index.block_starts[first])
+        return text[start - offset:end - offset]
+
+    def get_raw(self, k, stop=None):
+        """ returns the whole text of frame k (header included), or of the frames k to
+            stop-1 if stop is given """
+        start, end = self.index.get_bounds(k)
+        if stop is not None and stop > k + 1:
+            end = self.index.get_bounds(stop - 1)[1]
+        return self.get_text(start, end)
+
+    def get_frame(self, k):
+        return Frame.from_text(self.get_raw(k), self._topology)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self.get_frame(i) for i in range(*k.indices(len(self)))]
+        if k < 0:
+            k += len(self)
+        if k < 0 or k >= len(self):
+            raise IndexError("frame %d out of range" % k)
+        return self.get_frame(k)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.get_frame(k)
+
+    def get_frame_numbers(self, **window):
+        """ returns the numbers of the frames in a window (arguments of select_frames) """
+        return self.index.get_frame_numbers(**window)
+
+    def iter_frames(self, **window):
+        for k in self.get_frame_numbers(**window).tolist():
+            yield self.get_frame(k)
+
+
+class CompressedTrajectoryWriter:
+    """
+    Writes a text trajectory compressed in blocks
+
+    it is a binary file for the text of the frames (Frame.write(writer) works), every
+    block is cut at the start of a frame once it holds block_size bytes of text. The
+    index is written when the writer is closed
+
+    path --- output file
+
+    codec --- 'gzip' or 'xz', by default from the extension of path (gzip if unknown)
+
+    block_size --- bytes of text in a block, larger blocks compress a bit better but
+        more text is decompressed to read a frame
+
+    level --- compression level (gzip 1-9, xz 0-9)
+    """
+
+    def __init__(self, path, codec=None, block_size=DEFAULT_BLOCK_SIZE, level=None):
+        self.path = path
+        self.codec = codec or EXTENSIONS.get(os.path.splitext(path)[1], "gzip")
+        if self.codec not in DEFAULT_LEVELS:
+            raise ValueError("unknown codec '%s'" % self.codec)
+        self.block_size = block_size
+        self.level = level
+
+        self._file = open(path, "wb")
+        self._pieces = []
+        self._buffered = 0
+        self._scanner = HeaderScanner()
+        self._block_offsets, self._block_starts = [], []
+        self.index = None
+
+    def write(self, data):
+        self._pieces.append(bytes(data))
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            self._write_block(False)
+
+    def _write_block(self, final):
+        text = b"".join(self._pieces)
+        cut = len(text)
+        if not final:
+            # whole frames only, the rest stays for the next block
+            cut = text.rfind(b"\nt = ") + 1
+            if cut <= 0:
+                self._pieces = [text]
+                return
+        block, rest = text[:cut], text[cut:]
+        self._pieces = [rest] if rest else []
+        self._buffered = len(rest)
+        if not block:
+            return
+
+        self._block_offsets.append(self._file.tell())
+        self._block_starts.append(self._scanner.size)
+        self._scanner.feed(block)
+        self._file.write(compress_block(self.codec, block, self.level))
+
+    def close(self):
+        if self._file:
+            self._write_block(True)
+            self._file.close()
+            self._file = None
+            self.index = BlockIndex.from_scan(self.path, self._block_offsets, self._block_starts, self._scanner)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, "_file", None) is not None: self.close()
+
+
+def open_output(path, **kwargs):
+    """ opens a trajectory for writing, compressed (CompressedTrajectoryWriter) if the
+        extension of path is .gz or .xz, as a plain binary file otherwise
+    """
+    if os.path.splitext(path)[1] in EXTENSIONS:
+        return CompressedTrajectoryWriter(path, **kwargs)
+    return open(path, "wb")
+
+
+def compress_trajectory(trajectory, output, codec=None, block_size=DEFAULT_BLOCK_SIZE, level=None):
+    """ writes a (text, binary or compressed) trajectory as a block compressed trajectory, returns the number of frames """
+    from .readers import open_trajectory
+
+    with open_trajectory(trajectory) as frames:
+        with CompressedTrajectoryWriter(output, codec, block_size, level) as writer:
+            for frame in frames:
+                frame.write(writer)
+            return len(frames)
+
+
+def decompress_trajectory(trajectory, output):
+    """ writes the text of a compressed trajectory, returns the number of bytes written """
+    written = 0
+    with open_text(trajectory) as f:
+        with open(output, "wb") as out:
+            for data in iter(lambda: f.read(READ_SIZE), b""):
+                out.write(data)
+                written += len(data)
+    return written
+
+
+if __name__ == '__main__':
+    if len(sys.argv) in (4, 5) and sys.argv[1] == 'compress':
+        block_size = int(sys.argv[4]) if len(sys.argv) == 5 else DEFAULT_BLOCK_SIZE
+        n = compress_trajectory(sys.argv[2], sys.argv[3], block_size=block_size)
+        print(f'{n} frames written to {sys.argv[3]}')
+    elif len(sys.argv) == 4 and sys.argv[1] == 'decompress':
+        n = decompress_trajectory(sys.argv[2], sys.argv[3])
+        print(f'{n} bytes written to {sys.argv[3]}')
+    else:
+        print(__doc__)
+        sys.exit()
@@ -0,0 +1,126 @@
+"""
+Debouncing of the bonds found by analyze_bonds
+
+pairs with an HB energy close to H_CUTOFF flip between bonded and broken from one
+frame to the next. The debouncer only reports the persistent transitions:
+
+- hysteresis: a broken pair binds when its energy goes below make_cutoff, a bonded
+  pair breaks when its energy goes above break_cutoff (make_cutoff <= break_cutoff)
+- dwell: the new state must hold for min_dwell frames in a row, the transition is
+  then reported at the time of the first of these frames
+
+the raw state of a pair in a frame is its level: NONE (energy above break_cutoff),
+WEAK (between the cutoffs) or STRONG (below make_cutoff). Pairs are given integer
+ids (their position in the sorted array of the pairs seen so far) and the levels,
+debounced states and pending transitions are arrays indexed by them, so a frame
+costs a few vectorized operations whatever the number of flips.
+"""
+import numpy as np
+
+NONE = 0
+WEAK = 1
+STRONG = 2
+
+# pairs that are broken, with no pending transition, are forgotten when they
+# are more than half of the (at least PRUNE_SIZE) pairs
+PRUNE_SIZE = 1024
+
+
+def get_levels(energies, make_cutoff, break_cutoff):
+    """ returns the level (NONE, WEAK or STRONG) of pairs with HB energies """
+    return (energies < break_cutoff).astype(np.int8) + (energies < make_cutoff)
+
+
+def level_changes(prev_keys, prev_levels, keys, levels):
+    """ returns the packed pairs whose level changed between two frames and their new level
+
+        prev_keys, keys --- sorted packed pairs with a level above NONE in each frame
+    """
+    all_keys = np.union1d(prev_keys, keys)
+    before = np.zeros(len(all_keys), np.int8)
+    before[np.searchsorted(all_keys, prev_keys)] = prev_levels
+    after = np.zeros(len(all_keys), np.int8)
+    after[np.searchsorted(all_keys, keys)] = levels
+    changed = before != after
+    return all_keys[changed], after[changed]
+
+
+class BondDebouncer:
+    """
+    Debounced bonded state of packed pairs (see detect_bonds.pack_pairs), updated
+    frame by frame with the changes of their levels
+
+    min_dwell --- number of frames a new state must hold before it is reported
+    """
+
+    def __init__(self, min_dwell=1):
+        self.min_dwell = min_dwell
+        self.keys = np.zeros(0, np.int64)
+        self.levels = np.zeros(0, np.int8)
+        self.bonded = np.zeros(0, bool)
+        # frames in a row the raw state has differed from bonded, and the time of the first one
+        self.run_length = np.zeros(0, np.int64)
+        self.run_time = np.zeros(0, np.int64)
+
+    def reset(self, keys, levels):
+        """ starts from the levels of a first frame, the STRONG pairs are bonded """
+        self.keys = np.asarray(keys, np.int64)
+        self.levels = np.asarray(levels, np.int8)
+        self.bonded = self.levels >= STRONG
+        self.run_length = np.zeros(len(self.keys), np.int64)
+        self.run_time = np.zeros(len(self.keys), np.int64)
+
+    def get_bonds(self):
+        """ returns the sorted packed pairs bonded in the debounced state """
+        return self.keys[self.bonded]
+
+    def update(self, time, keys, levels):
+        """ applies the level changes (see level_changes) of the frame at time
+
+            returns (transition_time, broken, formed), the sorted packed pairs whose
+            transition is confirmed by this frame and the time it started (None if
+            there are none). All the transitions confirmed by a frame started in the
+            same frame, min_dwell-1 frames before
+        """
+        self._prune()
+        self._add(keys)
+        self.levels[np.searchsorted(self.keys, keys)] = levels
+
+        target = np.where(self.bonded, self.levels >= WEAK, self.levels >= STRONG)
+        differ = target != self.bonded
+        self.run_length = np.where(differ, self.run_length + 1, 0)
+        self.run_time[differ & (self.run_length == 1)] = time
+
+        confirmed = np.nonzero(self.run_length >= self.min_dwell)[0]
+        if len(confirmed) == 0:
+            return None, self.keys[:0], self.keys[:0]
+
+        transition_time = int(self.run_time[confirmed[0]])
+        self.bonded[confirmed] = ~self.bonded[confirmed]
+        self.run_length[confirmed] = 0
+        now_bonded = self.bonded[confirmed]
+        broken, formed = self.keys[confirmed[~now_bonded]], self.keys[confirmed[now_bonded]]
+        return transition_time, broken, formed
+
+    def _add(self, keys):
+        # gives ids to the pairs not seen yet, the arrays stay sorted by pair
+        new = np.setdiff1d(keys, self.keys, assume_unique=True)
+        if len(new) == 0:
+            return
+        at = np.searchsorted(self.keys, new)
+        self.keys = np.insert(self.keys, at, new)
+        self.levels = np.insert(self.levels, at, NONE)
+        self.bonded = np.insert(self.bonded, at, False)
+        self.run_length = np.insert(self.run_length, at, 0)
+        self.run_time = np.insert(self.run_time, at, 0)
+
+    def _prune(self):
+        if len(self.keys) < PRUNE_SIZE:
+            return
+        keep = (self.levels != NONE) | self.bonded | (self.run_length > 0)
+        if 2 * np.count_nonzero(keep) < len(keep):
+            self.keys = self.keys[keep]
+            self.levels = self.levels[keep]
+            self.bonded = self.bonded[keep]
+            self.run_length = self.run_length[keep]
+            self.run_time = self.run_time[keep]
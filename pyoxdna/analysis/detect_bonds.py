@@ -2,77 +2,86 @@
 #!/usr/bin/env python
 
 # from .base import *
-from .readers import LorenzoReader
+from .base import H_CUTOFF, INT_HYDR
+from .readers import MappedTrajectory, open_trajectory
+from .topology import load_topology
+from .hbonds import HBondDetector, get_hydr_eps
+from .events import BondEventStore
+from .cache import get_cache, file_digest
+from .tiles import StrandPairCounts, count_strand_pairs
+from .debounce import BondDebouncer, get_levels, level_changes
 import numpy as np
 import os.path
 import sys
 import subprocess
 import tempfile
-import json
+import multiprocessing
+import hashlib
+import pickle
 
+CHECKPOINT_EXTENSION = '.bonds.ckpt'
+CHECKPOINT_VERSION = 3
 
-def create_mappers(topologyfile):
-
-	with open(topologyfile,'r') as file:
-		content = file.read()
-
-	nucleotides = content.split('\n')
-
-	total_nucl = int(nucleotides[0].split(' ')[0])
-	total_stra = int(nucleotides[0].split(' ')[1])
-
-	strand_to_sequence = [None for x in range(total_stra+1)] # add one cause strand numbers start at one
-	absolute_to_strand = [None for x in range(total_nucl)]
-	strand_to_absolute = [[] for x in range(total_stra+1)]
-
-	index = 1
-	strand_num = 1
-	first_nucl = 0
-
-	while index < total_nucl:
 
-		seq = ''
-		data = nucleotides[index].split(' ')
-		first_nucl = index
-		
-		while strand_num == int(data[0]):
-			
-			absolute_to_strand[index-1] = [ strand_num, index-first_nucl ]
-			strand_to_absolute[strand_num].append( (index-1) )
-		
-			seq += data[1]
-			index += 1
-			if index <= total_nucl:
-				data = nucleotides[index].split(' ')
-			else:
-				break
-				
-		strand_to_sequence[strand_num] = seq
-		strand_num += 1
-	
-	return (strand_to_sequence, absolute_to_strand, strand_to_absolute)
-
-def print_progress( current, total, first=False ):
-	message = "Parsing through trajectory file :\t["
-	for i in range(total):
-		if i < current:
-			message += "="
-		else:
-			message += " "
-	message += "] {:.1f}%".format( 100*current/total )
-	if not first:
-		print("\b" * (200+total), end="")
-	print(message, end="")
-	if current == total:
-		print()
-	sys.stdout.flush()
+def create_mappers(topologyfile):
+	""" returns (strand_to_sequence, absolute_to_strand, strand_to_absolute), see Topology.get_mappers """
+	return load_topology(topologyfile).get_mappers()
 
 
-def analyze_bonds(input_file, trajectory_file, topology_file, include_starting_bonds=False, oxDNA_dir=None):
+def analyze_bonds(input_file, trajectory_file, topology_file, include_starting_bonds=False, oxDNA_dir=None, processes=1, batch=True, method='DNAnalysis', watch=None, cache_dir=None, checkpoint=None, tile_threshold=None, make_cutoff=None, break_cutoff=None, min_dwell=1, window=None, watch_strands=False):
 	"""
 
 	input_file -- oxDNA input file
 
+	processes -- number of worker processes, the frames are split in contiguous chunks
+		which are analyzed in parallel (None uses all the cores). The bond events are the
+		same as with one process
+
+	batch -- run DNAnalysis once over the whole trajectory (or chunk) and split its output
+		by frame, instead of once for every frame
+
+	method -- 'DNAnalysis' to get the hydrogen bonds from the pair energies computed by
+		DNAnalysis, or 'native' to compute the HB term with numpy (oxDNA_dir and batch are
+		not used, the model (DNA/DNA2) is read from the interaction_type of input_file)
+
+	watch -- list of [i, j] nucleotide pairs, only the bonds of these nucleotides (the
+		watched pairs and the competing bonds of their nucleotides) are reported. With the
+		native method only these nucleotides are evaluated, so the cost grows with the size
+		of the list instead of the size of the system. With DNAnalysis the list only filters
+		its output, DNAnalysis still computes every pair of the system (see watch_strands)
+
+	watch_strands -- with method='DNAnalysis' and watch, run DNAnalysis on a system of only
+		the strands of the watched nucleotides, so its cost grows with these strands instead
+		of the whole system. The bonds of the watched nucleotides with the other strands are
+		then not seen
+
+	cache_dir -- directory of the result cache (see cache.py), by default the
+		OXDNA_ANALYSIS_CACHE_DIR environment variable (no cache if it isn't set, or
+		with cache_dir=False). Analyzing files with the same contents with the same
+		options again returns the cached result. With a checkpoint the result is only
+		written to the cache, never read from it
+
+	checkpoint -- path of a checkpoint file (or True for <trajectory_file>.bonds.ckpt) where
+		the state of the analysis is saved at the end. When the trajectory has grown since
+		(and its previous frames are unchanged), only the new frames are analyzed, with the
+		same events as a full analysis. Analyzing the same frames again only loads it
+
+	tile_threshold -- number of base pairs from which two strands are bound, the
+		tile binding events and summary of the run are added to the output (see tiles.py)
+
+	make_cutoff, break_cutoff, min_dwell -- debouncing of the bond events (see debounce.py),
+		a broken pair binds when its HB energy goes below make_cutoff, a bonded pair breaks
+		when it goes above break_cutoff (both H_CUTOFF by default, break_cutoff >= make_cutoff),
+		and a new state is only reported if it holds for min_dwell frames (at the time of the
+		first one). Removes the events of pairs flipping around H_CUTOFF from frame to frame.
+		The strand counts still use H_CUTOFF and every frame
+
+	window -- only analyze some of the frames, dict of the arguments of select_frames
+		(trajectory.py): start, stop, stride in frames and t_start, t_stop, t_stride in
+		simulation time, e.g. {'stride': 100} or {'t_start': 1e6, 't_stop': 2e6}. The
+		other frames are skipped without being parsed, and the events are the changes
+		between the frames analyzed
+
 	returns {
 		'num_nuc': int number of nucleotides,
 		'num_str': int number of strands,
@@ -82,28 +91,86 @@ def analyze_bonds(input_file, trajectory_file, topology_file, include_starting_b
 		'min_time': int starting time of system,
 		'max_time': int ending time of system,
 		'time_step': float suggested number of steps for each timestep,
-		'bond_events': list of bond events (bonds breaking and forming)
+		'bond_events': list of bond events (bonds breaking and forming),
+		'strand_counts': StrandPairCounts, number of base pairs between strands in every frame,
+		'tile_events': (with tile_threshold) list of [time, strand1, action, strand2, base pairs],
+		'tile_summary': (with tile_threshold) summary of the tile bindings, see StrandPairCounts.summarize
 	}
 	"""
 	#print(f'input_file = {input_file}, trajectory_file = {trajectory_file}, topology_file = {topology_file}')
 	#print(f'include_starting_bonds = {include_starting_bonds}')
 
-	with open(trajectory_file, 'r') as f:
-		total_frames = f.read().count( 't = ' )
+	if method not in ('DNAnalysis', 'native'):
+		raise ValueError(f"unknown bond detection method '{method}'")
 
-	reader = LorenzoReader(trajectory_file, topology_file)
-	system = reader.get_system()
+	if not oxDNA_dir is None:
+		DNAnalysis = f'{oxDNA_dir}/build/bin/DNAnalysis'
+	else:
+		DNAnalysis = 'DNAnalysis'
 
-	if system == False:
+	debounce = get_debounce(make_cutoff, break_cutoff, min_dwell)
+	# pairs below the (loosest) cutoff are read from the frames
+	cutoff = H_CUTOFF if debounce is None else max(debounce[1], H_CUTOFF)
+
+	# everything but the trajectory that changes the bond events
+	options = {
+		"H_CUTOFF": H_CUTOFF,
+		"include_starting_bonds": include_starting_bonds,
+		"method": method,
+		"DNAnalysis": DNAnalysis if method == 'DNAnalysis' else None,
+		"watch": None if watch is None else np.unique(np.asarray(watch, np.int64)).tolist(),
+		"debounce": debounce
+	}
+	if window:
+		options["window"] = dict(window)
+	if watch_strands and watch is not None and method == 'DNAnalysis':
+		options["watch_strands"] = True
+
+	cache = get_cache(cache_dir)
+	if cache is not None:
+		key = cache.get_key([trajectory_file, topology_file, input_file], tile_threshold=tile_threshold, **options)
+		# with a checkpoint, the checkpoint gives the result (and is kept up to date), the cache is only written
+		output = None if checkpoint else cache.get(key)
+		if output is not None:
+			return output
+
+	# text (memory mapped) or binary trajectory, frames are only kept as arrays, no System is built for them
+	trajectory = open_trajectory(trajectory_file, topology_file)
+
+	if len(trajectory) == 0:
 		print("ERROR : Invalid trajectory file, no timesteps recorded")
 		sys.exit(1)
 
-	counter = 0
-	
-	temp_file = tempfile.NamedTemporaryFile()
+	# numbers of the frames analyzed, the chunks and the checkpoint count in this list
+	frames = range(len(trajectory)) if not window else trajectory.get_frame_numbers(**window).tolist()
+	total_frames = len(frames)
+	if total_frames == 0:
+		trajectory.close()
+		raise ValueError(f'no frames of {trajectory_file} in the window {window}')
 
-	max_time = 0
+	min_time = int(trajectory[frames[0]].time)
+
+	# frames already analyzed by a previous call
+	start = 0
 	bond_events = []
+	strand_counts = []
+	prev_bonds = pack_pairs([])
+	debouncer = None if debounce is None else BondDebouncer(min_dwell)
+	prev_levels = None
+	if checkpoint:
+		if checkpoint is True:
+			checkpoint = trajectory_file + CHECKPOINT_EXTENSION
+		options["files"] = [ file_digest(topology_file), file_digest(input_file) ]
+		state = load_checkpoint(checkpoint, trajectory, frames, options)
+		if state is not None:
+			start = state['frames']
+			bond_events = state['bond_events']
+			strand_counts = state['strand_counts']
+			prev_bonds = state['last_bonds']
+			debouncer = state['debouncer']
+			prev_levels = state['last_levels']
+			max_time = state['last_time']
+
 	strand_to_sequence, base_to_strand, strand_to_base = create_mappers(topology_file)
 
 	output = {
@@ -112,80 +179,538 @@ def analyze_bonds(input_file, trajectory_file, topology_file, include_starting_b
 		"str_seq": strand_to_sequence,
 		"nuc_str": base_to_strand,
 		"str_nuc": strand_to_base,
-		"min_time": system._time
+		"min_time": min_time
 	}
-		
-	# print_progress(0, total_frames, True)
+
+	if processes is None:
+		processes = os.cpu_count()
+	# a few chunks per process so that slow chunks don't leave processes idle
+	num_chunks = min(total_frames - start, 1 if processes <= 1 else 4 * processes)
+	bounds = [ start + (total_frames - start) * i // max(num_chunks, 1) for i in range(num_chunks + 1) ]
+	jobs = [ (input_file, trajectory_file, topology_file, DNAnalysis, frames[bounds[i]:bounds[i+1]], batch, method, watch, cutoff, debounce, options.get("watch_strands", False)) for i in range(num_chunks) ]
+
+	if num_chunks > 1:
+		pool = multiprocessing.Pool(processes)
+		results = pool.imap(analyze_chunk, jobs)
+	else:
+		pool = None
+		results = map(analyze_chunk, jobs)
+
+	# stitch the chunks together: the bonds changing between the last frame of a chunk
+	# and the first frame of the next one are logged before the events of the next chunk
+	try:
+		for i, chunk in enumerate(results):
+			if debouncer is not None:
+				# the debouncer is sequential, it goes through the level changes of all the frames here
+				if i == 0 and start == 0:
+					debouncer.reset(*chunk['first_levels'])
+					if include_starting_bonds:
+						log_changes(chunk['first_time'], pack_pairs([]), debouncer.get_bonds(), base_to_strand, bond_events)
+				else:
+					log_debounced(debouncer, chunk['first_time'], *level_changes(*prev_levels, *chunk['first_levels']), base_to_strand, bond_events)
+				for time, keys, levels in chunk['level_changes']:
+					log_debounced(debouncer, time, keys, levels, base_to_strand, bond_events)
+				prev_levels = chunk['last_levels']
+			elif i > 0 or start > 0 or include_starting_bonds:
+				log_changes(chunk['first_time'], prev_bonds, chunk['first_bonds'], base_to_strand, bond_events)
+			bond_events.extend(chunk['bond_events'])
+			strand_counts.extend(chunk['strand_counts'])
+			prev_bonds = chunk['last_bonds']
+			max_time = chunk['last_time'] # used to record ending timestamp
+	finally:
+		if pool is not None:
+			# also stops the workers still analyzing chunks when one of them failed
+			pool.terminate()
+			pool.join()
+
+	if checkpoint:
+		save_checkpoint(checkpoint, trajectory, frames, options, {
+			"frames": total_frames,
+			"bond_events": bond_events,
+			"strand_counts": strand_counts,
+			"last_bonds": prev_bonds,
+			"debouncer": debouncer,
+			"last_levels": prev_levels,
+			"last_time": max_time
+		})
+	trajectory.close()
+
+	output['max_time'] = max_time
+	output['time_step'] = (output['max_time'] - output['min_time']) / total_frames
+	output['bond_events'] = bond_events
+	output['strand_counts'] = StrandPairCounts.from_frames(strand_counts)
+
+	if tile_threshold is not None:
+		output['tile_events'] = output['strand_counts'].detect_bindings(tile_threshold, include_starting_bonds)
+		output['tile_summary'] = output['strand_counts'].summarize(tile_threshold, include_starting_bonds)
+
+	if cache is not None:
+		cache.put(key, output)
+
+	return output
+
+
+def frame_fingerprint(trajectory, k):
+	""" returns a digest of the contents of frame k of a trajectory """
+	if isinstance(trajectory, MappedTrajectory):
+		data = trajectory.get_raw(k)
+	else:
+		frame = trajectory[k]
+		data = np.concatenate(([frame.time], frame.box, frame.data.ravel())).tobytes()
+	return hashlib.sha256(data).hexdigest()
+
+
+def load_checkpoint(checkpoint, trajectory, frames, options):
+	""" returns the state saved in checkpoint if it was saved by an analysis with the same
+		options of the first frames (frame numbers) of trajectory, None otherwise
+	"""
+	try:
+		with open(checkpoint, 'rb') as f:
+			state = pickle.load(f)
+	except (OSError, pickle.PickleError, EOFError):
+		return None
+
+	done = state.get('frames', 0)
+	if state.get('version') != CHECKPOINT_VERSION or state.get('options') != options or not 0 < done <= len(frames):
+		return None
+	# the frames analyzed before must not have changed
+	if state['fingerprints'] != [ frame_fingerprint(trajectory, frames[0]), frame_fingerprint(trajectory, frames[done-1]) ]:
+		return None
+	return state
+
+
+def save_checkpoint(checkpoint, trajectory, frames, options, state):
+	state = dict(state, version=CHECKPOINT_VERSION, options=options,
+		fingerprints=[ frame_fingerprint(trajectory, frames[0]), frame_fingerprint(trajectory, frames[state['frames']-1]) ])
+
+	tmp_path = f'{checkpoint}.{os.getpid()}.tmp'
+	with open(tmp_path, 'wb') as f:
+		pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+	os.replace(tmp_path, checkpoint)
+
+
+def analyze_chunk(job):
+	""" computes the bond events between the frames (frame numbers, e.g. a range) of a trajectory
+
+		job -- (input_file, trajectory_file, topology_file, DNAnalysis, frames, batch, method,
+			watch, cutoff, debounce, watch_strands), with debounce None or (make_cutoff,
+			break_cutoff, min_dwell)
+
+		returns the time and bonds (packed pairs, see pack_pairs) of the first and last
+		frames of the chunk, the bond events between them and the (time, strand pairs, base
+		pairs) counts of every frame (see tiles.count_strand_pairs). When debouncing, the
+		levels (see debounce.py) of the first and last frames and the (time, pairs, levels)
+		changes of the frames between them instead of the bond events
+	"""
+	debounce = job[9]
+	base_to_strand = create_mappers(job[2])[1]
+	nucleotide_to_strand = load_topology(job[2]).strand_ids
+
+	chunk = { "bond_events": [], "strand_counts": [], "level_changes": [] }
+	prev_bonds = None
+	prev_levels = None
+
+	for time, keys, energies in iter_bond_states(job):
+		current_bonds = keys[energies < H_CUTOFF]
+		chunk['strand_counts'].append((time,) + count_strand_pairs(current_bonds, nucleotide_to_strand))
+
+		if debounce is not None:
+			levels = get_levels(energies, debounce[0], debounce[1])
+			current_levels = (keys[levels > 0], levels[levels > 0])
+			if prev_levels is None:
+				chunk['first_levels'] = current_levels
+			else:
+				chunk['level_changes'].append((time,) + level_changes(*prev_levels, *current_levels))
+			prev_levels = current_levels
+
+		if prev_bonds is None:
+			chunk['first_time'] = time
+			chunk['first_bonds'] = current_bonds
+		elif debounce is None:
+			log_changes(time, prev_bonds, current_bonds, base_to_strand, chunk['bond_events'])
+
+		prev_bonds = current_bonds
+
+	chunk['last_time'] = time
+	chunk['last_bonds'] = prev_bonds
+	chunk['last_levels'] = prev_levels
+
+	return chunk
+
+
+def iter_bond_states(job):
+	""" yields the time, bonds (packed pairs, see pack_pairs) and HB energies of the bonds of
+		the frames (frame numbers) of a trajectory, as they are computed
+
+		job -- (input_file, trajectory_file, topology_file, DNAnalysis, frames, batch, method,
+			watch, cutoff[, debounce, watch_strands]), pairs with an HB energy below cutoff are bonds
+	"""
+	input_file, trajectory_file, topology_file, DNAnalysis, frames, batch, method, watch, cutoff = job[:9]
+	watch_strands = len(job) > 10 and job[10]
+
+	trajectory = open_trajectory(trajectory_file, topology_file)
+	topology = load_topology(topology_file)
+
+	watched = None if watch is None else np.unique(np.asarray(watch, np.int64))
+
+	selection = None
+	if method == 'native':
+		detector = HBondDetector(topology, get_hydr_eps(input_file))
+		frames_bonds = ( pack_energies(*detector.get_H_bond_energies(trajectory[k], watched, cutoff)) for k in frames )
+	else:
+		rows = np.arange(topology.N)
+		if watch_strands and watched is not None:
+			# DNAnalysis gets a system of the strands of the watched nucleotides, renumbered
+			rows = topology.get_strand_rows(np.unique(topology.strand_ids[watched]))
+			topology = topology.select(rows)
+			topology_temp_file = tempfile.NamedTemporaryFile(suffix='.top')
+			topology.write(topology_temp_file.name)
+			selection = (rows, topology, topology_temp_file.name)
+		if batch:
+			frames_output = run_DNAnalysis_batch(DNAnalysis, input_file, trajectory, frames, selection)
+		else:
+			frames_output = run_DNAnalysis_per_frame(DNAnalysis, input_file, trajectory, frames, selection)
+		nucleotide_to_strand = topology.strand_ids
+		# rows is sorted, the pairs keep i < j in the numbering of the whole system
+		frames_bonds = ( (rows[np.asarray(pairs, np.int64).reshape(-1, 2)], energies) for pairs, energies in
+			(read_H_bond_energies(lines, nucleotide_to_strand, cutoff) for lines in frames_output) )
+		frames_bonds = ( pack_energies(pairs, energies) for pairs, energies in frames_bonds )
+		if watched is not None:
+			frames_bonds = ( keep_watched(bonds, energies, watched) for bonds, energies in frames_bonds )
+
+	n = 0
+	try:
+		for current_bonds, energies in frames_bonds:
+			if n == len(frames):
+				break
+			yield int(trajectory[frames[n]].time), current_bonds, energies
+			n += 1
+	finally:
+		frames_bonds.close()
+		trajectory.close()
+		if selection is not None:
+			topology_temp_file.close()
+
+	if n != len(frames):
+		raise RuntimeError(f'DNAnalysis returned {n} of the {len(frames)} configurations starting at frame {frames[0]} of {trajectory_file}')
+
+
+def iter_frame_bond_states(frames, input_file, topology_file, watch=None, cutoff=H_CUTOFF):
+	""" same as iter_bond_states (native method) for the Frames of an iterable """
+	detector = HBondDetector(load_topology(topology_file), get_hydr_eps(input_file))
+	watched = None if watch is None else np.unique(np.asarray(watch, np.int64))
+
+	try:
+		for frame in frames:
+			yield (int(frame.time),) + pack_energies(*detector.get_H_bond_energies(frame, watched, cutoff))
+	finally:
+		if hasattr(frames, 'close'):
+			frames.close()
+
+
+def get_debounce(make_cutoff=None, break_cutoff=None, min_dwell=1):
+	""" returns the (make_cutoff, break_cutoff, min_dwell) debouncing of the bond events
+		(see analyze_bonds), or None without any
+	"""
+	if make_cutoff is None and break_cutoff is None and min_dwell <= 1:
+		return None
+	make_cutoff = H_CUTOFF if make_cutoff is None else make_cutoff
+	break_cutoff = max(make_cutoff, H_CUTOFF) if break_cutoff is None else break_cutoff
+	if break_cutoff < make_cutoff:
+		raise ValueError(f'break_cutoff ({break_cutoff}) must be at least make_cutoff ({make_cutoff})')
+	return (make_cutoff, break_cutoff, min_dwell)
+
+
+def iter_bond_events(input_file, trajectory_file, topology_file, include_starting_bonds=False, oxDNA_dir=None, batch=True, method='DNAnalysis', watch=None, stop=None, window=None, frames=None, make_cutoff=None, break_cutoff=None, min_dwell=1, watch_strands=False):
+	""" same analysis as analyze_bonds, but yields the results frame by frame as they are
+		computed instead of returning them at the end of the trajectory
+
+		yields (time, bonds, bond_events) for every frame, with bonds the packed pairs
+		(see pack_pairs, unpack_pairs) bonded in the frame and bond_events the list of
+		events (same format as in analyze_bonds) since the previous frame
+
+		watch, watch_strands -- only the bonds of the nucleotides of these pairs, see analyze_bonds
+
+		stop -- function called as stop(time, bonds, bond_events) after each frame, the
+			analysis ends (without reading the rest of the trajectory) when it returns True.
+			Breaking out of the loop over the generator works too
+
+		window -- only these frames, see analyze_bonds
+
+		frames -- iterable of Frames to analyze instead of reading trajectory_file, e.g. a
+			TrajectoryFollower (follow.py) yielding the frames while oxDNA writes them, so
+			the analysis and the stop condition run during the simulation. Native method only
+
+		make_cutoff, break_cutoff, min_dwell -- debouncing of the bond events, see analyze_bonds.
+			bonds are then the debounced bonds, and a transition is yielded with the frame that
+			confirms it (min_dwell-1 frames after the time of its events)
+	"""
+	if method not in ('DNAnalysis', 'native'):
+		raise ValueError(f"unknown bond detection method '{method}'")
 
 	if not oxDNA_dir is None:
 		DNAnalysis = f'{oxDNA_dir}/build/bin/DNAnalysis'
 	else:
 		DNAnalysis = 'DNAnalysis'
 
+	debounce = get_debounce(make_cutoff, break_cutoff, min_dwell)
+	cutoff = H_CUTOFF if debounce is None else max(debounce[1], H_CUTOFF)
+
+	base_to_strand = create_mappers(topology_file)[1]
+	if frames is not None:
+		if method != 'native':
+			raise ValueError("frames can only be analyzed with method='native'")
+		states = iter_frame_bond_states(frames, input_file, topology_file, watch, cutoff)
+	else:
+		with open_trajectory(trajectory_file, topology_file) as trajectory:
+			frame_numbers = range(len(trajectory)) if not window else trajectory.get_frame_numbers(**window).tolist()
+		states = iter_bond_states((input_file, trajectory_file, topology_file, DNAnalysis, frame_numbers, batch, method, watch, cutoff, None, watch_strands))
+
+	prev_bonds = None
+	debouncer = None if debounce is None else BondDebouncer(debounce[2])
+	prev_levels = None
+	try:
+		for time, keys, energies in states:
+			bond_events = []
+			if debouncer is None:
+				current_bonds = keys
+				if prev_bonds is not None or include_starting_bonds:
+					log_changes(time, pack_pairs([]) if prev_bonds is None else prev_bonds, current_bonds, base_to_strand, bond_events)
+			else:
+				levels = get_levels(energies, debounce[0], debounce[1])
+				current_levels = (keys[levels > 0], levels[levels > 0])
+				if prev_levels is None:
+					debouncer.reset(*current_levels)
+					if include_starting_bonds:
+						log_changes(time, pack_pairs([]), debouncer.get_bonds(), base_to_strand, bond_events)
+				else:
+					log_debounced(debouncer, time, *level_changes(*prev_levels, *current_levels), base_to_strand, bond_events)
+				prev_levels = current_levels
+				current_bonds = debouncer.get_bonds()
+			prev_bonds = current_bonds
+
+			yield time, current_bonds, bond_events
+
+			if stop is not None and stop(time, current_bonds, bond_events):
+				break
+	finally:
+		# stops DNAnalysis if the rest of the trajectory is not needed
+		states.close()
+
+
+def get_DNAnalysis_args(DNAnalysis, input_file, trajectory_file, topology_file=None):
 	args = [
 		DNAnalysis,
 		input_file,
-		f'trajectory_file={temp_file.name}', 
+		f'trajectory_file={trajectory_file}', 
 		'analysis_data_output_1 = { \n name = stdout \n print_every = 1 \n col_1 = { \n type=pair_energy \n} \n}'
 	]
+	if topology_file is not None:
+		args.append(f'topology={topology_file}')
+	return args
 
-	prev_bonds = []
 
-	while system != False:
+def run_DNAnalysis_batch(DNAnalysis, input_file, trajectory, frames, selection=None):
+	""" runs DNAnalysis once over the frames (frame numbers) of trajectory
+		and yields the pair_energy output lines of each frame as it is printed
 
-
-		system.map_nucleotides_to_strands()
-		system.print_lorenzo_output(temp_file.name, '/dev/null')
-		
+		selection -- (rows, Topology, topology file) to only give DNAnalysis these rows of
+			the frames, with the topology (file) of the selection
+	"""
+	temp_file = None
+	contiguous = isinstance(frames, range) and frames.step == 1 and len(frames) > 0
+	if isinstance(trajectory, MappedTrajectory) and contiguous and frames.start == 0 and frames.stop == len(trajectory) and selection is None:
+		# the whole text trajectory, DNAnalysis can read it directly
+		trajectory_file = trajectory.path
+	else:
+		temp_file = tempfile.NamedTemporaryFile()
+		if selection is not None:
+			for k in frames:
+				trajectory[k].select(selection[0], selection[1]).write(temp_file)
+		elif isinstance(trajectory, MappedTrajectory):
+			# text frames are copied as they were read, without formatting floats
+			if contiguous:
+				temp_file.write(trajectory.get_raw(frames.start, frames.stop))
+			else:
+				for k in frames:
+					temp_file.write(trajectory.get_raw(k))
+		else:
+			for k in frames:
+				trajectory[k].write(temp_file)
 		temp_file.flush()
-		
-		myinput = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-		stdout, stderr = myinput.communicate()
-		
-		system.read_H_bonds(stdout.decode('utf-8').split('\n')[:-1])
-		current_bonds = system.get_H_interactions_nucleotides()
-
-		# if list of bonded nucleoties changes
-		if current_bonds != prev_bonds and (counter > 0 or include_starting_bonds):
-		
-			# append all broken bonds to bond_events
-			[ log(system, x, 'BREAK', base_to_strand, bond_events) for x in prev_bonds if x not in current_bonds ]
+		trajectory_file = temp_file.name
+
+	args = get_DNAnalysis_args(DNAnalysis, input_file, trajectory_file, None if selection is None else selection[2])
+
+	with tempfile.TemporaryFile() as stderr:
+		myinput = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=stderr, universal_newlines=True)
+		try:
+			yield from split_frames(myinput.stdout)
+		except GeneratorExit:
+			# the rest of the output is not needed (early stop)
+			myinput.kill()
+			raise
+		finally:
+			myinput.stdout.close()
+			myinput.wait()
+			if temp_file is not None:
+				temp_file.close()
+
+		if myinput.returncode != 0:
+			stderr.seek(0)
+			raise RuntimeError(f'{DNAnalysis} failed on {trajectory_file}:\n' + stderr.read().decode('utf-8', 'replace'))
+
+
+def run_DNAnalysis_per_frame(DNAnalysis, input_file, trajectory, frames, selection=None):
+	""" runs DNAnalysis once for each of the frames (frame numbers) of trajectory
+		(slow, for oxDNA versions whose DNAnalysis can't handle whole trajectories)
+		and yields the pair_energy output lines of each frame
+
+		selection -- only these rows of the frames, see run_DNAnalysis_batch
+	"""
+	with tempfile.NamedTemporaryFile() as temp_file:
+		args = get_DNAnalysis_args(DNAnalysis, input_file, temp_file.name, None if selection is None else selection[2])
+
+		for k in frames:
+			temp_file.seek(0)
+			temp_file.truncate()
+			frame = trajectory[k]
+			if selection is not None:
+				frame = frame.select(selection[0], selection[1])
+			frame.write(temp_file)
+			temp_file.flush()
 			
-			# append all newly formed bonds to bond_events
-			[ log(system, x, 'BINDS', base_to_strand, bond_events) for x in current_bonds if x not in prev_bonds ]
-		
-		prev_bonds = current_bonds
-		max_time = system._time # used to record ending timestamp before system becomes False
-		system = reader.get_system()
-		counter += 1
-		
-		# print_progress(counter, total_frames)
+			myinput = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+			stdout, stderr = myinput.communicate()
+			if myinput.returncode != 0:
+				raise subprocess.CalledProcessError(myinput.returncode, args, stdout, stderr)
 
-	output['max_time'] = max_time
-	output['time_step'] = (output['max_time'] - output['min_time']) / counter
-	output['bond_events'] = bond_events
+			yield stdout.decode('utf-8').split('\n')[:-1]
 
-	return output
 
+def split_frames(lines):
+	""" splits the pair_energy output of DNAnalysis at the frame headers (comment lines
+		with the time, e.g. '#id1 id2 ... total, t = 100', as in System.read_H_bonds),
+		yields the list of lines of each frame
+	"""
+	frame = None
+	for line in lines:
+		if len(line) and line[0] == '#' and 't = ' in line:
+			if frame is not None:
+				yield frame
+			frame = []
+		elif frame is not None:
+			frame.append(line)
+
+	if frame is not None:
+		yield frame
+
+
+def pack_pairs(pairs):
+	""" returns the sorted array of int64 keys (i << 32 | j) of a list or (n, 2) array of [i, j] pairs """
+	pairs = np.asarray(pairs, np.int64).reshape(-1, 2)
+	return np.unique((pairs[:, 0] << 32) | pairs[:, 1])
+
+
+def pack_energies(pairs, energies):
+	""" same as pack_pairs, also returns the energies of the pairs in the same order """
+	pairs = np.asarray(pairs, np.int64).reshape(-1, 2)
+	keys, first = np.unique((pairs[:, 0] << 32) | pairs[:, 1], return_index=True)
+	return keys, np.asarray(energies, float)[first]
+
+
+def keep_watched(keys, energies, nucleotides):
+	""" returns the packed pairs with at least one of the (sorted) nucleotides, and their energies """
+	pairs = unpack_pairs(keys)
+	keep = np.isin(pairs[:, 0], nucleotides) | np.isin(pairs[:, 1], nucleotides)
+	return keys[keep], energies[keep]
+
+
+def unpack_pairs(keys):
+	""" returns the (n, 2) array of [i, j] pairs of packed keys """
+	return np.stack((keys >> 32, keys & 0xffffffff), axis=1)
+
+
+def log_changes(time, prev_bonds, current_bonds, base_to_strand, bond_events):
+	""" records the bonds broken and formed between two frames in bond_events
+
+		prev_bonds, current_bonds -- sorted packed pairs (see pack_pairs)
+	"""
+	
+	# both arrays are sorted and unique, so the differences are linear merges
+	broken = np.setdiff1d(prev_bonds, current_bonds, assume_unique=True)
+	formed = np.setdiff1d(current_bonds, prev_bonds, assume_unique=True)
+
+	# append all broken bonds to bond_events
+	[ log(time, x, 'BREAK', base_to_strand, bond_events) for x in unpack_pairs(broken).tolist() ]
+	
+	# append all newly formed bonds to bond_events
+	[ log(time, x, 'BINDS', base_to_strand, bond_events) for x in unpack_pairs(formed).tolist() ]
+
+
+def log_debounced(debouncer, time, keys, levels, base_to_strand, bond_events):
+	""" applies the level changes of a frame to a BondDebouncer and records the
+		transitions it confirms in bond_events
+	"""
+	transition_time, broken, formed = debouncer.update(time, keys, levels)
+	if transition_time is None:
+		return
+
+	[ log(transition_time, x, 'BREAK', base_to_strand, bond_events) for x in unpack_pairs(broken).tolist() ]
+	[ log(transition_time, x, 'BINDS', base_to_strand, bond_events) for x in unpack_pairs(formed).tolist() ]
+
+
+def read_H_bonds(lines, nucleotide_to_strand):
+	""" returns the list of [i, j] (i < j) hydrogen bonded nucleotides found in the
+		pair_energy output of DNAnalysis, in the same order as
+		System.read_H_bonds + System.get_H_interactions_nucleotides
+
+		nucleotide_to_strand -- strand of each nucleotide, used to skip bonded neighbours
+	"""
+	return read_H_bond_energies(lines, nucleotide_to_strand)[0]
+
+
+def read_H_bond_energies(lines, nucleotide_to_strand, cutoff=H_CUTOFF):
+	""" same as read_H_bonds, also returns the HB energies of the bonds,
+		pairs with an HB energy below cutoff are bonded
+	"""
+	bonds = []
+	energies = []
+	for line in lines:
+		vals = line.split()
+		if len(vals) > 6 and line[0] != '#':
+			energy = float(vals[INT_HYDR+2])
+			if energy >= cutoff:
+				continue
+			i, j = int(vals[0]), int(vals[1])
+			if i > j:
+				i, j = j, i
+			if i != j and ( j-i != 1 or nucleotide_to_strand[i] != nucleotide_to_strand[j] ):
+				bonds.append([i, j])
+				energies.append(energy)
+	
+	# stable sort keeps the order in which bonds of the same nucleotide were read
+	order = sorted(range(len(bonds)), key=lambda x: bonds[x][0])
+	return [ bonds[x] for x in order ], [ energies[x] for x in order ]
 
 
-def log(system, bond_pair, action, base_to_strand, bond_events):
+def log(time, bond_pair, action, base_to_strand, bond_events):
 	""" records bond event in bond_events 
 		only records the event if from a separate strand
 	"""
-	if system != None and bond_pair != None and base_to_strand != None:
-		event = get_event(system, bond_pair, action, base_to_strand)
+	if time != None and bond_pair != None and base_to_strand != None:
+		event = get_event(time, bond_pair, action, base_to_strand)
 		if event[2] != event[-1]: # if different strands
 			bond_events.append(event)
 		# print( '\t\t'.join( [str(x) for x in event] ))
 
 
-def get_event(system, bond_pair, action, base_to_strand):
+def get_event(time, bond_pair, action, base_to_strand):
 	n1 = int(bond_pair[0])
 	n2 = int(bond_pair[1])
 
 	# time, nucleotide1, strand1, action, nucleotide2, strand2
-	return [ system._time, n1, base_to_strand[n1][0], action, n2, base_to_strand[n2][0] ]
+	return [ time, n1, base_to_strand[n1][0], action, n2, base_to_strand[n2][0] ]
 
 
 
@@ -193,11 +718,13 @@ def get_event(system, bond_pair, action, base_to_strand):
 
 if __name__ == '__main__':
 
-	if (len(sys.argv) < 3):
-		print(f'Usage: python {sys.argv[0]} <input> <trajectory> <topology>')
+	if (len(sys.argv) < 4):
+		print(f'Usage: python {sys.argv[0]} <input> <trajectory> <topology> [processes] [DNAnalysis|native]')
 		sys.exit()
 
-	data = analyze_bonds(input_file=sys.argv[1], trajectory_file=sys.argv[2], topology_file=sys.argv[3])
+	processes = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+	method = sys.argv[5] if len(sys.argv) > 5 else 'DNAnalysis'
+	data = analyze_bonds(input_file=sys.argv[1], trajectory_file=sys.argv[2], topology_file=sys.argv[3], processes=processes, method=method)
 
-	with open('bond_data.json','w') as f:
-		json.dump(data, f)
+	# events and min/max time, reload with BondEventStore.load
+	BondEventStore.from_bond_data(data).save('bond_data.npz')
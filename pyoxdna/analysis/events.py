@@ -0,0 +1,140 @@
+"""
+Columnar store of the bond events found by analyze_bonds
+
+the events (time, nucleotide1, strand1, action, nucleotide2, strand2) are kept
+as one numpy array per column and saved in a .npz file together with the
+sorted indexes (argsorts) of the time, strand and nucleotide columns, so the
+queries are binary searches instead of scans of the whole list.
+"""
+import json
+import numpy as np
+
+# action codes of the action column
+ACTIONS = ["BREAK", "BINDS"]
+BREAK = 0
+BINDS = 1
+
+COLUMNS = ("time", "n1", "s1", "action", "n2", "s2")
+INDEXES = ("time", "n1", "n2", "s1", "s2")
+
+
+class BondEventStore:
+    """
+    Bond events as columns: time (int64), n1, s1, n2, s2 (int32) and action (int8,
+    BREAK or BINDS)
+
+    info --- dictionary saved with the events (e.g. min_time, max_time, time_step)
+    """
+
+    def __init__(self, time, n1, s1, action, n2, s2, info=None, indexes=None):
+        self.time = np.asarray(time, np.int64)
+        self.n1 = np.asarray(n1, np.int32)
+        self.s1 = np.asarray(s1, np.int32)
+        self.action = np.asarray(action, np.int8)
+        self.n2 = np.asarray(n2, np.int32)
+        self.s2 = np.asarray(s2, np.int32)
+        self.info = info if info is not None else {}
+        self._indexes = {}
+        self._sorted = {}
+        for column, index in (indexes or {}).items():
+            self._set_index(column, np.asarray(index, np.int64))
+
+    @classmethod
+    def from_events(cls, bond_events, info=None):
+        """ builds the store from the bond_events list of analyze_bonds """
+        if len(bond_events) == 0:
+            return cls([], [], [], [], [], [], info)
+        time, n1, s1, action, n2, s2 = zip(*bond_events)
+        return cls(time, n1, s1, [ACTIONS.index(a) for a in action], n2, s2, info)
+
+    @classmethod
+    def from_bond_data(cls, bond_data):
+        """ builds the store from the output of analyze_bonds """
+        info = {key: bond_data[key] for key in ("min_time", "max_time", "time_step", "num_nuc", "num_str") if key in bond_data}
+        return cls.from_events(bond_data["bond_events"], info)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            columns = [f[c] for c in COLUMNS]
+            info = json.loads(str(f["info"])) if "info" in f else {}
+            indexes = {c: f["index_" + c] for c in INDEXES if "index_" + c in f}
+        return cls(*columns, info=info, indexes=indexes)
+
+    def save(self, path, compressed=True):
+        """ saves the columns, their sorted indexes and info to a .npz file """
+        arrays = {c: getattr(self, c) for c in COLUMNS}
+        arrays.update({"index_" + c: self.get_index(c) for c in INDEXES})
+        arrays["info"] = np.array(json.dumps(self.info))
+        with open(path, "wb") as f:
+            (np.savez_compressed if compressed else np.savez)(f, **arrays)
+
+    def __len__(self):
+        return len(self.time)
+
+    def _set_index(self, column, index):
+        # the sorted values are kept with the index, a query is only the binary searches
+        self._indexes[column] = index
+        self._sorted[column] = getattr(self, column)[index]
+
+    def get_index(self, column):
+        """ returns the positions of the events sorted by column (stable, so ties keep their order) """
+        if column not in self._indexes:
+            self._set_index(column, np.argsort(getattr(self, column), kind="stable").astype(np.int64))
+        return self._indexes[column]
+
+    def _find(self, column, lo=None, hi=None):
+        """ returns the (unsorted) positions of the events with lo <= column <= hi """
+        index = self.get_index(column)
+        values = self._sorted[column]
+        start = 0 if lo is None else np.searchsorted(values, lo, side="left")
+        stop = len(values) if hi is None else np.searchsorted(values, hi, side="right")
+        return index[start:stop]
+
+    def select(self, positions):
+        """ returns a store with the events at positions (in the order of the store) """
+        positions = np.sort(positions)
+        return BondEventStore(*(getattr(self, c)[positions] for c in COLUMNS), info=self.info)
+
+    def query(self, strand=None, nucleotides=None, t_start=None, t_stop=None, action=None):
+        """ returns a store with the matching events, all the criteria are optional
+
+            strand --- events involving this strand (as strand1 or strand2)
+
+            nucleotides --- (first, last) events involving a nucleotide in this range
+
+            t_start, t_stop --- events with t_start <= time <= t_stop
+
+            action --- 'BINDS' or 'BREAK' (or BINDS, BREAK)
+        """
+        positions = None
+
+        def intersect(found):
+            return found if positions is None else np.intersect1d(positions, found, assume_unique=True)
+
+        if t_start is not None or t_stop is not None:
+            positions = intersect(self._find("time", t_start, t_stop))
+        if strand is not None:
+            positions = intersect(np.union1d(self._find("s1", strand, strand), self._find("s2", strand, strand)))
+        if nucleotides is not None:
+            lo, hi = nucleotides
+            positions = intersect(np.union1d(self._find("n1", lo, hi), self._find("n2", lo, hi)))
+        if positions is None:
+            positions = np.arange(len(self))
+        if action is not None:
+            code = ACTIONS.index(action) if isinstance(action, str) else action
+            positions = positions[self.action[positions] == code]
+
+        return self.select(positions)
+
+    def get_strands(self):
+        """ returns the sorted strand numbers involved in the events """
+        return np.union1d(self.s1, self.s2)
+
+    def to_events(self):
+        """ returns the events as the bond_events list of analyze_bonds """
+        return [[t, n1, s1, ACTIONS[a], n2, s2] for t, n1, s1, a, n2, s2 in
+                zip(*(getattr(self, c).tolist() for c in COLUMNS))]
+
+    def __iter__(self):
+        return iter(self.to_events())
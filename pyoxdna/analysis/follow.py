@@ -0,0 +1,177 @@
+"""
+Following a trajectory while oxDNA is still writing it
+
+oxDNA appends the frames of trajectory.dat as the simulation runs. A
+TrajectoryFollower reads what has been appended since the last poll and
+yields the frames once they are complete, keeping the partially written
+frame at the end of the file for the next poll. When the file is truncated
+or replaced by a new one (a new run writing to the same path) the follower
+starts again from the beginning of the new file.
+"""
+import os
+import time
+import numpy as np
+
+from .readers import Frame
+from .topology import load_topology
+
+# bytes read at most per poll
+READ_SIZE = 1 << 26
+
+
+class TrajectoryFollower:
+    """
+    Yields the frames of a trajectory as they are written
+
+    trajectory --- path to the trajectory file, it doesn't need to exist yet
+
+    topology --- path to the topology file. With it a frame is complete once all its
+        lines are written, without it only once the next frame starts (or the writer
+        has stopped, see follow)
+
+    poll_interval --- seconds between two reads of the file when no frame is complete
+    """
+
+    def __init__(self, trajectory, topology=None, poll_interval=1.):
+        self.path = trajectory
+        self._topology = load_topology(topology) if topology is not None else None
+        self.poll_interval = poll_interval
+
+        self.frames = 0 # frames yielded
+        self.rotations = 0 # times the file was truncated or replaced
+        self._file = None
+        self._inode = None
+        self._read = 0 # bytes of the current file read
+        self._buffer = b""
+        self._lines = None # lines of the last frame, without topology
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _restart(self, f, inode):
+        self.close()
+        self._file = f
+        self._inode = inode
+        self._read = 0
+        self._buffer = b""
+
+    def _check_file(self):
+        """ (re)opens the file when it appears, is truncated or is replaced, returns
+            the last frames of the file it was reading when it was replaced
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return [] # not created yet, or being replaced: keep reading the old one
+
+        frames = []
+        if self._file is None or stat.st_ino != self._inode:
+            try:
+                f = open(self.path, "rb")
+            except FileNotFoundError:
+                return []
+            if self._file is not None:
+                # the rest of the old file is read before switching
+                frames = self._split(self._buffer + self._file.read(), True)
+                self.rotations += 1
+            self._restart(f, os.fstat(f.fileno()).st_ino)
+        elif stat.st_size < self._read:
+            frames = self._split(self._buffer, True)
+            self.rotations += 1
+            self._file.seek(0)
+            self._read = 0
+            self._buffer = b""
+        return frames
+
+    def _frame_end(self, buffer, start, final):
+        """ returns the end of the frame starting at start in buffer if it is complete, None otherwise """
+        end = buffer.find(b"\nt = ", start + 1)
+        if end >= 0:
+            if self._topology is None:
+                self._lines = buffer.count(b"\n", start, end + 1)
+            return end + 1
+
+        if self._topology is not None:
+            newlines = np.flatnonzero(np.frombuffer(buffer, np.uint8, offset=start) == ord("\n"))
+            lines = 3 + self._topology.N
+            if len(newlines) >= lines:
+                return start + int(newlines[lines - 1]) + 1
+        elif final and buffer.endswith(b"\n"):
+            # as many lines as the frame before it, if there was one
+            lines = buffer.count(b"\n", start)
+            if lines >= 3 and self._lines in (None, lines):
+                return len(buffer)
+        return None
+
+    def _split(self, buffer, final):
+        """ returns the complete frames at the beginning of buffer, the rest is kept in self._buffer """
+        frames = []
+        start = 0
+        while start < len(buffer):
+            end = self._frame_end(buffer, start, final)
+            if end is None:
+                break
+            frames.append(Frame.from_text(buffer[start:end], self._topology))
+            start = end
+        self._buffer = buffer[start:]
+        return frames
+
+    def read_frames(self, final=False):
+        """ returns the frames completed since the last call
+
+            final --- the writer has stopped, a last frame without the next one
+                after it is complete if it ends with a newline (and, without topology,
+                has as many lines as the frame before it)
+        """
+        frames = self._check_file()
+        if self._file is not None:
+            data = self._file.read(READ_SIZE)
+            self._read += len(data)
+            # only the end of the file is the end of the last frame
+            frames += self._split(self._buffer + data, final and len(data) < READ_SIZE)
+        self.frames += len(frames)
+        return frames
+
+    def follow(self, is_running=None, timeout=None):
+        """ yields the frames as they are written, until is_running() returns False (the
+            frames written until then are yielded first) or nothing new is written for
+            timeout seconds. Without either it never stops, break out of the loop
+        """
+        last_change = time.monotonic()
+        while True:
+            # checked before reading, what was written before the writer stopped is read
+            running = is_running is None or is_running()
+            size = self._read
+            frames = self.read_frames(not running)
+            yield from frames
+
+            more = self._read - size >= READ_SIZE # the end of the file is not read yet
+            if frames or self._read != size:
+                last_change = time.monotonic()
+            if more:
+                continue
+            if not running:
+                return
+            if timeout is not None and time.monotonic() - last_change > timeout:
+                return
+            time.sleep(self.poll_interval)
+
+    def __iter__(self):
+        return self.follow()
+
+
+def follow_trajectory(trajectory, topology=None, poll_interval=1., is_running=None, timeout=None):
+    """ yields the frames of a trajectory as they are written, see TrajectoryFollower.follow """
+    with TrajectoryFollower(trajectory, topology, poll_interval) as follower:
+        yield from follower.follow(is_running, timeout)
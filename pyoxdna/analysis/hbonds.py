@@ -0,0 +1,181 @@
+"""
+Hydrogen bonding term of the oxDNA model computed with numpy, without DNAnalysis
+
+the energy of a pair of complementary nucleotides (btype_i + btype_j == 3) is
+
+    f1(r_hydro) * f4(theta1) * f4(theta2) * f4(theta3) * f4(theta4) * f4(theta7) * f4(theta8)
+
+with the (sequence averaged) constants of model.h, as in DNAInteraction::_hydrogen_bonding.
+f1 is only non zero for base-base distances below HYDR_RCHIGH, so it is only
+evaluated on the pairs found with a cell list of the base sites (neighbors.py).
+"""
+import numpy as np
+from .neighbors import find_pairs, find_pairs_between
+from .topology import as_topology
+from .base import H_CUTOFF, POS_BASE
+from .base import (HYDR_EPS_OXDNA, HYDR_EPS_OXDNA2, HYDR_A, HYDR_RC, HYDR_R0, HYDR_BLOW, HYDR_BHIGH,
+                   HYDR_RLOW, HYDR_RHIGH, HYDR_RCLOW, HYDR_RCHIGH)
+from .base import (HYDR_THETA1_A, HYDR_THETA1_B, HYDR_THETA1_T0, HYDR_THETA1_TS, HYDR_THETA1_TC,
+                   HYDR_THETA2_A, HYDR_THETA2_B, HYDR_THETA2_T0, HYDR_THETA2_TS, HYDR_THETA2_TC,
+                   HYDR_THETA3_A, HYDR_THETA3_B, HYDR_THETA3_T0, HYDR_THETA3_TS, HYDR_THETA3_TC,
+                   HYDR_THETA4_A, HYDR_THETA4_B, HYDR_THETA4_T0, HYDR_THETA4_TS, HYDR_THETA4_TC,
+                   HYDR_THETA7_A, HYDR_THETA7_B, HYDR_THETA7_T0, HYDR_THETA7_TS, HYDR_THETA7_TC,
+                   HYDR_THETA8_A, HYDR_THETA8_B, HYDR_THETA8_T0, HYDR_THETA8_TS, HYDR_THETA8_TC)
+
+# (A, B, T0, TS, TC) of the angular modulations
+HYDR_THETA1 = (HYDR_THETA1_A, HYDR_THETA1_B, HYDR_THETA1_T0, HYDR_THETA1_TS, HYDR_THETA1_TC)
+HYDR_THETA2 = (HYDR_THETA2_A, HYDR_THETA2_B, HYDR_THETA2_T0, HYDR_THETA2_TS, HYDR_THETA2_TC)
+HYDR_THETA3 = (HYDR_THETA3_A, HYDR_THETA3_B, HYDR_THETA3_T0, HYDR_THETA3_TS, HYDR_THETA3_TC)
+HYDR_THETA4 = (HYDR_THETA4_A, HYDR_THETA4_B, HYDR_THETA4_T0, HYDR_THETA4_TS, HYDR_THETA4_TC)
+HYDR_THETA7 = (HYDR_THETA7_A, HYDR_THETA7_B, HYDR_THETA7_T0, HYDR_THETA7_TS, HYDR_THETA7_TC)
+HYDR_THETA8 = (HYDR_THETA8_A, HYDR_THETA8_B, HYDR_THETA8_T0, HYDR_THETA8_TS, HYDR_THETA8_TC)
+
+
+def get_hydr_eps(input_file=None):
+    """ returns the HB strength of the interaction_type set in an oxDNA input file (DNA by default) """
+    interaction_type = "DNA"
+    if input_file is not None:
+        with open(input_file, "r") as f:
+            for line in f:
+                key, _, value = line.partition("#")[0].partition("=")
+                if key.strip() == "interaction_type":
+                    interaction_type = value.strip()
+
+    if interaction_type.startswith("DNA2"):
+        return HYDR_EPS_OXDNA2
+    return HYDR_EPS_OXDNA
+
+
+def f1(r, eps):
+    """ radial part of the HB term (Morse potential smoothed at both ends) """
+    shift = eps * (1. - np.exp(-(HYDR_RC - HYDR_R0) * HYDR_A))**2
+    val = np.zeros_like(r)
+
+    high = (r > HYDR_RHIGH) & (r < HYDR_RCHIGH)
+    val[high] = eps * HYDR_BHIGH * (r[high] - HYDR_RCHIGH)**2
+
+    mid = (r > HYDR_RLOW) & (r <= HYDR_RHIGH)
+    val[mid] = eps * (1. - np.exp(-(r[mid] - HYDR_R0) * HYDR_A))**2 - shift
+
+    low = (r > HYDR_RCLOW) & (r <= HYDR_RLOW)
+    val[low] = eps * HYDR_BLOW * (r[low] - HYDR_RCLOW)**2
+
+    return val
+
+
+def f4(cost, params):
+    """ angular modulation of the HB term, cost is the cosine of the angle """
+    A, B, T0, TS, TC = params
+    t = np.abs(np.arccos(np.clip(cost, -1., 1.)) - T0)
+    val = np.zeros_like(t)
+
+    smooth = (t > TS) & (t < TC)
+    val[smooth] = B * (TC - t[smooth])**2
+
+    inner = t <= TS
+    val[inner] = 1. - A * t[inner]**2
+
+    return val
+
+
+def get_hb_energies(frame, btypes, eps=HYDR_EPS_OXDNA, nucleotides=None):
+    """ returns the arrays (i, j, energy) of the complementary pairs with base sites
+        closer than HYDR_RCHIGH and their HB energy
+
+        nucleotides --- only the pairs with at least one of these nucleotides (all by default)
+    """
+    pos_base = frame.cm_pos + POS_BASE * frame.a1
+
+    if nucleotides is None:
+        i, j, rhydro = find_pairs(pos_base, frame.box, HYDR_RCHIGH)
+    else:
+        nucleotides = np.asarray(nucleotides, np.int64)
+        w, j, rhydro = find_pairs_between(pos_base[nucleotides], pos_base, frame.box, HYDR_RCHIGH)
+        i = nucleotides[w]
+        # the pairs of two nucleotides of the list are found twice, keep them once with i < j
+        keep = (i < j) | ~np.isin(j, nucleotides)
+        i, j, rhydro = i[keep], j[keep], rhydro[keep]
+        swap = i > j
+        i[swap], j[swap] = j[swap], i[swap]
+        rhydro[swap] = -rhydro[swap]
+
+    pair = btypes[i] + btypes[j] == 3
+    i, j, rhydro = i[pair], j[pair], rhydro[pair]
+
+    return i, j, get_pair_energies(frame, i, j, rhydro, eps)
+
+
+def get_pair_energies(frame, i, j, rhydro, eps=HYDR_EPS_OXDNA):
+    """ returns the HB energies of the (complementary) pairs i, j with base-base
+        vectors rhydro = base(j) - base(i)
+    """
+    a1 = frame.a1
+    a3 = frame.a3
+
+    # oxDNA computes the HB of the pair (p, q) = (i, j) with rhydro = base(q) - base(p)
+    r = np.sqrt(np.einsum("ij,ij->i", rhydro, rhydro))
+    rdir = rhydro / r[:, None]
+    a1i, a3i, a1j, a3j = a1[i], a3[i], a1[j], a3[j]
+
+    def dot(x, y):
+        return np.einsum("ij,ij->i", x, y)
+
+    energy = f1(r, eps)
+    energy *= f4(-dot(a1i, a1j), HYDR_THETA1)
+    energy *= f4(-dot(a1j, rdir), HYDR_THETA2)
+    energy *= f4(dot(a1i, rdir), HYDR_THETA3)
+    energy *= f4(dot(a3i, a3j), HYDR_THETA4)
+    energy *= f4(-dot(a3j, rdir), HYDR_THETA7)
+    energy *= f4(dot(a3i, rdir), HYDR_THETA8)
+
+    return energy
+
+
+class HBondDetector:
+    """
+    Finds the hydrogen bonded nucleotides of the frames of a trajectory
+
+    topology --- Topology of the system (see topology.py), or its file or lines
+
+    eps --- HB strength, HYDR_EPS_OXDNA or HYDR_EPS_OXDNA2 (see get_hydr_eps)
+
+    cutoff --- pairs with an HB energy below cutoff are bonded (H_CUTOFF by default)
+    """
+
+    def __init__(self, topology, eps=HYDR_EPS_OXDNA, cutoff=H_CUTOFF):
+        topology = as_topology(topology)
+        self.btypes = topology.btype
+        self.n3 = topology.n3
+        self.strand_ids = topology.strand_ids
+        self.eps = eps
+        self.cutoff = cutoff
+
+    def get_H_bonds(self, frame, nucleotides=None):
+        """ returns the list of [i, j] (i < j) bonded nucleotides of a Frame, sorted,
+            as System.get_H_interactions_nucleotides
+
+            nucleotides --- only look for the bonds of these nucleotides (e.g. the ones of a
+                watch list of pairs), the cost then grows with their number instead of N
+        """
+        return self.get_H_bond_array(frame, nucleotides).tolist()
+
+    def get_H_bond_array(self, frame, nucleotides=None):
+        """ same as get_H_bonds, as an (n, 2) array """
+        return self.get_H_bond_energies(frame, nucleotides)[0]
+
+    def get_H_bond_energies(self, frame, nucleotides=None, cutoff=None):
+        """ returns the (n, 2) array of bonded nucleotides (as get_H_bond_array) and their HB energies
+
+            cutoff --- pairs with an HB energy below cutoff are bonded (self.cutoff by default)
+        """
+        if cutoff is None:
+            cutoff = self.cutoff
+        i, j, energy = get_hb_energies(frame, self.btypes, self.eps, nucleotides)
+
+        # bonded neighbours don't have an HB term
+        keep = (energy < cutoff) & (self.n3[i] != j) & (self.n3[j] != i)
+        keep &= (j - i != 1) | (self.strand_ids[i] != self.strand_ids[j])
+        i, j, energy = i[keep], j[keep], energy[keep]
+
+        order = np.lexsort((j, i))
+        return np.stack((i[order], j[order]), axis=1), energy[order]
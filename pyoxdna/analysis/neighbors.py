@@ -0,0 +1,110 @@
+"""
+Neighbour search in periodic (cubic or orthorhombic) boxes with cell lists
+
+the points are sorted by cell once and the pairs of every cell with its 26
+neighbouring cells are generated as index arrays, without python loops over the
+points. The functions return the pairs closer than a cutoff as arrays (i, j)
+and their minimum image distance vectors, for bond detection, overlap checks
+or contact analysis over a whole frame.
+"""
+import numpy as np
+
+# cells along each side of the box are capped, large boxes with few points
+# would otherwise need huge (mostly empty) cell arrays
+MAX_CELLS = 100
+
+
+class CellList:
+    """
+    Points of a periodic box sorted by cell
+
+    positions --- (N, 3) array of points
+
+    box --- box size (System._box or Frame.box)
+
+    cutoff --- cells are at least this large, so every pair closer than cutoff is
+        in the same or in neighbouring cells
+    """
+
+    def __init__(self, positions, box, cutoff):
+        self.positions = np.asarray(positions, np.float64).reshape(-1, 3)
+        self.box = np.asarray(box, np.float64)
+        self.cutoff = cutoff
+
+        self.n_cells = np.clip(np.floor(self.box / cutoff).astype(np.int64), 1, MAX_CELLS)
+        self.cells = self.get_cells(self.positions)
+        cell_ids = self.get_cell_ids(self.cells)
+
+        self.order = np.argsort(cell_ids, kind="stable")
+        self.counts = np.bincount(cell_ids, minlength=int(np.prod(self.n_cells)))
+        self.starts = np.cumsum(self.counts) - self.counts
+
+        # neighbouring cells, boxes with less than 3 cells along a side would visit some twice
+        self.offsets = sorted(set((dx % self.n_cells[0], dy % self.n_cells[1], dz % self.n_cells[2])
+                                  for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get_cells(self, positions):
+        """ returns the (x, y, z) cell of each point """
+        scaled = positions / self.box
+        cells = np.floor((scaled - np.floor(scaled)) * self.n_cells).astype(np.int64)
+        # rounding at the upper edge of the box
+        return np.minimum(cells, self.n_cells - 1)
+
+    def get_cell_ids(self, cells):
+        return cells[:, 0] + self.n_cells[0] * (cells[:, 1] + self.n_cells[1] * cells[:, 2])
+
+    def get_candidates(self, cells):
+        """ returns the arrays (i, j) of every point i (of cells) and every point j
+            of this list in its cell or in the neighbouring ones
+        """
+        pairs_i, pairs_j = [], []
+        index = np.arange(len(cells))
+        for offset in self.offsets:
+            neighbour_ids = self.get_cell_ids((cells + offset) % self.n_cells)
+
+            n = self.counts[neighbour_ids]
+            i = np.repeat(index, n)
+            first = np.repeat(self.starts[neighbour_ids] - np.cumsum(n) + n, n)
+            pairs_i.append(i)
+            pairs_j.append(self.order[first + np.arange(len(i))])
+
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+    def _within(self, positions, i, j):
+        dr = self.positions[j] - positions[i]
+        dr -= self.box * np.rint(dr / self.box)
+        close = np.einsum("ij,ij->i", dr, dr) < self.cutoff * self.cutoff
+        return i[close], j[close], dr[close]
+
+    def find_pairs(self):
+        """ returns the arrays (i, j), i < j, of the points closer than the cutoff
+            and their distance vectors positions[j] - positions[i] (minimum image)
+        """
+        i, j = self.get_candidates(self.cells)
+        keep = i < j
+        return self._within(self.positions, i[keep], j[keep])
+
+    def find_pairs_with(self, others):
+        """ returns the arrays (i, j) of the points others[i] and positions[j]
+            closer than the cutoff and their distance vectors positions[j] - others[i]
+        """
+        others = np.asarray(others, np.float64).reshape(-1, 3)
+        i, j = self.get_candidates(self.get_cells(others))
+        return self._within(others, i, j)
+
+
+def find_pairs(positions, box, cutoff):
+    """ returns the arrays (i, j), i < j, of the points closer than cutoff in a
+        periodic box and their distance vectors positions[j] - positions[i]
+    """
+    return CellList(positions, box, cutoff).find_pairs()
+
+
+def find_pairs_between(positions, others, box, cutoff):
+    """ returns the arrays (i, j) of the points positions[i] and others[j] closer
+        than cutoff in a periodic box and their distance vectors others[j] - positions[i]
+    """
+    return CellList(others, box, cutoff).find_pairs_with(positions)
@@ -0,0 +1,154 @@
+"""
+Excluded volume overlap checks of strands with cell lists
+
+every nucleotide has a backbone and a base site, two nucleotides overlap when
+any pair of their sites is closer than the excluded volume distance of the
+model (RC2_BACK between backbones, RC2_BASE between bases and RC2_BACK_BASE
+between a backbone and a base). The sites of the strands already placed are
+kept sorted by cell, so new strands are checked against them and inserted
+with array operations only, without rebuilding the cells.
+"""
+import itertools
+import numpy as np
+
+from .base import RC2_BACK, RC2_BASE, RC2_BACK_BASE
+from .neighbors import CellList, MAX_CELLS
+
+# squared overlap distance by site kind (0 backbone, 1 base)
+RC2 = np.array([[RC2_BACK, RC2_BACK_BASE],
+                [RC2_BACK_BASE, RC2_BASE]])
+CUTOFF = np.sqrt(RC2.max())
+
+
+def get_sites(back, base):
+    """ returns the (2N, 3) array of the sites of N nucleotides, site 2 * n is
+        the backbone and 2 * n + 1 the base of nucleotide n
+    """
+    back = np.asarray(back, np.float64).reshape(-1, 3)
+    sites = np.empty((2 * len(back), 3))
+    sites[0::2] = back
+    sites[1::2] = np.asarray(base, np.float64).reshape(-1, 3)
+    return sites
+
+
+def _overlapping(i, j, dr):
+    """ keeps the site pairs (i, j) closer than the overlap distance of their kinds """
+    close = np.einsum("ij,ij->i", dr, dr) < RC2[i & 1, j & 1]
+    return i[close], j[close]
+
+
+class OverlapChecker:
+    """
+    Sites of the nucleotides placed in a periodic box, to check new strands
+    for overlaps before adding them
+
+    the cells are at least twice the overlap distance, so only the 8 cells
+    around the corner of its cell a site is closest to can hold sites
+    overlapping with it. New sites are kept in a small sorted block, merged
+    with the rest once it holds more than MERGE_FRACTION of them.
+
+    box --- box size (System._box)
+    """
+    MERGE_SIZE = 4096
+    MERGE_FRACTION = 0.25
+
+    def __init__(self, box):
+        self.box = np.asarray(box, np.float64)
+        self.n_cells = np.clip(np.floor(self.box / (2 * CUTOFF)).astype(np.int64), 1, MAX_CELLS)
+        # corners of a cell, with a single cell along a side there is no neighbour to look at
+        self.corners = np.array(list(itertools.product(*[(0, 1) if n > 1 else (0,) for n in self.n_cells])))
+
+        self.N = 0 # nucleotides
+        self._sites = np.empty((0, 3))
+        # blocks of sorted cell ids of the sites and the sites in that order
+        self._blocks = [(np.empty(0, np.int64), np.empty(0, np.int64)), (np.empty(0, np.int64), np.empty(0, np.int64))]
+
+    def __len__(self):
+        return self.N
+
+    def get_cell_ids(self, cells):
+        return cells[..., 0] + self.n_cells[0] * (cells[..., 1] + self.n_cells[1] * cells[..., 2])
+
+    def get_neighbour_cells(self, sites):
+        """ returns the (M, len(corners)) cell ids to look at for every site """
+        scaled = sites / self.box
+        scaled = (scaled - np.floor(scaled)) * self.n_cells
+        cells = np.minimum(np.floor(scaled).astype(np.int64), self.n_cells - 1)
+        step = np.where(scaled - cells < 0.5, -1, 1)
+        return self.get_cell_ids((cells[:, None, :] + self.corners * step[:, None, :]) % self.n_cells)
+
+    def find_overlaps(self, back, base):
+        """ returns the arrays (i, j) of the new nucleotides i (backbone and base sites
+            back[i], base[i]) overlapping with the nucleotides j already added
+        """
+        sites = get_sites(back, base)
+        if self.N == 0 or len(sites) == 0:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+
+        neighbours = self.get_neighbour_cells(sites).ravel()
+        index = np.arange(len(sites)).repeat(len(self.corners))
+        pairs_i, pairs_j = [], []
+        for cell_ids, order in self._blocks:
+            # ranges of the sorted cell ids neighbouring every site
+            first, last = np.searchsorted(cell_ids, np.stack((neighbours, neighbours + 1))).reshape(2, -1)
+            n = last - first
+            i = np.repeat(index, n)
+            pairs_i.append(i)
+            pairs_j.append(order[np.repeat(first - np.cumsum(n) + n, n) + np.arange(len(i))])
+        i, j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+        dr = self._sites[j] - sites[i]
+        dr -= self.box * np.rint(dr / self.box)
+        i, j = _overlapping(i, j, dr)
+        return i >> 1, j >> 1
+
+    def is_overlapping(self, back, base):
+        return len(self.find_overlaps(back, base)[0]) > 0
+
+    def add(self, back, base):
+        """ adds the sites of nucleotides (as find_overlaps) without checking them """
+        sites = get_sites(back, base)
+        start = 2 * self.N
+        if start + len(sites) > len(self._sites):
+            # grows geometrically, inserting many small strands stays linear
+            grown = np.empty((max(2 * len(self._sites), start + len(sites)), 3))
+            grown[:start] = self._sites[:start]
+            self._sites = grown
+        self._sites[start:start + len(sites)] = sites
+        self.N += len(sites) // 2
+
+        cell_ids = self.get_neighbour_cells(sites)[:, 0] # the first corner is the cell itself
+        order = np.argsort(cell_ids, kind="stable")
+        self._blocks[1] = self._insert(self._blocks[1], cell_ids[order], start + order)
+        if len(self._blocks[1][0]) > max(self.MERGE_SIZE, self.MERGE_FRACTION * len(self._blocks[0][0])):
+            self._blocks = [self._insert(self._blocks[0], *self._blocks[1]), (np.empty(0, np.int64), np.empty(0, np.int64))]
+
+    def _insert(self, block, cell_ids, order):
+        """ inserts sorted cell ids (and their sites) into a block """
+        where = np.searchsorted(block[0], cell_ids, "right")
+        return np.insert(block[0], where, cell_ids), np.insert(block[1], where, order)
+
+    def add_if_free(self, back, base):
+        """ adds the nucleotides if they don't overlap with the ones already added,
+            returns True if they were added
+        """
+        if self.is_overlapping(back, base):
+            return False
+        self.add(back, base)
+        return True
+
+
+def find_overlaps(back, base, box, groups=None):
+    """ returns the arrays (i, j), i < j, of the overlapping nucleotides of a set,
+        pairs of nucleotides of the same group (e.g. strand) are left out
+    """
+    i, j, dr = CellList(get_sites(back, base), box, CUTOFF).find_pairs()
+    i, j = _overlapping(i, j, dr)
+    i, j = i >> 1, j >> 1
+    if groups is None:
+        keep = i != j
+    else:
+        groups = np.asarray(groups)
+        keep = groups[i] != groups[j]
+    pairs = np.unique(np.stack((np.minimum(i[keep], j[keep]), np.maximum(i[keep], j[keep])), axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
@@ -1,10 +1,345 @@
-from .base import Logger, System, Nucleotide, Strand, base_to_number
+from .base import Logger, System, Nucleotide, Strand
+from .trajectory import TrajectoryIndex, select_frames
+from .topology import load_topology, as_topology
 import numpy as np
 import os.path
-import sys
+import mmap
+
+def _format_float(x):
+    # 15 significant digits as oxDNA writes them, more if needed to read the same float back
+    x = float(x)
+    text = "%.15g" % x
+    return text if float(text) == x else repr(x)
+
+
+class Frame:
+    """
+    One configuration of a trajectory held as arrays instead of Nucleotide objects
+
+    time --- time of the configuration
+
+    box --- box size of the configuration
+        Ex: np.array([50., 50., 50.])
+
+    energy --- [E_tot, E_pot, E_kin]
+
+    data --- (N, 15) float array with one row per nucleotide, columns are
+        cm_pos (0:3), a1 (3:6), a3 (6:9), v (9:12) and L (12:15)
+
+    topology --- Topology of the nucleotides (see topology.py), lines of a topology
+        file are also accepted
+
+    the rows are kept as the raw text of the trajectory (bytes, or a memoryview
+    of a MappedTrajectory) and only parsed (in bulk) the first time data is
+    accessed. select() and get_rows() only parse the lines of the rows they
+    keep. System/Strand/Nucleotide objects are only built when get_system()
+    is called
+    """
+
+    def __init__(self, time, box, energy, data=None, text=None, topology=None, header=None):
+        self.time = time
+        self.box = np.array(box, np.float64)
+        self.energy = energy
+        self._data = data
+        self._text = text
+        self.topology = as_topology(topology)
+        self._header = header
+
+    @classmethod
+    def from_text(cls, text, topology=None):
+        """ returns the Frame of the text of a configuration (bytes, header lines included) """
+        body = 0
+        for i in range(3):
+            body = text.index(b"\n", body) + 1
+        header = bytes(text[:body])
+        lines = header.split(b"\n")
+        time = float(lines[0].split()[2])
+        box = [float(x) for x in lines[1].split()[2:5]]
+        energy = [float(x) for x in lines[2].split()[2:5]]
+        return cls(time, box, energy, text=text[body:], topology=topology, header=header)
+
+    def get_data(self):
+        if self._data is None:
+            data = np.fromstring(bytes(self._text), sep=' ')
+            if self.topology is not None:
+                N = self.topology.N
+                if N == 0 or data.size % N != 0:
+                    raise ValueError("configuration at t = %s does not match the topology (%d values for %d nucleotides)" % (self.time, data.size, N))
+                data = data.reshape(N, -1)
+            else:
+                data = data.reshape(-1, 15)
+            self._data = data
+        return self._data
+
+    data = property(get_data)
+
+    cm_pos = property(lambda self: self.data[:, 0:3])
+    a1 = property(lambda self: self.data[:, 3:6])
+    a3 = property(lambda self: self.data[:, 6:9])
+    v = property(lambda self: self.data[:, 9:12])
+    L = property(lambda self: self.data[:, 12:15])
+
+    def get_N(self):
+        if self._data is None and self.topology is not None:
+            return self.topology.N
+        return len(self.data)
+
+    N = property(get_N)
+
+    E_tot = property(lambda self: self.energy[0])
+    E_pot = property(lambda self: self.energy[1])
+    E_kin = property(lambda self: self.energy[2])
+
+    def get_text(self):
+        """ returns the nucleotide lines of the configuration as bytes """
+        if self._text is None:
+            # single precision data (binary trajectories) is printed with the digits it actually has
+            fmt = "%.9g" if self.data.dtype.itemsize == 4 else "%r"
+            self._text = "".join(" ".join(fmt % x for x in row) + "\n" for row in self.data.tolist()).encode()
+        return self._text
+
+    def get_header(self):
+        """ returns the t, b and E lines of the configuration as bytes """
+        if self._header is None:
+            values = tuple(_format_float(x) for x in list(self.box) + list(self.energy))
+            self._header = ("t = %lu\nb = %s %s %s\nE = %s %s %s\n" % ((int(self.time),) + values)).encode()
+        return self._header
+
+    def write(self, f):
+        """ writes the configuration in the Lorenzo (oxDNA .conf) format to the binary file f """
+        f.write(self.get_header())
+        f.write(self.get_text())
+
+    def get_line_offsets(self):
+        """ returns the offset of every line in the text of the frame, and the end of the text """
+        text = np.frombuffer(self._text, np.uint8)
+        ends = np.flatnonzero(text == ord("\n")) + 1
+        if len(text) > 0 and text[-1] != ord("\n"):
+            ends = np.append(ends, len(text))
+        return np.concatenate(([0], ends))
+
+    def get_text_rows(self, rows):
+        """ returns the lines of the nucleotides in rows, without parsing them """
+        rows = np.asarray(rows, np.int64)
+        if len(rows) == 0:
+            return b""
+        offsets = self.get_line_offsets()
+        # runs of consecutive rows (e.g. whole strands) are copied at once
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        starts = offsets[rows[np.concatenate(([0], breaks))]].tolist()
+        ends = offsets[rows[np.concatenate((breaks - 1, [len(rows) - 1]))] + 1].tolist()
+        text = self._text
+        return b"".join(text[a:b] for a, b in zip(starts, ends))
+
+    def get_rows(self, rows):
+        """ returns the data of the nucleotides in rows, only their lines are parsed """
+        if self._data is not None:
+            return self._data[rows]
+        if len(rows) == 0:
+            return np.empty((0, 15))
+        data = np.fromstring(self.get_text_rows(rows), sep=' ')
+        if data.size % len(rows) != 0:
+            raise ValueError("configuration at t = %s does not match the topology (%d values for %d nucleotides)" % (self.time, data.size, len(rows)))
+        return data.reshape(len(rows), -1)
+
+    def select(self, indices, topology=None):
+        """ returns a Frame with only the nucleotides (rows) in indices, the lines of
+            the others are not parsed
+
+            topology -- Topology of the selected nucleotides, if already known (by default
+                the renumbered selection of the topology of the frame, see Topology.select)
+        """
+        if topology is None and self.topology is not None:
+            topology = self.topology.select(indices)
+
+        if self._data is None:
+            return Frame(self.time, self.box, self.energy, text=self.get_text_rows(indices), topology=topology, header=self._header)
+
+        return Frame(self.time, self.box, self.energy, data=self._data[indices], topology=topology, header=self._header)
+
+    def select_strands(self, strand_ids):
+        """ returns a Frame with only the nucleotides of the strands with these (topology) ids """
+        return self.select(self.topology.get_strand_rows(strand_ids))
+
+    def get_system(self, only_strand_ends=False, check_overlap=False):
+        """ builds the System (with Strands and Nucleotides) of this configuration """
+        if self.topology is None:
+            raise ValueError("a topology is needed to build a System from a Frame")
+        return _build_system(self, self.topology, only_strand_ends, check_overlap)
+
+    def get_array_system(self):
+        """ builds the ArraySystem (arrays, see arrays.py) of this configuration """
+        from .arrays import ArraySystem
+        return ArraySystem.from_frame(self)
+
+
+def _build_system(frame, topology, only_strand_ends=False, check_overlap=False):
+    system = System(frame.box, time=frame.time, E_pot=frame.E_pot, E_kin=frame.E_kin)
+    Nucleotide.index = 0
+    Strand.index = 0
+
+    if only_strand_ends:
+        # only the lines of the strand ends are parsed
+        rows = np.flatnonzero((topology.n3 == -1) | (topology.n5 == -1))
+        data = dict(zip(rows.tolist(), frame.get_rows(rows)))
+    else:
+        data = frame.data
+    base = topology.base.tolist()
+    btype = topology.btype.tolist()
+    n3 = topology.n3.tolist()
+    n5 = topology.n5.tolist()
+    offsets = topology.offsets.tolist()
+
+    for first, last, circular in zip(offsets[:-1], offsets[1:], topology.get_circular().tolist()):
+        s = Strand()
+        if circular:
+            s.make_circular()
+
+        for i in range(first, last):
+            if not only_strand_ends or n3[i] == -1 or n5[i] == -1:
+                row = data[i]
+                s.add_nucleotide(Nucleotide(row[0:3], row[3:6], row[6:9], base[i], btype[i], row[9:12], row[12:15], n3[i]))
+
+        system.add_strand(s, check_overlap)
+
+    return system
+
+
+class MappedTrajectory:
+    """
+    Read-only memory map of a trajectory file with random access to its frames
+
+    frames (MappedTrajectory[k], slices or iteration) are zero-copy slices of the
+    map and are only parsed when their arrays are used. All the passes over the
+    file and all the processes mapping it share the page cache instead of
+    reading their own copies. Pickling only keeps the paths, so a
+    MappedTrajectory can be sent to worker processes which map the file again.
+
+    trajectory --- path to the trajectory file
+
+    topology --- path to the topology file, needed to build Systems from the frames. With
+        it, a last frame with fewer lines than nucleotides (still being written by a
+        running simulation) is left out
+    """
+
+    def __init__(self, trajectory, topology=None):
+        self._open(trajectory, topology)
+
+    def _open(self, trajectory, topology):
+        self.path = trajectory
+        self.topology = topology
+        self._topology = load_topology(topology) if topology is not None else None
+        self.index = TrajectoryIndex(trajectory)
+
+        self._file = open(trajectory, "rb")
+        if self.index.size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._map = b""
+        self._view = memoryview(self._map)
+
+        self._n_frames = len(self.index)
+        if self._topology is not None and self._n_frames > 0 and not self._is_complete(self._n_frames - 1):
+            # it stays in the index, which scans it again once the trajectory has grown
+            self._n_frames -= 1
+
+    def _is_complete(self, k):
+        """ checks that frame k has its 3 header lines and one line per nucleotide """
+        start, end = self.index.get_bounds(k)
+        lines = np.count_nonzero(np.frombuffer(self._view[start:end], np.uint8) == ord("\n"))
+        return lines >= 3 + self._topology.N
+
+    def __getstate__(self):
+        return {"trajectory": self.path, "topology": self.topology}
+
+    def __setstate__(self, state):
+        self._open(state["trajectory"], state["topology"])
+
+    def close(self):
+        if self._file:
+            self._view.release()
+            try:
+                if isinstance(self._map, mmap.mmap):
+                    self._map.close()
+            except BufferError:
+                # frames still hold slices of the map, it is unmapped once they are released
+                pass
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._n_frames
+
+    def get_raw(self, k, stop=None):
+        """ returns the whole text of frame k (header included) as a memoryview,
+            or of the frames k to stop-1 if stop is given """
+        start, end = self.index.get_bounds(k)
+        if stop is not None and stop > k + 1:
+            end = self.index.get_bounds(stop - 1)[1]
+        return self._view[start:end]
+
+    def get_frame(self, k):
+        start, end = self.index.get_bounds(k)
+        # the header is the first three lines
+        body = start
+        for i in range(3):
+            body = self._map.find(b"\n", body, end) + 1
+        header = self._map[start:body]
+        energy = [float(x) for x in header.split(b"\n")[2].split()[2:5]]
+
+        return Frame(self.index.times[k], self.index.boxes[k], energy, text=self._view[body:end],
+                     topology=self._topology, header=header)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self.get_frame(i) for i in range(*k.indices(len(self)))]
+        if k < 0:
+            k += len(self)
+        if k < 0 or k >= len(self):
+            raise IndexError("frame %d out of range" % k)
+        return self.get_frame(k)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.get_frame(k)
+
+    def get_frame_numbers(self, **window):
+        """ returns the numbers of the frames in a window (arguments of select_frames) """
+        return select_frames(self.index.times[:len(self)], **window)
+
+    def iter_frames(self, **window):
+        """ iterates over the frames in a window, the other frames are not read at all """
+        for k in self.get_frame_numbers(**window).tolist():
+            yield self.get_frame(k)
+
+
+def open_trajectory(trajectory, topology=None):
+    """ returns a BinaryTrajectory, a CompressedTrajectory or a MappedTrajectory, depending on the format of the file """
+    from .binary import BinaryTrajectory, is_binary_trajectory
+    from .compressed import CompressedTrajectory, is_compressed_trajectory
+
+    if is_binary_trajectory(trajectory):
+        return BinaryTrajectory(trajectory, topology)
+    if is_compressed_trajectory(trajectory):
+        return CompressedTrajectory(trajectory, topology)
+    return MappedTrajectory(trajectory, topology)
+
 
 class LorenzoReader:
-    def __init__(self, configuration, topology, check_overlap=False):
+    def __init__(self, configuration, topology, check_overlap=False, mapped=False, nucleotides=None, strands=None):
+        """ mapped -- read the frames from a MappedTrajectory instead of streaming the file
+                (gzip/xz configurations are always read from a CompressedTrajectory)
+
+            nucleotides, strands -- only read these nucleotides (indices) and/or the nucleotides
+                of these strands (topology ids): the frames and Systems only have them
+                (renumbered, see Topology.select) and the lines of the others are not parsed
+        """
         self._conf = False
 
         if not os.path.isfile(configuration):
@@ -14,90 +349,145 @@ class LorenzoReader:
             Logger.die("Topology file '%s' is not readable" % topology)
 
         self._check_overlap = check_overlap
-        self._conf = open(configuration, "r")
+        self._configuration = configuration
+        self._index = None
+        self._frame = 0 # number of the next frame to be read
 
-        f = open(topology, "r")
-        f.readline()
-        self._top_lines = f.readlines()
+        self._topology = load_topology(topology)
+
+        self._rows = None
+        if nucleotides is not None or strands is not None:
+            rows = np.asarray(nucleotides if nucleotides is not None else [], np.int64)
+            if strands is not None:
+                rows = np.union1d(rows, self._topology.get_strand_rows(strands))
+            self._rows = np.unique(rows)
+            self._selection = self._topology.select(self._rows)
+
+        from .compressed import CompressedTrajectory, is_compressed_trajectory
+
+        self._mapped = None
+        if is_compressed_trajectory(configuration):
+            self._mapped = CompressedTrajectory(configuration, topology)
+            self._index = self._mapped.index
+        elif mapped:
+            self._mapped = MappedTrajectory(configuration, topology)
+            self._index = self._mapped.index
+        else:
+            self._conf = open(configuration, "rb")
 
     def __del__(self):
         if self._conf: self._conf.close()
 
-    def _read(self, only_strand_ends=False, skip=False):
+    def _read_frame(self, skip=False):
+        if self._mapped is not None:
+            if self._frame >= len(self._mapped):
+                return False
+            self._frame += 1
+            if skip:
+                return False
+            frame = self._mapped.get_frame(self._frame - 1)
+            return frame if self._rows is None else frame.select(self._rows, self._selection)
+
         timeline = self._conf.readline()
-        time = 0.
         if  len(timeline) == 0:
             return False
-        else:
-            time = float(timeline.split()[2])
 
-        box = np.array([float(x) for x in self._conf.readline().split()[2:]])
-        [E_tot, E_pot, E_kin] = [float(x) for x in self._conf.readline().split()[2:5]]
+        self._frame += 1
+        time = float(timeline.split()[2])
+        boxline = self._conf.readline()
+        box = np.array([float(x) for x in boxline.split()[2:]])
+        eline = self._conf.readline()
+        energy = [float(x) for x in eline.split()[2:5]]
+
+        lines = [self._conf.readline() for i in range(self._topology.N)]
 
         if skip:
-            for tl in self._top_lines:
-                self._conf.readline()
+            return False
 
+        if self._rows is not None:
+            return Frame(time, box, energy, text=b"".join(lines[i] for i in self._rows.tolist()), topology=self._selection, header=timeline + boxline + eline)
+        return Frame(time, box, energy, text=b"".join(lines), topology=self._topology, header=timeline + boxline + eline)
+
+    def _read(self, only_strand_ends=False, skip=False):
+        frame = self._read_frame(skip)
+        if frame == False:
             return False
 
-        system = System(box, time=time, E_pot=E_pot, E_kin=E_kin)
-        Nucleotide.index = 0
-        Strand.index = 0
-
-        s = False
-        strandid_current = 0
-        for tl in self._top_lines:
-            tls = tl.split()
-            n3 = int(tls[2])
-            n5 = int(tls[3])
-            strandid = int(tls[0])
-            if (len (tls[1]) == 1):
-                b = base_to_number[tls[1]]
-                bb = b
+        return frame.get_system(only_strand_ends, self._check_overlap)
+
+    def get_strand_ids(self):
+        """ returns the (topology) strand id of the nucleotides of the frames """
+        if self._rows is not None:
+            return self._topology.strand_ids[self._rows]
+        return self._topology.strand_ids
+
+    def get_topology(self):
+        """ returns the Topology of the frames (of the selected nucleotides, renumbered) """
+        return self._topology if self._rows is None else self._selection
+
+    def get_rows(self):
+        """ returns the indices (in the topology file) of the nucleotides of the frames """
+        return np.arange(self._topology.N) if self._rows is None else self._rows
+
+    def get_index(self):
+        """ returns the TrajectoryIndex of the configuration file (built or loaded on first use) """
+        if self._index is None:
+            self._index = TrajectoryIndex(self._configuration)
+        return self._index
+
+    def get_N_frames(self):
+        if self._mapped is not None:
+            return len(self._mapped)
+        return len(self.get_index())
+
+    def get_frame_numbers(self, **window):
+        """ returns the numbers of the frames in a window (arguments of select_frames) """
+        if self._mapped is not None:
+            return self._mapped.get_frame_numbers(**window)
+        return self.get_index().get_frame_numbers(**window)
+
+    def seek(self, frame):
+        """ moves the reader to the beginning of frame number `frame` """
+        index = self.get_index()
+        if self._mapped is None:
+            if frame < len(index):
+                self._conf.seek(index.offsets[frame])
             else:
-                try:
-                    tmp = int (tls[1])
-                except:
-                    raise ValueError ("problems in topology file with specific base pairing")
-
-                if tmp > 0:
-                    b = tmp % 4
-                else:
-                    b = (3 - ((3 - tmp) % 4))
-                bb = tmp
-
-            if strandid != strandid_current:
-                # check for circular strand
-                if n3 != -1:
-                    iscircular = True
-                else:
-                    iscircular = False
-
-                if s:
-                    system.add_strand(s, self._check_overlap)
-                s = Strand()
-                if iscircular:
-                    s.make_circular()
-                strandid_current = strandid
-
-            ls = self._conf.readline().split()
-            cm = [float(x) for x in ls[0:3]]
-            a1 = [float(x) for x in ls[3:6]]
-            a3 = [float(x) for x in ls[6:9]]
-            v = [float(x) for x in ls[9:12]]
-            L = [float(x) for x in ls[12:15]]
-            if not only_strand_ends or n3 == -1 or n5 == -1:
-                s.add_nucleotide(Nucleotide(cm, a1, a3, b, bb, v, L, n3))
-
-        system.add_strand(s, self._check_overlap)
-
-        return system
+                self._conf.seek(0, os.SEEK_END)
+        self._frame = frame
 
+    def _skip(self, N_skip):
+        # one frame is cheaper to read through than to look up in the index
+        if N_skip > 1:
+            self.seek(self._frame + N_skip)
+        elif N_skip == 1:
+            self._read_frame(skip=True)
 
     # if only_strand_ends == True then a strand will contain only the first and the last nucleotide
     # useful for some analysis like csd for coaxial interactions
     def get_system(self, only_strand_ends=False, N_skip=0):
-        for i in range(N_skip):
-            self._read(skip=True)
+        self._skip(N_skip)
 
         return self._read(only_strand_ends=only_strand_ends, skip=False)
+
+    # same as get_system, but returns the configuration as a Frame (arrays) without
+    # building any Strand or Nucleotide objects
+    def get_frame(self, N_skip=0):
+        self._skip(N_skip)
+
+        return self._read_frame()
+
+    def __iter__(self):
+        frame = self.get_frame()
+        while frame != False:
+            yield frame
+            frame = self.get_frame()
+
+    def iter_frames(self, **window):
+        """ iterates over the frames in a window (arguments of select_frames), seeking
+            over the frames left out instead of reading them
+        """
+        for k in self.get_frame_numbers(**window).tolist():
+            if k != self._frame:
+                self.seek(k)
+            yield self.get_frame()
@@ -0,0 +1,163 @@
+"""
+Strand pair base pair counts and tile binding events
+
+the bonds of every frame (packed nucleotide pairs, see detect_bonds.pack_pairs)
+are reduced to the number of base pairs between every pair of strands, kept
+as a sparse (CSR like) time series. A strand pair is bound while it has at
+least threshold base pairs, the times it becomes bound or unbound are the tile
+binding events.
+"""
+import numpy as np
+
+
+def pack(a, b):
+    return (np.asarray(a, np.int64) << 32) | np.asarray(b, np.int64)
+
+
+def unpack(keys):
+    return np.stack((keys >> 32, keys & 0xffffffff), axis=1)
+
+
+def count_strand_pairs(bonds, strand_ids):
+    """ returns the sorted packed strand pairs (s1 < s2) with base pairs between them
+        and their number of base pairs
+
+        bonds --- packed nucleotide pairs of a frame
+
+        strand_ids --- strand (topology number) of every nucleotide
+    """
+    s1 = strand_ids[bonds >> 32]
+    s2 = strand_ids[bonds & 0xffffffff]
+    other = s1 != s2
+    s1, s2 = s1[other], s2[other]
+    return np.unique(pack(np.minimum(s1, s2), np.maximum(s1, s2)), return_counts=True)
+
+
+class StrandPairCounts:
+    """
+    Number of base pairs between every pair of strands in every frame
+
+    times --- (F,) time of the frames
+
+    indptr --- (F+1,) the strand pairs of frame k are pairs[indptr[k]:indptr[k+1]]
+
+    pairs --- packed strand pairs (s1 << 32 | s2, s1 < s2), sorted in each frame
+
+    counts --- number of base pairs of each strand pair
+    """
+
+    def __init__(self, times, indptr, pairs, counts):
+        self.times = np.asarray(times, np.int64)
+        self.indptr = np.asarray(indptr, np.int64)
+        self.pairs = np.asarray(pairs, np.int64)
+        self.counts = np.asarray(counts, np.int32)
+
+    @classmethod
+    def from_frames(cls, frames):
+        """ builds the series from a list of (time, pairs, counts) of each frame """
+        if len(frames) == 0:
+            return cls([], [0], [], [])
+        times, pairs, counts = zip(*frames)
+        indptr = np.concatenate(([0], np.cumsum([len(p) for p in pairs])))
+        return cls(times, indptr, np.concatenate(pairs), np.concatenate(counts))
+
+    def __len__(self):
+        return len(self.times)
+
+    def get_frame(self, k):
+        """ returns the strand pairs (as an (n, 2) array) and counts of frame k """
+        lo, hi = self.indptr[k], self.indptr[k + 1]
+        return unpack(self.pairs[lo:hi]), self.counts[lo:hi]
+
+    def get_pair(self, s1, s2):
+        """ returns the number of base pairs between strands s1 and s2 in every frame """
+        key = pack(min(s1, s2), max(s1, s2))
+        series = np.zeros(len(self), np.int32)
+        rows = np.nonzero(self.pairs == key)[0]
+        series[np.searchsorted(self.indptr, rows, side="right") - 1] = self.counts[rows]
+        return series
+
+    def get_bound(self, threshold):
+        """ returns the frame and packed strand pair of every (frame, pair) with at least
+            threshold base pairs, sorted by frame then pair
+        """
+        frames = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        bound = self.counts >= threshold
+        return frames[bound], self.pairs[bound]
+
+    def detect_bindings(self, threshold, include_starting_bonds=False):
+        """ returns the list of tile events [time, strand1, action, strand2, base pairs]
+            when a strand pair reaches (BINDS) or falls below (BREAK) threshold base pairs
+
+            include_starting_bonds --- pairs already bound in the first frame are BINDS events
+        """
+        frames, pairs = self.get_bound(threshold)
+        counts = self.counts[self.counts >= threshold]
+        bounds = np.searchsorted(frames, np.arange(len(self) + 1))
+
+        events = []
+        prev = np.zeros(0, np.int64)
+        for k in range(len(self)):
+            current = pairs[bounds[k]:bounds[k + 1]]
+            if k > 0 or include_starting_bonds:
+                time = int(self.times[k])
+                # base pairs of the pairs that broke, in this frame
+                for s1, s2 in unpack(np.setdiff1d(prev, current, assume_unique=True)).tolist():
+                    events.append([time, s1, "BREAK", s2, int(self._count(k, pack(s1, s2)))])
+                formed = np.isin(current, prev, assume_unique=True, invert=True)
+                for (s1, s2), n in zip(unpack(current[formed]).tolist(), counts[bounds[k]:bounds[k + 1]][formed].tolist()):
+                    events.append([time, s1, "BINDS", s2, n])
+            prev = current
+
+        return events
+
+    def _count(self, k, key):
+        lo, hi = self.indptr[k], self.indptr[k + 1]
+        i = lo + np.searchsorted(self.pairs[lo:hi], key)
+        return self.counts[i] if i < hi and self.pairs[i] == key else 0
+
+    def summarize(self, threshold, include_starting_bonds=False):
+        """ returns a summary of the tile bindings of the run:
+            {
+                'threshold': threshold,
+                'bindings': number of BINDS events,
+                'breaks': number of BREAK events,
+                'bound_at_end': number of strand pairs bound in the last frame,
+                'pairs': list (one per strand pair that was ever bound) of {
+                    'strands': [s1, s2], 'bindings', 'breaks', 'bound_frames',
+                    'max_base_pairs', 'bound_at_end'
+                }
+            }
+        """
+        events = self.detect_bindings(threshold, include_starting_bonds)
+        frames, pairs = self.get_bound(threshold)
+
+        keys, bound_frames = np.unique(pairs, return_counts=True)
+        last = pairs[frames == len(self) - 1]
+        max_counts = np.zeros(len(keys), np.int64)
+        np.maximum.at(max_counts, np.searchsorted(keys, pairs), self.counts[self.counts >= threshold])
+
+        bindings = {}
+        breaks = {}
+        for time, s1, action, s2, n in events:
+            d = bindings if action == "BINDS" else breaks
+            d[(s1, s2)] = d.get((s1, s2), 0) + 1
+
+        summary_pairs = []
+        for (s1, s2), key, n_frames, n_max in zip(unpack(keys).tolist(), keys.tolist(), bound_frames.tolist(), max_counts.tolist()):
+            summary_pairs.append({
+                "strands": [s1, s2],
+                "bindings": bindings.get((s1, s2), 0),
+                "breaks": breaks.get((s1, s2), 0),
+                "bound_frames": n_frames,
+                "max_base_pairs": n_max,
+                "bound_at_end": bool(np.isin(key, last))
+            })
+
+        return {
+            "threshold": threshold,
+            "bindings": sum(bindings.values()),
+            "breaks": sum(breaks.values()),
+            "bound_at_end": len(last),
+            "pairs": summary_pairs
+        }
@@ -0,0 +1,158 @@
+"""
+Topology (.top) files parsed once into arrays
+
+a topology file is read into a Topology (strand id, base, n3/n5 links of every
+nucleotide, strand offsets and sequences as numpy arrays) the first time it is
+used, and load_topology returns the same Topology to the readers, the bond
+detection and the scripts until the file changes, instead of every one of
+them splitting the lines again (for every frame, for the readers).
+"""
+import os
+import numpy as np
+from .base import base_to_number
+
+# path -> (mtime, size, Topology)
+_cache = {}
+
+
+class Topology:
+    """
+    Topology of a system, one row per nucleotide
+
+    strand_ids --- (N,) strand of every nucleotide, as numbered in the file (from 1)
+
+    names --- (N,) base of every nucleotide as written in the file (A, C, G, T or a
+        number for specific base pairing)
+
+    n3, n5 --- (N,) 3' and 5' neighbours of every nucleotide (-1 if none)
+
+    the other arrays are derived from these: base (as Nucleotide._base), btype
+    (as Nucleotide._btype), strand (index of the strand, from 0) and offsets (first
+    row of every strand, and N)
+    """
+
+    def __init__(self, strand_ids, names, n3, n5, path=None):
+        self.strand_ids = np.asarray(strand_ids, np.int64)
+        self.names = np.asarray(names, str)
+        self.n3 = np.asarray(n3, np.int64)
+        self.n5 = np.asarray(n5, np.int64)
+        self.path = path
+
+        self.N = len(self.strand_ids)
+        new_strand = np.ones(self.N, bool)
+        new_strand[1:] = self.strand_ids[1:] != self.strand_ids[:-1]
+        self.strand = np.cumsum(new_strand) - 1
+        self.offsets = np.append(np.flatnonzero(new_strand), self.N)
+        self.N_strands = len(self.offsets) - 1
+
+        # few different names, converted once each
+        unique, inverse = np.unique(self.names, return_inverse=True)
+        types = np.array([get_base_type(name) for name in unique.tolist()], np.int64).reshape(-1, 2)
+        self.base, self.btype = types[inverse.reshape(-1)].T.copy()
+
+    @classmethod
+    def from_lines(cls, lines, path=None):
+        """ parses the lines of a topology file (without the header) """
+        fields = [line.split() for line in lines if line.strip()]
+        if any(len(f) < 4 for f in fields):
+            raise ValueError("topology lines need 4 columns (strand, base, n3, n5)")
+        columns = list(zip(*[f[:4] for f in fields])) or [(), (), (), ()]
+        return cls([int(x) for x in columns[0]], columns[1], [int(x) for x in columns[2]], [int(x) for x in columns[3]], path)
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "r") as f:
+            f.readline()
+            return cls.from_lines(f.readlines(), path)
+
+    def __len__(self):
+        return self.N
+
+    def get_strand_numbers(self):
+        """ returns the file numbers of the strands """
+        return self.strand_ids[self.offsets[:-1]]
+
+    def get_circular(self):
+        """ returns whether each strand is circular (its first nucleotide has a 3' neighbour) """
+        return self.n3[self.offsets[:-1]] != -1
+
+    def get_sequences(self):
+        """ returns the sequence (bases as in the file, joined) of every strand """
+        names = self.names.tolist()
+        return ["".join(names[a:b]) for a, b in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+
+    def get_strand_rows(self, strand_ids):
+        """ returns the rows of the nucleotides of the strands with these (file) numbers """
+        return np.flatnonzero(np.isin(self.strand_ids, strand_ids))
+
+    def select(self, rows):
+        """ returns the Topology of the nucleotides in rows, renumbered, with the strands
+            renumbered from 1 and the n3/n5 links to nucleotides left out set to -1
+        """
+        rows = np.asarray(rows, np.int64)
+        new_index = np.full(self.N + 1, -1, np.int64) # n3/n5 = -1 index the last element
+        new_index[rows] = np.arange(len(rows))
+        strand_number = np.cumsum(np.bincount(self.strand[rows], minlength=self.N_strands) > 0)
+        return Topology(strand_number[self.strand[rows]], self.names[rows], new_index[self.n3[rows]], new_index[self.n5[rows]])
+
+    def select_strands(self, strand_ids):
+        return self.select(self.get_strand_rows(strand_ids))
+
+    def get_lines(self):
+        """ returns the lines of the topology file (without the header and the newlines) """
+        return ["%d %s %d %d" % line for line in zip(self.strand_ids.tolist(), self.names.tolist(), self.n3.tolist(), self.n5.tolist())]
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.write("%d %d\n" % (self.N, self.N_strands))
+            f.write("".join(line + "\n" for line in self.get_lines()))
+
+    def get_mappers(self):
+        """ returns (strand_to_sequence, absolute_to_strand, strand_to_absolute), lists indexed
+            by strand number (None/[] for numbers without strand, e.g. 0) and by nucleotide, with
+            absolute_to_strand[i] = [strand number, position in the strand]
+        """
+        numbers = self.get_strand_numbers().tolist()
+        size = max(numbers, default=0) + 1
+        strand_to_sequence = [None] * size
+        strand_to_absolute = [[] for x in range(size)]
+        for number, sequence, first, last in zip(numbers, self.get_sequences(), self.offsets[:-1].tolist(), self.offsets[1:].tolist()):
+            strand_to_sequence[number] = sequence
+            strand_to_absolute[number] = list(range(first, last))
+
+        position = np.arange(self.N) - self.offsets[self.strand]
+        absolute_to_strand = [list(x) for x in zip(self.strand_ids.tolist(), position.tolist())]
+        return strand_to_sequence, absolute_to_strand, strand_to_absolute
+
+
+def get_base_type(name):
+    """ returns the base and the base type (btype) of a base as written in a topology file """
+    if len(name) == 1:
+        return base_to_number[name], base_to_number[name]
+    try:
+        btype = int(name)
+    except ValueError:
+        raise ValueError("problems in topology file with specific base pairing")
+    return (btype % 4 if btype > 0 else 3 - ((3 - btype) % 4)), btype
+
+
+def load_topology(path):
+    """ returns the Topology of a topology file, parsed once and kept until the file changes """
+    stat = os.stat(path)
+    key = os.path.realpath(path)
+    cached = _cache.get(key)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    topology = Topology.read(path)
+    _cache[key] = (stat.st_mtime_ns, stat.st_size, topology)
+    return topology
+
+
+def as_topology(topology):
+    """ returns a Topology from a Topology, the path of a topology file or its lines """
+    if topology is None or isinstance(topology, Topology):
+        return topology
+    if isinstance(topology, (str, os.PathLike)):
+        return load_topology(topology)
+    return Topology.from_lines(topology)
@@ -1,29 +1,47 @@
 #!/usr/bin/env python
 
-import base
-import readers
-try:
-    import numpy as np
-except:
-    import mynumpy as np
 import os.path
 import sys
+import getopt
+
+if __package__:
+    from . import base, readers
+else:
+    # run as a script, the pyoxdna package is two directories up
+    sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+    from pyoxdna.analysis import base, readers
+
+USAGE = """Usage is %s [options] configuration topology [output]
+    --start, --stop, --stride: only these frames (as a slice of the frame numbers)
+    --t-start, --t-stop, --t-stride: only the frames between these times, one every t-stride time units"""
 
-if len(sys.argv) < 3:
-    base.Logger.log("Usage is %s configuration topology [output]" % sys.argv[0], base.Logger.CRITICAL)
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "", ["start=", "stop=", "stride=", "t-start=", "t-stop=", "t-stride="])
+except getopt.GetoptError:
+    opts, args = [], []
+
+if len(args) < 2:
+    base.Logger.log(USAGE % sys.argv[0], base.Logger.CRITICAL)
     sys.exit()
 
-if len(sys.argv) > 3:
-    output = sys.argv[3]
-else: output = sys.argv[1] + ".pdb"
+# arguments of select_frames, the frames left out are not parsed
+window = {}
+for o, a in opts:
+    if o in ("--start", "--stop", "--stride"):
+        window[o[2:]] = int(a)
+    else:
+        window[o[2:].replace("-", "_")] = float(a)
+
+if len(args) > 2:
+    output = args[2]
+else: output = args[0] + ".pdb"
     
-l = readers.LorenzoReader(sys.argv[1], sys.argv[2])
-s = l.get_system()
+l = readers.MappedTrajectory(args[0], args[1])
 append = False
-while s:
+for frame in l.iter_frames(**window):
+    s = frame.get_system()
     #s.bring_in_box_nucleotides()	
     s.print_pdb_output(output, append=append)
-    s = l.get_system()
     append = True
 
 base.Logger.log("Output printed on '%s'" % output, base.Logger.INFO)
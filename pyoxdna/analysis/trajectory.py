@@ -0,0 +1,180 @@
+import os
+import numpy as np
+
+INDEX_EXTENSION = ".idx"
+INDEX_VERSION = 1
+
+# size of the blocks read while scanning a trajectory for frame headers
+SCAN_BLOCK_SIZE = 1 << 24
+
+
+class TrajectoryIndex:
+    """
+    Byte offset, time and box of every frame of a Lorenzo (oxDNA) trajectory file
+
+    The index is built with a single streaming pass over the trajectory and cached
+    next to it as <trajectory>.idx. The cached index is only used while the size
+    and modification time of the trajectory match the ones it was built for.
+
+    trajectory --- path to the trajectory file
+
+    cache --- read/write the .idx file next to the trajectory (if the directory
+        is not writable the index is just kept in memory)
+    """
+
+    def __init__(self, trajectory, cache=True):
+        self.path = trajectory
+        self.index_path = trajectory + INDEX_EXTENSION
+
+        stat = os.stat(trajectory)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime_ns
+
+        if not (cache and self._load()):
+            self._build()
+            if cache:
+                self._save()
+
+    def _load(self):
+        try:
+            with np.load(self.index_path) as cached:
+                version, size, mtime = cached["stat"].tolist()
+                if version != INDEX_VERSION:
+                    return False
+                offsets = cached["offsets"]
+                times = cached["times"]
+                boxes = cached["boxes"]
+        except (OSError, KeyError, ValueError):
+            return False
+
+        if size == self.size and mtime == self.mtime:
+            self.offsets, self.times, self.boxes = offsets, times, boxes
+            return True
+
+        if size < self.size and len(offsets) > 0 and self._is_frame(offsets[-1], times[-1]):
+            # frames appended to the trajectory (e.g. by a running simulation), only the
+            # end is scanned, from the last frame (which may have been incomplete)
+            self._build(offsets[:-1], times[:-1], boxes[:-1], resume=int(offsets[-1]))
+            self._save()
+            return True
+
+        return False
+
+    def _is_frame(self, offset, time):
+        """ checks that the frame with the given time still starts at offset """
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            line = f.readline().split()
+        try:
+            return line[:2] == [b"t", b"="] and float(line[2]) == time
+        except (IndexError, ValueError):
+            return False
+
+    def _save(self):
+        tmp_path = "%s.%d.tmp" % (self.index_path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, stat=np.array([INDEX_VERSION, self.size, self.mtime], np.int64),
+                         offsets=self.offsets, times=self.times, boxes=self.boxes)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # e.g. read only directory, the index is still usable from memory
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+    def _build(self, offsets=None, times=None, boxes=None, resume=0):
+        """ scans the trajectory for frame headers from the byte offset resume, the frames
+            before it (offsets, times, boxes) are already known if they are given
+        """
+        known = 0 if offsets is None else len(offsets)
+        offsets = [] if offsets is None else offsets.tolist()
+        with open(self.path, "rb") as f:
+            # frame headers are the lines starting with 't = '
+            position = resume
+            f.seek(position)
+            first = f.read(4)
+            if first == b"t = ":
+                offsets.append(position)
+            f.seek(position)
+
+            previous = b""
+            while True:
+                block = f.read(SCAN_BLOCK_SIZE)
+                if not block:
+                    break
+                # keep the end of the previous block so headers split between blocks are found
+                buf = previous + block
+                start = position - len(previous)
+                i = buf.find(b"\nt = ")
+                while i != -1:
+                    offsets.append(start + i + 1)
+                    i = buf.find(b"\nt = ", i + 1)
+                position += len(block)
+                # shorter than the pattern, so no header is found twice
+                previous = block[-4:]
+
+            new_times = np.zeros(len(offsets) - known)
+            new_boxes = np.zeros((len(offsets) - known, 3))
+            for k, offset in enumerate(offsets[known:]):
+                f.seek(offset)
+                try:
+                    new_times[k] = float(f.readline().split()[2])
+                    new_boxes[k] = [float(x) for x in f.readline().split()[2:5]]
+                except (IndexError, ValueError):
+                    if known + k + 1 < len(offsets):
+                        raise
+                    # the header of the last frame is still being written
+                    offsets.pop()
+                    new_times = new_times[:-1]
+                    new_boxes = new_boxes[:-1]
+
+        self.offsets = np.array(offsets, np.int64)
+        self.times = new_times if known == 0 else np.concatenate((times, new_times))
+        self.boxes = new_boxes if known == 0 else np.concatenate((boxes, new_boxes))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    n_frames = property(__len__)
+
+    def get_bounds(self, k):
+        """ returns the (start, end) byte offsets of frame k """
+        start = int(self.offsets[k])
+        if k + 1 < len(self.offsets):
+            end = int(self.offsets[k + 1])
+        else:
+            end = self.size
+        return start, end
+
+    def get_frame_numbers(self, **window):
+        """ returns the numbers of the frames in a window (arguments of select_frames) """
+        return select_frames(self.times, **window)
+
+
+def select_frames(times, start=None, stop=None, stride=None, t_start=None, t_stop=None, t_stride=None):
+    """
+    Returns the numbers of the frames of a trajectory (with these times) in a window
+
+    t_start, t_stop --- only the frames with t_start <= time <= t_stop
+
+    start, stop, stride --- slice of the frames in the time window, as for a list
+        (negative from the end)
+
+    t_stride --- only the first frame of every t_stride of simulation time, counted from
+        t_start (or the time of the first frame left)
+    """
+    times = np.asarray(times)
+    frames = np.arange(len(times))
+    if t_start is not None:
+        frames = frames[times >= t_start]
+    if t_stop is not None:
+        frames = frames[times[frames] <= t_stop]
+    frames = frames[start:stop:stride]
+
+    if t_stride is not None and len(frames) > 0:
+        if t_stride <= 0:
+            raise ValueError("t_stride must be positive")
+        origin = t_start if t_start is not None else times[frames[0]]
+        first = np.unique(np.floor((times[frames] - origin) / t_stride), return_index=True)[1]
+        frames = frames[np.sort(first)]
+    return frames
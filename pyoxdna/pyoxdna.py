@@ -1,4 +1,7 @@
 from .utils import *
+from .analysis.binary import is_binary_trajectory, extract_conf
+from .analysis.compressed import is_compressed_trajectory
+from .analysis.follow import TrajectoryFollower
 
 class pyoxdna:
     """ this class runs and manages oxDNA simulations. PYOXDNA_HOME must be set to run correctly """
@@ -67,7 +70,46 @@ class pyoxdna:
             throws error if oxDNA errors
             THIS FUNCTION BLOCKS (runs synchonously, stopping code flow until it is finished)
         """
-        
+        cmd, input_path, output_path = self._start_one(config)
+
+        return_code = self.process.wait()
+
+        self._finish_one(cmd, input_path, output_path, return_code)
+
+    def follow_one(self, config, topology=None, poll_interval=1.):
+        """ same as run_one, but yields the frames of the trajectory (Frames, see
+            analysis/follow.py) while oxDNA writes them, e.g. to analyze the bonds with
+            iter_bond_events(..., frames=sim.follow_one(config)) during the simulation
+
+            closing the generator before the end (breaking out of the loop, or the stop
+            condition of iter_bond_events) stops oxDNA
+
+            topology -- topology file of the frames (config['topology'] by default)
+        """
+        # the trajectory of a previous run would be read before oxDNA replaces it
+        rm(os.path.join(self.output_dir, 'trajectory.dat'))
+
+        cmd, input_path, output_path = self._start_one(config)
+        follower = TrajectoryFollower(config['trajectory_file'], topology or config.get('topology'), poll_interval)
+
+        return_code = None
+        try:
+            yield from follower.follow(is_running=lambda: self.process.poll() is None)
+            return_code = self.process.wait()
+        finally:
+            follower.close()
+            if return_code is None:
+                # stopped before the end of the simulation
+                self.process.terminate()
+                self.process.wait()
+                self._finish_one(cmd, input_path, output_path, 0)
+
+        self._finish_one(cmd, input_path, output_path, return_code)
+
+    def _start_one(self, config):
+        """ writes config to file and starts the oxDNA simulation, returns the command,
+            the input path and the path of the last configuration
+        """
         #input_path, output_path = next(self.paths_generator)
         input_path = os.path.join(self.output_dir, "input.config")
         output_path = os.path.join(self.output_dir, config['lastconf_file'])
@@ -75,6 +117,13 @@ class pyoxdna:
         for name in ['energy', 'trajectory', 'log']:
             config[name+'_file'] = os.path.join(self.output_dir, name + '.dat')
 
+        # oxDNA only reads text configurations, start from the last frame of binary or compressed trajectories
+        conf_file = config.get('conf_file', '')
+        if is_binary_trajectory(conf_file) or is_compressed_trajectory(conf_file):
+            text_conf = os.path.join(self.output_dir, 'input.conf')
+            extract_conf(config['conf_file'], text_conf)
+            config['conf_file'] = text_conf
+
         self.config = config # save so outside scripts can access variables
         # print(output_path +' oxDNA config:')
         # pprint(config)
@@ -87,8 +136,9 @@ class pyoxdna:
         with open(self.pid_file, 'a+') as f:
             f.write(str(self.process.pid)+'\n')
 
-        return_code = self.process.wait()
+        return cmd, input_path, output_path
 
+    def _finish_one(self, cmd, input_path, output_path, return_code):
         if self.output_level <= 2:
             rm(input_path)
 
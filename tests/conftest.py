@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+EXAMPLE_DIR = os.path.join(ROOT, 'example files')
+CONF_FILE = os.path.join(EXAMPLE_DIR, 'rect.dat')
+TOP_FILE = os.path.join(EXAMPLE_DIR, 'rect.top')
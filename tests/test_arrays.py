@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from conftest import CONF_FILE, TOP_FILE
+from pyoxdna.analysis.arrays import ArraySystem
+from pyoxdna.analysis.binary import BinaryTrajectory
+from pyoxdna.analysis.readers import MappedTrajectory
+
+
+def write_legacy_topology(path):
+    """ writes the example topology with its strands listed 3' to 5', as System writes them
+        (rect.top lists them 5' to 3', which System would read as circular strands)
+    """
+    with open(TOP_FILE) as f:
+        lines = f.read().splitlines()
+    strands = [int(line.split()[0]) for line in lines[1:]]
+    with open(path, 'w') as f:
+        f.write(lines[0] + '\n')
+        for i, line in enumerate(lines[1:]):
+            s, b = line.split()[:2]
+            n3 = i - 1 if i > 0 and strands[i - 1] == strands[i] else -1
+            n5 = i + 1 if i + 1 < len(strands) and strands[i + 1] == strands[i] else -1
+            f.write('%s %s %d %d\n' % (s, b, n3, n5))
+    return str(path)
+
+
+def get_frame(tmp_path):
+    with MappedTrajectory(CONF_FILE, write_legacy_topology(tmp_path / 'legacy.top')) as trajectory:
+        return trajectory[0]
+
+
+def read_conf(path):
+    """ returns the numbers of the header (time, box, energies) and the (N, 15) data of a one frame conf """
+    with open(path) as f:
+        lines = f.read().splitlines()
+    header = [float(x) for line in lines[:3] for x in line.split()[2:]]
+    return header, np.array([[float(x) for x in line.split()] for line in lines[3:]])
+
+
+def test_print_lorenzo_output(tmp_path):
+    frame = get_frame(tmp_path)
+    frame.time = 12345
+
+    frame.get_system().print_lorenzo_output(str(tmp_path / 'system.dat'), str(tmp_path / 'system.top'))
+    ArraySystem.from_frame(frame).print_lorenzo_output(str(tmp_path / 'arrays.dat'), str(tmp_path / 'arrays.top'))
+
+    assert (tmp_path / 'arrays.top').read_bytes() == (tmp_path / 'system.top').read_bytes()
+    header, data = read_conf(tmp_path / 'system.dat')
+    array_header, array_data = read_conf(tmp_path / 'arrays.dat')
+    assert array_header == pytest.approx(header, abs=1e-6)
+    assert array_data.shape == data.shape == (len(frame.data), 15)
+    # System writes the nucleotides with fewer digits
+    assert array_data == pytest.approx(data, rel=1e-5, abs=1e-5)
+
+
+def test_print_lorenzo_output_visibility(tmp_path):
+    (tmp_path / 'visibility').write_text('default=vis\ninv=1,3\n')
+    system = ArraySystem.from_frame(get_frame(tmp_path))
+    system.print_lorenzo_output(str(tmp_path / 'all.dat'), str(tmp_path / 'all.top'))
+    system.print_lorenzo_output(str(tmp_path / 'visible.dat'), str(tmp_path / 'visible.top'), str(tmp_path / 'visibility'))
+
+    visible = ~np.isin(system.strand, [1, 3])
+    assert 0 < np.count_nonzero(visible) < len(visible)
+    assert read_conf(tmp_path / 'visible.dat')[1].tolist() == read_conf(tmp_path / 'all.dat')[1][visible].tolist()
+    with open(tmp_path / 'visible.top') as f:
+        assert f.readline().split() == [str(np.count_nonzero(visible)), str(system._N_strands - 2)]
+
+
+def test_print_lorenzo_output_binary(tmp_path):
+    frame = get_frame(tmp_path)
+    frame.get_system().print_lorenzo_output(str(tmp_path / 'system.bin'), str(tmp_path / 'system.top'), binary=True)
+    system = ArraySystem.from_frame(frame)
+    for append in (False, True):
+        system.print_lorenzo_output(str(tmp_path / 'arrays.bin'), str(tmp_path / 'arrays.top'), binary=True, append=append)
+
+    assert (tmp_path / 'arrays.top').read_bytes() == (tmp_path / 'system.top').read_bytes()
+    with BinaryTrajectory(str(tmp_path / 'system.bin')) as expected, BinaryTrajectory(str(tmp_path / 'arrays.bin')) as found:
+        assert len(expected) == 1 and len(found) == 2
+        for f in found:
+            assert f.time == expected[0].time
+            assert f.box.tolist() == expected[0].box.tolist()
+            assert np.array_equal(f.data, expected[0].data)
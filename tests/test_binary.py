@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import pytest
+
+from conftest import CONF_FILE, TOP_FILE
+from pyoxdna.analysis.binary import BinaryTrajectory, convert_to_binary, convert_to_text
+from pyoxdna.analysis.readers import MappedTrajectory
+
+
+def write_energies(path, energies):
+    """ writes a trajectory of the example conf with these E lines, one frame each """
+    with open(CONF_FILE, 'rb') as f:
+        lines = f.read().split(b'\n', 3)
+    with open(path, 'wb') as f:
+        for k, energy in enumerate(energies):
+            f.write(b'\n'.join([b't = %d' % (1000 * k), lines[1], energy, lines[3]]))
+
+
+def read_headers(path):
+    with MappedTrajectory(path) as trajectory:
+        return [bytes(trajectory.get_raw(k)).split(b'\n', 3)[:3] for k in range(len(trajectory))]
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_text_binary_text_headers(tmp_path, dtype):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_energies(trajectory, [b'E = 0 0 0', b'E = -1.5 -1.6 0.1', b'E = -1.53981234567891 1e-07 0.333333333333333'])
+    binary = str(tmp_path / 'trajectory.bin')
+    text = str(tmp_path / 'trajectory.txt')
+
+    assert convert_to_binary(trajectory, TOP_FILE, binary, dtype=dtype) == 3
+    assert convert_to_text(binary, text) == 3
+    assert read_headers(text) == read_headers(trajectory)
+
+
+def test_header_lossless():
+    with MappedTrajectory(CONF_FILE, TOP_FILE) as trajectory:
+        frame = trajectory[0]
+    frame = type(frame)(frame.time, frame.box / 3., [0.1 + 0.2, -2. / 3., 1e-300], data=frame.data)
+    lines = frame.get_header().decode().split('\n')
+    assert [float(x) for x in lines[1].split()[2:]] == (frame.box).tolist()
+    assert [float(x) for x in lines[2].split()[2:]] == frame.energy
+
+
+def write_moved_frames(path, n):
+    """ writes n frames of the example conf, each one moved by k along x """
+    with MappedTrajectory(CONF_FILE, TOP_FILE) as trajectory:
+        frame = trajectory[0]
+    with open(path, 'wb') as f:
+        for k in range(n):
+            data = frame.data.copy()
+            data[:, 0] += k
+            type(frame)(1000 * k, frame.box, [-k / 3., 0.1 * k, 1.], data=data).write(f)
+
+
+@pytest.mark.parametrize('keep_velocities', [True, False])
+def test_round_trip_float64(tmp_path, keep_velocities):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_moved_frames(trajectory, 5)
+    binary = str(tmp_path / 'trajectory.bin')
+    text = str(tmp_path / 'trajectory.txt')
+
+    # several chunks, the last one partly filled
+    assert convert_to_binary(trajectory, TOP_FILE, binary, np.float64, keep_velocities, chunk_size=2) == 5
+    assert convert_to_text(binary, text) == 5
+    columns = 15 if keep_velocities else 9
+    with MappedTrajectory(trajectory) as expected, BinaryTrajectory(binary) as found, MappedTrajectory(text) as back:
+        assert len(found) == len(back) == 5
+        for e, f, b in zip(expected, found, back):
+            assert f.time == b.time == e.time
+            assert f.energy == b.energy == e.energy
+            assert np.array_equal(f.data[:, :columns], e.data[:, :columns])
+            assert np.array_equal(b.data, f.data)
+            assert not f.data[:, columns:].any()
+        assert found.get_frame_numbers(t_start=1000, t_stop=3000).tolist() == [1, 2, 3]
+
+
+def test_round_trip_float32(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_moved_frames(trajectory, 3)
+    binary = str(tmp_path / 'trajectory.bin')
+    assert convert_to_binary(trajectory, TOP_FILE, binary) == 3
+    with MappedTrajectory(trajectory) as expected, BinaryTrajectory(binary) as found:
+        for e, f in zip(expected, found):
+            assert f.data.dtype == np.float32
+            assert np.allclose(f.data, e.data, rtol=1e-6, atol=1e-6)
+
+
+def test_truncated_chunk(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_moved_frames(trajectory, 5)
+    binary = str(tmp_path / 'trajectory.bin')
+    convert_to_binary(trajectory, TOP_FILE, binary, chunk_size=2)
+    # cut in the middle of the last chunk, e.g. while it is written
+    with open(binary, 'rb+') as f:
+        f.truncate(os.path.getsize(binary) - 100)
+    with BinaryTrajectory(binary) as found:
+        assert [f.time for f in found] == [0, 1000, 2000, 3000]
@@ -0,0 +1,73 @@
+import os
+import gc
+import sys
+import gzip
+import lzma
+import numpy as np
+import pytest
+
+from conftest import TOP_FILE
+from test_binary import write_moved_frames
+from pyoxdna.analysis.compressed import INDEX_EXTENSION, BlockIndex, CompressedTrajectory, CompressedTrajectoryWriter, \
+    compress_trajectory, decompress_trajectory
+from pyoxdna.analysis.readers import MappedTrajectory
+
+
+def test_writer_unknown_codec(tmp_path, monkeypatch):
+    unraisable = []
+    monkeypatch.setattr(sys, 'unraisablehook', unraisable.append)
+    with pytest.raises(ValueError):
+        CompressedTrajectoryWriter(str(tmp_path / 'trajectory.dat.gz'), codec='zip')
+    gc.collect()
+    assert unraisable == []
+
+
+@pytest.mark.parametrize('codec, extension', [('gzip', '.gz'), ('xz', '.xz')])
+def test_round_trip(tmp_path, codec, extension):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_moved_frames(trajectory, 7)
+    compressed = str(tmp_path / 'trajectory.dat') + extension
+    text = str(tmp_path / 'trajectory.txt')
+
+    # blocks of 2 to 3 frames
+    frame_size = os.path.getsize(trajectory) // 7
+    assert compress_trajectory(trajectory, compressed, block_size=int(2.5 * frame_size)) == 7
+    with open(trajectory, 'rb') as f:
+        original = f.read()
+    assert decompress_trajectory(compressed, text) == len(original)
+    with open(text, 'rb') as f:
+        assert f.read() == original
+    # the blocks are whole gzip/xz streams, the usual tools read the file
+    with (gzip.open if codec == 'gzip' else lzma.open)(compressed) as f:
+        assert f.read() == original
+
+    with MappedTrajectory(trajectory, TOP_FILE) as expected:
+        for rebuild in (False, True):
+            if rebuild:
+                os.remove(compressed + INDEX_EXTENSION)
+            with CompressedTrajectory(compressed, TOP_FILE) as found:
+                assert found.codec == codec
+                assert len(found.index.block_offsets) > 3
+                assert len(found) == 7
+                # random access, seeking to the blocks of each frame
+                for k in (5, 0, 6, 2, 3):
+                    assert bytes(found.get_raw(k)) == bytes(expected.get_raw(k))
+                    assert np.array_equal(found[k].data, expected[k].data)
+                # frames spanning several blocks
+                assert bytes(found.get_raw(1, 6)) == bytes(expected.get_raw(1, 6))
+                assert [f.time for f in found.iter_frames(t_start=2000, stride=2)] == [2000, 4000, 6000]
+            assert os.path.exists(compressed + INDEX_EXTENSION)
+
+
+def test_index_stale(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_moved_frames(trajectory, 4)
+    compressed = str(tmp_path / 'trajectory.dat.gz')
+    compress_trajectory(trajectory, compressed, block_size=1)
+    # the trajectory is replaced, the .idx of the old one is not used
+    write_moved_frames(trajectory, 2)
+    compress_trajectory(trajectory, str(tmp_path / 'new.dat.gz'))
+    os.replace(str(tmp_path / 'new.dat.gz'), compressed)
+    index = BlockIndex(compressed)
+    assert len(index) == 2
+    assert index.times.tolist() == [0, 1000]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from pyoxdna.analysis.debounce import NONE, WEAK, STRONG, BondDebouncer, get_levels, level_changes
+
+MAKE_CUTOFF = -0.3
+BREAK_CUTOFF = -0.1
+
+
+def run(energies, min_dwell):
+    """ debounces one pair (key 7) with these energies, one frame each at times 0, 1, ...
+        returns the (time, broken, formed) transitions and the bonded state after every frame
+    """
+    debouncer = BondDebouncer(min_dwell)
+    transitions, bonded = [], []
+    prev_keys, prev_levels = np.zeros(0, np.int64), np.zeros(0, np.int8)
+    for time, energy in enumerate(energies):
+        levels = get_levels(np.array([energy]), MAKE_CUTOFF, BREAK_CUTOFF)
+        keys = np.array([7])[levels > NONE]
+        levels = levels[levels > NONE]
+        if time == 0:
+            debouncer.reset(keys, levels)
+        else:
+            t, broken, formed = debouncer.update(time, *level_changes(prev_keys, prev_levels, keys, levels))
+            if t is not None:
+                transitions.append((t, broken.tolist(), formed.tolist()))
+        prev_keys, prev_levels = keys, levels
+        bonded.append(debouncer.get_bonds().tolist() == [7])
+    return transitions, bonded
+
+
+def test_get_levels():
+    levels = get_levels(np.array([-0.5, -0.3, -0.2, -0.1, 0.]), MAKE_CUTOFF, BREAK_CUTOFF)
+    assert levels.tolist() == [STRONG, WEAK, WEAK, NONE, NONE]
+
+
+def test_level_changes():
+    keys, levels = level_changes(np.array([1, 2, 3]), np.array([STRONG, WEAK, WEAK]), np.array([2, 3, 4]), np.array([WEAK, STRONG, WEAK]))
+    assert keys.tolist() == [1, 3, 4]
+    assert levels.tolist() == [NONE, STRONG, WEAK]
+
+
+def test_hysteresis():
+    # bonded pairs stay bonded while WEAK, broken ones only bind when STRONG
+    transitions, bonded = run([-0.5, -0.2, -0.05, -0.2, -0.25, -0.4, -0.2], 1)
+    assert transitions == [(2, [7], []), (5, [], [7])]
+    assert bonded == [True, True, False, False, False, True, True]
+
+
+def test_reset_weak():
+    # a WEAK pair of the first frame is not bonded
+    transitions, bonded = run([-0.2, -0.2, -0.4], 1)
+    assert transitions == [(2, [], [7])]
+    assert bonded == [False, False, True]
+
+
+@pytest.mark.parametrize('min_dwell', [2, 3])
+def test_min_dwell(min_dwell):
+    # runs of min_dwell-1 frames are ignored, a run of min_dwell frames is reported at its first frame
+    energies = [-0.5] + [0.] * (min_dwell - 1) + [-0.5] + [0.] * min_dwell + [-0.5] * (min_dwell - 1) + [0.]
+    transitions, bonded = run(energies, min_dwell)
+    assert transitions == [(min_dwell + 1, [7], [])]
+    assert bonded.index(False) == 2 * min_dwell
+
+
+def test_min_dwell_weak_resets_break():
+    # a WEAK frame holds a bonded pair, the break starts again after it
+    transitions, bonded = run([-0.5, 0., -0.2, 0., 0., -0.5], 2)
+    assert transitions == [(3, [7], [])]
+    assert bonded == [True, True, True, True, False, False]
+
+
+def test_min_dwell_weak_resets_bind():
+    # a broken pair needs min_dwell STRONG frames in a row, WEAK ones don't count
+    transitions, bonded = run([0., -0.5, -0.2, -0.5, -0.5, -0.2], 2)
+    assert transitions == [(3, [], [7])]
+    assert bonded == [False, False, False, False, True, True]
+
+
+def test_min_dwell_one_frame():
+    # with min_dwell 1 every flip is reported
+    energies = [-0.5, 0., -0.5, 0.]
+    transitions, bonded = run(energies, 1)
+    assert [t for t, _, _ in transitions] == [1, 2, 3]
+    assert bonded == [True, False, True, False]
@@ -0,0 +1,182 @@
+import os
+import stat
+import multiprocessing
+import sys
+import subprocess
+import pytest
+
+from conftest import CONF_FILE, TOP_FILE
+from pyoxdna.analysis import analyze_bonds, iter_bond_events, load_topology
+from pyoxdna.analysis.detect_bonds import split_frames
+
+# header of the pair_energy output of oxDNA's DNAnalysis
+HEADER = '#id1 id2 FENE BEXC STCK NEXC HB CRSTCK CXSTCK DH total, t = %d'
+
+# prints the header of every frame of the trajectory and the pair (0, first nucleotide
+# of the second strand) bonded in the frames at the times in BONDED, exits with FAIL_CODE if set
+FAKE_DNANALYSIS = '''#!%s
+import sys
+traj = [a.split('=', 1)[1] for a in sys.argv[2:] if a.startswith('trajectory_file')][0]
+for line in open(traj):
+    if line.startswith('t = '):
+        t = int(float(line.split()[2]))
+        print(%r %% t)
+        print('0 %d 0 0 0 0 %%f 0 0 0 %%f' %% ((-1., -1.) if t in %r else (0., 0.)))
+sys.exit(%d)
+'''
+
+
+# prints the pair (0, first nucleotide of the last strand) of the topology it is given as
+# bonded in every frame, exits with 1 if a frame doesn't have the nucleotides of the topology
+FAKE_DNANALYSIS_TOPOLOGY = '''#!%s
+import sys
+args = dict(a.split('=', 1) for a in sys.argv[2:] if a.startswith(('trajectory_file', 'topology')))
+strands = [int(line.split()[0]) for line in open(args.get('topology', %r)).readlines()[1:]]
+other = strands.index(strands[-1])
+lines = open(args['trajectory_file']).read().split('t = ')[1:]
+for frame in lines:
+    if len(frame.splitlines()) != 3 + len(strands):
+        sys.exit(1)
+    print(%r %% int(frame.split()[0]))
+    print('0 %%d 0 0 0 0 -1 0 0 0 -1' %% other)
+'''
+
+
+def write_trajectory(path, times):
+    with open(CONF_FILE, 'rb') as f:
+        f.readline()
+        rest = f.read()
+    with open(path, 'wb') as f:
+        for t in times:
+            f.write(b't = %d\n' % t + rest)
+
+
+def make_oxDNA_dir(tmp_path, fail_code=0, bonded=(0,)):
+    other = int(load_topology(TOP_FILE).offsets[1])
+    DNAnalysis = tmp_path / 'build' / 'bin' / 'DNAnalysis'
+    DNAnalysis.parent.mkdir(parents=True)
+    DNAnalysis.write_text(FAKE_DNANALYSIS % (sys.executable, HEADER, other, bonded, fail_code))
+    DNAnalysis.chmod(DNAnalysis.stat().st_mode | stat.S_IEXEC)
+    return str(tmp_path)
+
+
+def test_split_frames_oxDNA_headers():
+    lines = [HEADER % 0, '0 5 0 0 0 0 -1 0 0 0 -1', HEADER % 100, HEADER % 200, '1 7 0 0 0 0 -1 0 0 0 -1']
+    assert list(split_frames(lines)) == [['0 5 0 0 0 0 -1 0 0 0 -1'], [], ['1 7 0 0 0 0 -1 0 0 0 -1']]
+
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_DNAnalysis_output(tmp_path, batch):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_trajectory(trajectory, [0, 1000, 2000])
+    oxDNA_dir = make_oxDNA_dir(tmp_path)
+
+    output = analyze_bonds(trajectory, trajectory, TOP_FILE, include_starting_bonds=True, oxDNA_dir=oxDNA_dir, batch=batch, cache_dir=False)
+    assert [(event[0], event[3]) for event in output['bond_events']] == [(0, 'BINDS'), (1000, 'BREAK')]
+    assert output['max_time'] == 2000
+    assert type(output['min_time']) is int and type(output['max_time']) is int
+    assert type(output['time_step']) is float
+
+
+def test_DNAnalysis_failure(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_trajectory(trajectory, [0, 1000])
+    oxDNA_dir = make_oxDNA_dir(tmp_path, fail_code=1)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        analyze_bonds(trajectory, trajectory, TOP_FILE, oxDNA_dir=oxDNA_dir, batch=False, cache_dir=False)
+    with pytest.raises(RuntimeError):
+        analyze_bonds(trajectory, trajectory, TOP_FILE, oxDNA_dir=oxDNA_dir, batch=True, cache_dir=False)
+
+
+def test_checkpoint_partial_last_frame(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_trajectory(trajectory, [0, 1000, 2000, 3000])
+    with open(trajectory, 'rb') as f:
+        full = f.read()
+    oxDNA_dir = make_oxDNA_dir(tmp_path)
+    options = dict(include_starting_bonds=True, oxDNA_dir=oxDNA_dir, cache_dir=False)
+
+    # the simulation stopped in the middle of the nucleotides of the frame at t = 2000
+    last = full.index(b't = 2000')
+    with open(trajectory, 'wb') as f:
+        f.write(full[:last + (len(full) - last) // 4])
+    output = analyze_bonds(trajectory, trajectory, TOP_FILE, checkpoint=True, **options)
+    assert output['max_time'] == 1000
+
+    with open(trajectory, 'wb') as f:
+        f.write(full)
+    resumed = analyze_bonds(trajectory, trajectory, TOP_FILE, checkpoint=True, **options)
+    expected = analyze_bonds(trajectory, trajectory, TOP_FILE, **options)
+    assert resumed['max_time'] == expected['max_time'] == 3000
+    assert resumed['bond_events'] == expected['bond_events']
+
+
+def test_iter_bond_events_min_dwell(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_trajectory(trajectory, [0, 1000, 2000, 3000, 4000])
+    # broken for one frame at t = 1000, and again from the last frame
+    oxDNA_dir = make_oxDNA_dir(tmp_path, bonded=(0, 2000, 3000))
+    options = dict(include_starting_bonds=True, oxDNA_dir=oxDNA_dir)
+
+    events = [e for _, _, frame_events in iter_bond_events(trajectory, trajectory, TOP_FILE, **options) for e in frame_events]
+    assert [(e[0], e[3]) for e in events] == [(0, 'BINDS'), (1000, 'BREAK'), (2000, 'BINDS'), (4000, 'BREAK')]
+
+    events = [e for _, _, frame_events in iter_bond_events(trajectory, trajectory, TOP_FILE, min_dwell=2, **options) for e in frame_events]
+    assert [(e[0], e[3]) for e in events] == [(0, 'BINDS')]
+    assert events == analyze_bonds(trajectory, trajectory, TOP_FILE, min_dwell=2, cache_dir=False, **options)['bond_events']
+
+
+def test_failed_chunk_stops_workers(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_trajectory(trajectory, [0, 1000, 2000, 3000])
+    oxDNA_dir = make_oxDNA_dir(tmp_path, fail_code=1)
+
+    with pytest.raises(RuntimeError):
+        analyze_bonds(trajectory, trajectory, TOP_FILE, oxDNA_dir=oxDNA_dir, processes=2, cache_dir=False)
+    assert multiprocessing.active_children() == []
+
+
+@pytest.mark.parametrize('batch', [True, False])
+def test_DNAnalysis_watch_strands(tmp_path, batch):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    write_trajectory(trajectory, [0, 1000])
+    DNAnalysis = tmp_path / 'build' / 'bin' / 'DNAnalysis'
+    DNAnalysis.parent.mkdir(parents=True)
+    DNAnalysis.write_text(FAKE_DNANALYSIS_TOPOLOGY % (sys.executable, TOP_FILE, HEADER))
+    DNAnalysis.chmod(DNAnalysis.stat().st_mode | stat.S_IEXEC)
+
+    offsets = load_topology(TOP_FILE).offsets
+    watch = [[0, int(offsets[4])]]
+    options = dict(include_starting_bonds=True, oxDNA_dir=str(tmp_path), batch=batch, watch=watch)
+
+    # the whole system, the last strand is the last one of the topology
+    output = analyze_bonds(trajectory, trajectory, TOP_FILE, cache_dir=False, **options)
+    assert [(e[1], e[4]) for e in output['bond_events']] == [(0, int(offsets[-2]))]
+    # only strands 1 and 5, renumbered for DNAnalysis
+    output = analyze_bonds(trajectory, trajectory, TOP_FILE, watch_strands=True, cache_dir=False, **options)
+    assert [(e[1], e[4]) for e in output['bond_events']] == [(0, int(offsets[4]))]
+    events = [e for _, _, frame_events in iter_bond_events(trajectory, trajectory, TOP_FILE, watch_strands=True, **options) for e in frame_events]
+    assert events == output['bond_events']
+
+
+def test_cache_and_checkpoint(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    checkpoint = str(tmp_path / 'bonds.ckpt')
+    cache_dir = str(tmp_path / 'cache')
+    oxDNA_dir = make_oxDNA_dir(tmp_path)
+    options = dict(include_starting_bonds=True, oxDNA_dir=oxDNA_dir, cache_dir=cache_dir, checkpoint=checkpoint)
+
+    write_trajectory(trajectory, [0, 1000])
+    first = analyze_bonds(trajectory, trajectory, TOP_FILE, **options)
+    assert os.path.exists(checkpoint) and os.listdir(cache_dir)
+
+    # the same files, the checkpoint is written again instead of being skipped by the cache
+    os.remove(checkpoint)
+    assert analyze_bonds(trajectory, trajectory, TOP_FILE, **options)['bond_events'] == first['bond_events']
+    assert os.path.exists(checkpoint)
+
+    write_trajectory(trajectory, [0, 1000, 2000, 3000])
+    resumed = analyze_bonds(trajectory, trajectory, TOP_FILE, **options)
+    assert resumed['max_time'] == 3000
+    assert resumed['bond_events'] == analyze_bonds(trajectory, trajectory, TOP_FILE, include_starting_bonds=True, oxDNA_dir=oxDNA_dir, cache_dir=False)['bond_events']
@@ -0,0 +1,24 @@
+import numpy as np
+
+from pyoxdna.analysis.events import BondEventStore
+
+
+def make_store(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    events = [[int(t), int(n1), int(n1) // 10, ['BREAK', 'BINDS'][a], int(n2), int(n2) // 10]
+              for t, n1, a, n2 in zip(np.sort(rng.integers(0, 10**6, n)), rng.integers(0, 200, n), rng.integers(0, 2, n), rng.integers(0, 200, n))]
+    return events, BondEventStore.from_events(events)
+
+
+def test_query_after_save_and_load(tmp_path):
+    events, store = make_store()
+    path = str(tmp_path / 'events.npz')
+    store.save(path)
+    loaded = BondEventStore.load(path)
+
+    expected = [e for e in events if 2 in (e[2], e[5]) and 2*10**5 <= e[0] <= 8*10**5 and e[3] == 'BINDS']
+    for s in (store, loaded):
+        # twice, the second query uses the cached sorted columns
+        for i in range(2):
+            assert s.query(strand=2, t_start=2*10**5, t_stop=8*10**5, action='BINDS').to_events() == expected
+        assert s.query(nucleotides=(50, 60)).to_events() == [e for e in events if 50 <= e[1] <= 60 or 50 <= e[4] <= 60]
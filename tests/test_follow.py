@@ -0,0 +1,67 @@
+import pytest
+
+from conftest import CONF_FILE, TOP_FILE
+from pyoxdna.analysis.follow import TrajectoryFollower
+
+
+def get_frames(n):
+    """ returns the text of n frames of the example conf, at times 0, 1000, ... """
+    with open(CONF_FILE, 'rb') as f:
+        rest = f.read().split(b'\n', 1)[1]
+    return [b't = %d\n' % (1000 * k) + rest for k in range(n)]
+
+
+def append(path, data):
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+@pytest.mark.parametrize('topology', [TOP_FILE, None])
+def test_partial_trailing_frame(tmp_path, topology):
+    path = str(tmp_path / 'trajectory.dat')
+    frames = get_frames(3)
+    # the last frame is cut in the middle of a line
+    cut = len(frames[1]) // 2
+    append(path, frames[0] + frames[1][:cut])
+
+    with TrajectoryFollower(path, topology) as follower:
+        assert [f.time for f in follower.read_frames()] == [0]
+        assert follower.read_frames() == []
+
+        append(path, frames[1][cut:])
+        # complete, but without the topology only the next frame tells
+        assert [f.time for f in follower.read_frames()] == ([1000] if topology else [])
+
+        append(path, frames[2][:10])
+        assert [f.time for f in follower.read_frames()] == ([] if topology else [1000])
+        # a partial frame isn't complete once the writer has stopped either
+        assert follower.read_frames(final=True) == []
+
+        append(path, frames[2][10:])
+        found = follower.read_frames(final=True)
+        assert [f.time for f in found] == [2000]
+        assert bytes(found[0].get_text()) == frames[2].split(b'\n', 3)[3]
+        assert follower.frames == 3
+
+
+def test_truncated(tmp_path):
+    path = str(tmp_path / 'trajectory.dat')
+    frames = get_frames(2)
+    append(path, frames[0] + frames[1])
+    with TrajectoryFollower(path, TOP_FILE) as follower:
+        assert len(follower.read_frames()) == 2
+        # a new run writes to the same file
+        with open(path, 'wb') as f:
+            f.write(frames[0][:100])
+        assert follower.read_frames() == []
+        append(path, frames[0][100:])
+        assert [f.time for f in follower.read_frames()] == [0]
+        assert follower.rotations == 1
+
+
+def test_follow_until_stopped(tmp_path):
+    path = str(tmp_path / 'trajectory.dat')
+    frames = get_frames(2)
+    append(path, frames[0] + frames[1])
+    with TrajectoryFollower(path, poll_interval=0.) as follower:
+        assert [f.time for f in follower.follow(is_running=lambda: False)] == [0, 1000]
@@ -0,0 +1,112 @@
+import os
+import math
+import shutil
+import subprocess
+import numpy as np
+import pytest
+
+from conftest import CONF_FILE, TOP_FILE
+from pyoxdna.analysis import base
+from pyoxdna.analysis.readers import open_trajectory
+from pyoxdna.analysis.topology import load_topology
+from pyoxdna.analysis.hbonds import HBondDetector
+from pyoxdna.analysis.detect_bonds import get_DNAnalysis_args, read_H_bond_energies
+
+
+def f1(r, eps):
+    # DNAInteraction::_f1 with HYDR_F1
+    if r >= base.HYDR_RCHIGH or r <= base.HYDR_RCLOW:
+        return 0.
+    if r > base.HYDR_RHIGH:
+        return eps * base.HYDR_BHIGH * (r - base.HYDR_RCHIGH)**2
+    if r > base.HYDR_RLOW:
+        shift = eps * (1. - math.exp(-(base.HYDR_RC - base.HYDR_R0) * base.HYDR_A))**2
+        return eps * (1. - math.exp(-(r - base.HYDR_R0) * base.HYDR_A))**2 - shift
+    return eps * base.HYDR_BLOW * (r - base.HYDR_RCLOW)**2
+
+
+def f4(cost, theta):
+    # DNAInteraction::_custom_f4 (without the mesh)
+    A, B, T0, TS, TC = (getattr(base, 'HYDR_THETA%d_%s' % (theta, x)) for x in ('A', 'B', 'T0', 'TS', 'TC'))
+    t = abs(math.acos(max(-1., min(1., cost))) - T0)
+    if t >= TC:
+        return 0.
+    if t > TS:
+        return B * (TC - t)**2
+    return 1. - A * t * t
+
+
+def reference_energies(frame, topology, eps=base.HYDR_EPS_OXDNA):
+    """ HB energy of every complementary, non bonded pair, one pair at a time as in
+        DNAInteraction::_hydrogen_bonding
+    """
+    pos_base = frame.cm_pos + base.POS_BASE * frame.a1
+    box = frame.box
+    energies = {}
+    # all the pairs, with minimum images, no cell list
+    for p in range(topology.N):
+        d = pos_base - pos_base[p]
+        d -= box * np.rint(d / box)
+        for q in np.flatnonzero(np.einsum('ij,ij->i', d, d) < base.HYDR_RCHIGH**2).tolist():
+            if q <= p or topology.btype[p] + topology.btype[q] != 3 or q in (topology.n3[p], topology.n5[p]):
+                continue
+            rhydro = d[q]
+            r = math.sqrt(rhydro.dot(rhydro))
+            rdir = rhydro / r
+            a1, a3, b1, b3 = frame.a1[p], frame.a3[p], frame.a1[q], frame.a3[q]
+            energies[p, q] = (f1(r, eps) * f4(-a1.dot(b1), 1) * f4(-b1.dot(rdir), 2) * f4(a1.dot(rdir), 3) *
+                              f4(a3.dot(b3), 4) * f4(-b3.dot(rdir), 7) * f4(a3.dot(rdir), 8))
+    return energies
+
+
+def get_frame():
+    with open_trajectory(CONF_FILE, TOP_FILE) as trajectory:
+        return trajectory[0]
+
+
+def test_native_energies_rect():
+    frame = get_frame()
+    topology = load_topology(TOP_FILE)
+    expected = reference_energies(frame, topology)
+    bonded = sorted(pair for pair, energy in expected.items() if energy < base.H_CUTOFF)
+
+    pairs, energies = HBondDetector(topology).get_H_bond_energies(frame, cutoff=0.)
+    found = dict(zip(map(tuple, pairs.tolist()), energies.tolist()))
+    assert found.keys() == {pair for pair, energy in expected.items() if energy < 0.}
+    for pair, energy in found.items():
+        assert energy == pytest.approx(expected[pair], rel=1e-9, abs=1e-12)
+
+    assert HBondDetector(topology).get_H_bonds(frame) == [list(pair) for pair in bonded]
+    # the example is a fully hybridized tile: one partner per bonded nucleotide
+    assert len(bonded) > 0 and len(np.unique(bonded)) == 2 * len(bonded)
+
+
+def test_native_energies_watched_nucleotides():
+    frame = get_frame()
+    topology = load_topology(TOP_FILE)
+    detector = HBondDetector(topology)
+    bonds = detector.get_H_bonds(frame)
+    watched = np.unique(bonds[::37])
+    assert detector.get_H_bonds(frame, watched) == [b for b in bonds if b[0] in watched or b[1] in watched]
+
+
+DNANALYSIS = os.environ.get('OXDNA_DIR') and os.path.join(os.environ['OXDNA_DIR'], 'build', 'bin', 'DNAnalysis') or shutil.which('DNAnalysis')
+
+
+@pytest.mark.skipif(not DNANALYSIS, reason='DNAnalysis is not installed (set OXDNA_DIR or add it to PATH)')
+def test_native_energies_DNAnalysis(tmp_path):
+    input_file = tmp_path / 'input'
+    input_file.write_text('backend = CPU\ninteraction_type = DNA\nT = 20C\ntopology = %s\nconf_file = %s\n' % (TOP_FILE, CONF_FILE))
+    output = subprocess.run(get_DNAnalysis_args(DNANALYSIS, str(input_file), CONF_FILE), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    lines = output.stdout.decode().splitlines()
+
+    topology = load_topology(TOP_FILE)
+    pairs, energies = read_H_bond_energies(lines, topology.strand_ids, 0.)
+    expected = dict(zip(map(tuple, pairs), energies))
+
+    found_pairs, found_energies = HBondDetector(topology).get_H_bond_energies(get_frame(), cutoff=0.)
+    found = dict(zip(map(tuple, found_pairs.tolist()), found_energies.tolist()))
+    # DNAnalysis prints the energies with 6 significant digits
+    close = {pair for pair in expected.keys() | found.keys() if abs(expected.get(pair, 0.) - found.get(pair, 0.)) < 1e-4}
+    assert close == expected.keys() | found.keys()
+    assert sorted(p for p, e in found.items() if e < base.H_CUTOFF) == sorted(p for p, e in expected.items() if e < base.H_CUTOFF)
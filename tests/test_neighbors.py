@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from pyoxdna.analysis.neighbors import find_pairs, find_pairs_between
+from pyoxdna.analysis.overlaps import OverlapChecker, RC2, find_overlaps, get_sites
+
+
+def brute_force_pairs(positions, others, box, cutoff):
+    """ {(i, j): others[j] - positions[i]} of all the pairs closer than cutoff, minimum image """
+    dr = others[None, :, :] - positions[:, None, :]
+    dr -= box * np.rint(dr / box)
+    i, j = np.nonzero(np.einsum('ijk,ijk->ij', dr, dr) < cutoff * cutoff)
+    return {(a, b): dr[a, b] for a, b in zip(i.tolist(), j.tolist())}
+
+
+# boxes with many cells, with less than 3 cells along a side, and orthorhombic
+@pytest.mark.parametrize('box, cutoff', [((20., 20., 20.), 1.5), ((4., 4., 4.), 1.5), ((30., 3., 8.), 1.2)])
+def test_find_pairs(box, cutoff):
+    rng = np.random.default_rng(1)
+    box = np.array(box)
+    # some points outside of the box, as in oxDNA configurations
+    positions = rng.uniform(-1., 2., (400, 3)) * box
+
+    i, j, dr = find_pairs(positions, box, cutoff)
+    found = {(a, b): d for a, b, d in zip(i.tolist(), j.tolist(), dr)}
+    assert len(found) == len(i) and (i < j).all()
+    expected = {pair: d for pair, d in brute_force_pairs(positions, positions, box, cutoff).items() if pair[0] < pair[1]}
+    assert found.keys() == expected.keys()
+    for pair, d in found.items():
+        assert np.allclose(d, expected[pair])
+
+    others = rng.uniform(0., 1., (50, 3)) * box
+    i, j, dr = find_pairs_between(others, positions, box, cutoff)
+    found = {(a, b): d for a, b, d in zip(i.tolist(), j.tolist(), dr)}
+    expected = brute_force_pairs(others, positions, box, cutoff)
+    assert len(found) == len(i) and found.keys() == expected.keys()
+    for pair, d in found.items():
+        assert np.allclose(d, expected[pair])
+
+
+def brute_force_overlaps(back, base, other_back, other_base, box):
+    """ set of (i, j) nucleotides i of back/base overlapping with nucleotides j of other_back/other_base """
+    sites, other_sites = get_sites(back, base), get_sites(other_back, other_base)
+    dr = other_sites[None, :, :] - sites[:, None, :]
+    dr -= box * np.rint(dr / box)
+    kinds = np.arange(len(sites))[:, None] & 1, np.arange(len(other_sites))[None, :] & 1
+    i, j = np.nonzero(np.einsum('ijk,ijk->ij', dr, dr) < RC2[kinds])
+    return set(zip((i >> 1).tolist(), (j >> 1).tolist()))
+
+
+def random_nucleotides(rng, n, box):
+    back = rng.uniform(0., 1., (n, 3)) * box
+    base = back + rng.normal(0., 0.4, (n, 3))
+    return back, base
+
+
+@pytest.mark.parametrize('box', [(15., 15., 15.), (2., 2., 2.), (12., 3., 6.)])
+def test_overlap_checker(box, monkeypatch):
+    # small blocks, the sites are merged a few times
+    monkeypatch.setattr(OverlapChecker, 'MERGE_SIZE', 16)
+    rng = np.random.default_rng(2)
+    box = np.array(box)
+    checker = OverlapChecker(box)
+    added_back, added_base = np.empty((0, 3)), np.empty((0, 3))
+
+    for n in [1, 30, 5, 60, 12, 40]:
+        back, base = random_nucleotides(rng, n, box)
+        expected = brute_force_overlaps(back, base, added_back, added_base, box)
+        i, j = checker.find_overlaps(back, base)
+        assert set(zip(i.tolist(), j.tolist())) == expected
+        assert checker.is_overlapping(back, base) == bool(expected)
+        assert checker.add_if_free(back, base) == (not expected)
+        if expected:
+            checker.add(back, base)
+        added_back, added_base = np.concatenate((added_back, back)), np.concatenate((added_base, base))
+        assert len(checker) == len(added_back)
+
+
+def test_find_overlaps_groups():
+    rng = np.random.default_rng(3)
+    box = np.array([10., 10., 10.])
+    back, base = random_nucleotides(rng, 200, box)
+    groups = np.arange(200) // 10
+
+    expected = {(a, b) for a, b in brute_force_overlaps(back, base, back, base, box) if a < b and groups[a] != groups[b]}
+    i, j = find_overlaps(back, base, box, groups)
+    assert list(zip(i.tolist(), j.tolist())) == sorted(expected)
@@ -0,0 +1,20 @@
+import os
+import sys
+import subprocess
+
+from conftest import ROOT, TOP_FILE
+from test_detect_bonds import write_trajectory
+
+TRAJ2PDB = os.path.join(ROOT, 'pyoxdna', 'analysis', 'traj2pdb.py')
+
+
+def test_traj2pdb_window(tmp_path):
+    trajectory = str(tmp_path / 'trajectory.dat')
+    output = str(tmp_path / 'trajectory.pdb')
+    write_trajectory(trajectory, [0, 1000, 2000, 3000])
+
+    # run as in the README, from another directory
+    subprocess.run([sys.executable, TRAJ2PDB, '--stride', '2', trajectory, TOP_FILE, output], cwd=str(tmp_path), check=True, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        headers = [line.split()[-1] for line in f if line.lstrip().startswith('HEADER')]
+    assert headers == ['0.0', '2000.0']
@@ -5,7 +5,7 @@ import subprocess
 from math import ceil
 from datetime import datetime
 from pyoxdna.analysis import analyze_bonds
-from utils import JobLauncher, SIM_HOME, EMAIL_ADDRESS
+from utils import JobLauncher, SIM_HOME, EMAIL_ADDRESS, ANALYSIS_CACHE_DIR
 
 """
     This script runs an oxDNA simulation for STEPS steps, stopping when at least one of the
@@ -118,7 +118,7 @@ def analyze_simulation(trajectory_file, top_file):
     """
 
 
-    bond_data = analyze_bonds(ANALYSIS_INPUT, trajectory_file, top_file, include_starting_bonds=True)
+    bond_data = analyze_bonds(ANALYSIS_INPUT, trajectory_file, top_file, include_starting_bonds=True, cache_dir=ANALYSIS_CACHE_DIR)
     bond_events = bond_data['bond_events'] # list of (time, base1, strand1, action, base2, strand2)
 
     target_bond_strings = set([pair_to_string(x) for x in  TARGET_BONDS])
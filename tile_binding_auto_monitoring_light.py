@@ -7,7 +7,7 @@ import json
 import getopt
 import copy
 from shutil import copyfile
-from pyoxdna.analysis import analyze_bonds
+from pyoxdna.analysis import iter_bond_events
 from utils import JobLauncher, SIM_HOME, EMAIL_ADDRESS, PYOXDNA_HOME, OXDNA_HOME
 from pyoxdna.utils import current_time, read_config, write_config
 import subprocess
@@ -18,6 +18,10 @@ import random
 """ this runs and analyzes ONE simulation at a time """
 TESTING = False
 
+# frames a bond must hold (or stay broken) before it counts, a tile touching the
+# target (or letting go) for a single frame does not stop the analysis
+MIN_DWELL = 3
+
 #SIM_STEPS_PER_RUN = 200 if TESTING else 50000
 
 #MAX_TRIES = 100
@@ -61,7 +65,7 @@ ANALYSIS_INPUT = f"{PYOXDNA_HOME}/../analysis.input"
 
 
 #def main(input_conf, input_top, sim_conf, bonds_file, num_steps, num_iterations, out_dir, starting_bonds, target_bonds):
-def main(sim_conf, num_iterations, starting_bonds, target_bonds, output_dir, sim_conf_dict, seed=1, remove_iter_files=True, num_steps=10000):
+def main(sim_conf, num_iterations, starting_bonds, target_bonds, output_dir, sim_conf_dict, seed=1, remove_iter_files=True, num_steps=10000, min_dwell=MIN_DWELL):
     #global SIM_ID
     #global INPUT_CONF
     #global INPUT_TOP
@@ -117,7 +121,7 @@ def main(sim_conf, num_iterations, starting_bonds, target_bonds, output_dir, sim
         print(f'{datetime.now()}: Beginning analysis for iteration {counter} using trajectory file {trajectory_file}')
         #print(f"conf_file: {abs_conf_file}, trajectory_file: {abs_trajectory_file}, topology file: {abs_topology_file}")
         # TODO: can the following use the lastconf file instead of trajectory?
-        tile_still_bound, tile_is_attached = analyze_simulation(sim_conf, abs_trajectory_file, abs_topology_file, starting_bonds, target_bonds, analysis_stats_file, counter)
+        tile_still_bound, tile_is_attached = analyze_simulation(sim_conf, abs_trajectory_file, abs_topology_file, starting_bonds, target_bonds, analysis_stats_file, counter, min_dwell)
 
         counter += 1
 
@@ -151,17 +155,21 @@ def pair_to_string(pair):
     return f"{sorted_pair[0]}:{sorted_pair[1]}"
 
 
-def analyze_simulation(conf_file, trajectory_file, top_file, starting_bonds, target_bonds, analysis_stats_file, iteration):
+def analyze_simulation(conf_file, trajectory_file, top_file, starting_bonds, target_bonds, analysis_stats_file, iteration, min_dwell=MIN_DWELL):
     """ analyze the simulation and return two values: tile_still_bound, tile_is_attached
     
         return tile_still_bound if the tile is bound at the end of the trajectory file
         return tile_is_attached if the tile attaches somewhere in the trajectory file
-    """
 
-    bond_data = analyze_bonds(conf_file, trajectory_file, top_file, include_starting_bonds=True, oxDNA_dir=OXDNA_HOME)
-    bond_events = bond_data['bond_events'] # list of (time, base1, strand1, action, base2, strand2)
+        the analysis stops at the first frame where the tile is attached or has detached,
+        the rest of the trajectory is not analyzed. A bond only binds or breaks once its new
+        state has held for min_dwell frames (see pyoxdna/analysis/debounce.py)
 
-    #print(f'bond_events: {bond_events}')
+        the bonds are detected with DNAnalysis, the native HB term (hbonds.py) is not used
+        here until it has been checked against DNAnalysis on real simulations. DNAnalysis is
+        only run on the strands of the starting and target bonds, the bonds of their
+        nucleotides with other strands are not seen
+    """
 
     target_bond_strings = set([pair_to_string(x) for x in  target_bonds])
     starting_bond_strings = set([pair_to_string(x) for x in  starting_bonds])
@@ -172,19 +180,27 @@ def analyze_simulation(conf_file, trajectory_file, top_file, starting_bonds, tar
     all_bonds = set()
     ending_bonds = set()
 
-    # assumes that timestamps are increasing
-    for event in bond_events:
-        action = event[3]
-        bond = pair_to_string([event[1], event[-2]])
-        
-        if bond not in bonds_to_log:
-            continue
+    # DNAnalysis only gets the strands of the watched nucleotides, its cost doesn't grow with the lattice
+    watch = list(starting_bonds) + list(target_bonds)
+
+    # bond events are (time, base1, strand1, action, base2, strand2), frame by frame
+    for t, _, bond_events in iter_bond_events(conf_file, trajectory_file, top_file, include_starting_bonds=True, oxDNA_dir=OXDNA_HOME, watch=watch, watch_strands=True, min_dwell=min_dwell):
+        for event in bond_events:
+            action = event[3]
+            bond = pair_to_string([event[1], event[-2]])
+            
+            if bond not in bonds_to_log:
+                continue
 
-        if action == "BINDS":
-            all_bonds.add(bond)
-            ending_bonds.add(bond)
-        elif action == "BREAK":
-            ending_bonds.discard(bond)
+            if action == "BINDS":
+                all_bonds.add(bond)
+                ending_bonds.add(bond)
+            elif action == "BREAK":
+                ending_bonds.discard(bond)
+
+        if target_bond_strings <= all_bonds or len(starting_bond_strings.intersection(ending_bonds)) == 0:
+            print(f"Stopping the analysis at t = {t}")
+            break
 
     num_start = len(starting_bonds)
     num_orig = len(starting_bond_strings.intersection(ending_bonds))
@@ -372,6 +388,7 @@ def display_help():
     print("-i <num>, --iterations=<num>\t\t\tMax number of simulation + analysis iterations to run")
     print("-o <out_dir>, --out_dir=<out_dir>\t\tPath to the output directory")
     print("-d <num>, --seed=<num>\t\tSeed to use with oxDNA")
+    print(f"-w <num>, --min_dwell=<num>\t\t[Optional] Number of frames a bond must bind or break for before it counts (default is {MIN_DWELL})")
 #    print("-g <num>, --gpus=<num>\t\t[Optional] Number of GPUs to use (default is 0, and CPU is used)")
 #    print("-p <prefix>, --prefix=<prefix>\t\t[Optional] Prefix to use for names of output files (default is name of config file")
 #    print("-d <nu>, --debug=<num>\t\t[Optional] Set level for output of debug messages, 0 (least) to 5 (most)")
@@ -393,8 +410,8 @@ if __name__ == '__main__':
         # starts at the second element of argv since the first one is the script name
         # extraparams are extra arguments passed after all option/keywords are assigned
         # opts is a list containing the pair "option"/"value"
-        opts, extraparams = getopt.getopt(sys.argv[1:], "hj:c:t:s:b:n:i:o:d:",
-                            ["help", "job_file=", "conf=", "top=", "sim_conf=", "bonds=", "num_steps=", "iterations=", "out_dir=", "seed="])
+        opts, extraparams = getopt.getopt(sys.argv[1:], "hj:c:t:s:b:n:i:o:d:w:",
+                            ["help", "job_file=", "conf=", "top=", "sim_conf=", "bonds=", "num_steps=", "iterations=", "out_dir=", "seed=", "min_dwell="])
         #print 'Opts:',opts
         #print 'Extra parameters:',extraparams
     except:
@@ -416,6 +433,7 @@ if __name__ == '__main__':
     starting_bonds      = None
     target_bonds        = None
     seed                = None
+    min_dwell           = MIN_DWELL
     
     for o,p in opts:
         if o in ['-h', '--help']:
@@ -452,6 +470,13 @@ if __name__ == '__main__':
         elif o in ['-d', '--seed']:
             seed = p
 
+        elif o in ['-w', '--min_dwell']:
+            try:
+                min_dwell = int(p)
+            except:
+                print(f"\nERROR: Invalid value '{p}' entered for the number of frames of a bond (should be an integer)")
+                display_help()
+
 ##    if input_conf is None:
 ##        print(f"\nERROR: Invalid arguments. Must specify an input configuration file.")
 ##        display_help()
@@ -482,5 +507,5 @@ if __name__ == '__main__':
 
     print(f'number of keys in configuration dictionary = {len(sim_conf_dict.keys())}')
 
-    main(sim_conf=sim_conf, num_iterations=num_iterations, starting_bonds=starting_bonds, target_bonds=target_bonds, sim_conf_dict=sim_conf_dict, output_dir=out_dir, seed=seed)
+    main(sim_conf=sim_conf, num_iterations=num_iterations, starting_bonds=starting_bonds, target_bonds=target_bonds, sim_conf_dict=sim_conf_dict, output_dir=out_dir, seed=seed, min_dwell=min_dwell)
     #main(input_conf=input_conf, input_top=input_top, sim_conf=sim_conf, bonds_file=bonds_file, num_steps=num_steps, num_iterations=num_iterations, out_dir=out_dir)
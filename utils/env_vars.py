@@ -37,6 +37,7 @@ OXDNA_HOME = cfg_dict['OXDNA_HOME']
 PYOXDNA_HOME = cfg_dict['PYOXDNA_HOME']
 EMAIL_ADDRESS = cfg_dict['EMAIL_ADDRESS']
 DEBUG_LEVEL = cfg_dict['DEBUG_LEVEL']
+ANALYSIS_CACHE_DIR = cfg_dict.get('ANALYSIS_CACHE_DIR') or None
 
 print(f"Setting environment variables from file '{environment_config}':")
 print('\n'.join(f'{k}: {v}' for k,v in cfg_dict.items()))
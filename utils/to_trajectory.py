@@ -1,23 +1,27 @@
 import os
 import sys
+from pyoxdna.analysis.compressed import open_text, open_output
 
 """ this program converts the output of optimization_binding.py
 into a trajectory file which can be viewed in oxdna-viewer """
 
-def combine_confs(working_dir):
+def combine_confs(working_dir, output='compiled_trajectory.dat'):
+    """ the conf files can be gzip/xz compressed, the output is compressed in blocks
+        (see pyoxdna/analysis/compressed.py) if its name ends with .gz or .xz """
     conf_files = ['start.conf'] + sorted([f for f in os.listdir(working_dir) if '.conf' in f and '_' in f], key=lambda x: int(x.split('_')[0]))
     print(conf_files)
-    with open('compiled_trajectory.dat', 'w+') as f:
+    with open_output(output) as f:
         for conf in conf_files:
-            with open(os.path.join(working_dir, conf), 'r') as c:
+            with open_text(os.path.join(working_dir, conf)) as c:
                 f.write(c.read())
 
 
 if __name__ == '__main__':
-    assert len(sys.argv) == 2, f"""usage: python {sys.argv[0]} conf_dir
+    assert len(sys.argv) in (2, 3), f"""usage: python {sys.argv[0]} conf_dir [output]
 conf_dir is a directory with configuration files to be combined
 the starting conf file is named start.conf and the rest are named <index>_<name>.conf
 non-starting conf files are ordered by index.
+output is compiled_trajectory.dat by default, compressed if it ends with .gz or .xz
 """
     working_dir = sys.argv[1]
-    combine_confs(working_dir)
+    combine_confs(working_dir, *sys.argv[2:])